@@ -1,4 +1,6 @@
 import pathlib
+import subprocess
+from os.path import join
 
 path_file = open("./script/paths.py", 'r').readlines()
 install_path = pathlib.Path(__file__).parent.resolve()
@@ -12,3 +14,18 @@ for i in range(len(path_file)):
 
 with open("./script/paths.py", 'w+') as f:
     f.write("".join(path_file))
+
+# build the optional in-process stride library (script/stride_extension.py), the stride executable is used without it
+try:
+    subprocess.run(['make', 'libstride'], cwd='./script/stride_bin', check=True, stdout=subprocess.DEVNULL)
+except (OSError, subprocess.CalledProcessError):
+    print("Could not build script/stride_bin/libstride.so, stride_linux will be used")
+
+# compile the model files into one memory mapped bundle (script/model_bundle.py), prediction reads the files directly without it
+try:
+    from prediction import TOP_N, QA_NORMALIZATION
+    from script.pipeline import compile_install_bundle
+    compile_install_bundle(TOP_N, QA_NORMALIZATION)
+    print(f"Compiled the model bundle {join(install_path, 'ZoomQA.bundle')}")
+except (ImportError, OSError, ValueError, KeyError, IndexError) as e:
+    print(f"Could not build the model bundle, the model files will be read directly: {e}")
@@ -1,22 +1,43 @@
 import os
-import re
 import sys
-import math
 import pickle
-import subprocess
-from os.path import join, isdir, isfile
+from os.path import join, isdir, isfile, expanduser
 from timeit import default_timer as timer
 
+from script.startup_profile import start_import_profile, print_import_profile
+# the imports are timed from here when prediction.py is run with --startup-profile, not when another script (e.g. install.py) imports it
+if __name__ == "__main__" and '--startup-profile' in sys.argv:
+    start_import_profile()
+
 import numpy as np
-from sklearn.svm import SVR
 
 from script.paths import PATHS
 from script.add_GDT import get_gdt
-from script.generate_formatted_SVR_input import parse_server_data
-
-PYTHON_INSTALL = 'python3'
+from script.generate_formatted_SVR_input import parse_server_data, get_feature_ranks
+from script.pipeline import featurize_target, featurize_targets, get_target_name, get_install_bundle
+from script.disk_cache import DiskCache
+from script.svr_engine import SVREngine, get_svr_engine, load_pickled_model, load_svr_artifact, get_model_fingerprint
 
 TOP_N = 100
+# the SVR predicts 1 / (1 + d^2 / distance_scale) of the distance d, the scores are clipped to score_floor and the distances to
+# max_distance when they are converted back (see un_norm_qa)
+QA_NORMALIZATION = {'distance_scale': 12.0, 'score_floor': 1e-5, 'max_distance': 25.0}
+# the residues of every server of a target are predicted together, this many rows per call
+PREDICTION_CHUNK_SIZE = 65536
+# stride results are cached by model coordinates, None turns the cache off
+STRIDE_CACHE_PATH = join(expanduser('~'), '.cache', 'ZoomQA', 'stride')
+STRIDE_CACHE_SIZE = 256 * 1024 ** 2
+# step 2 features are cached by model coordinates and feature code version, None turns the cache off
+FEATURE_CACHE_PATH = join(expanduser('~'), '.cache', 'ZoomQA', 'features')
+FEATURE_CACHE_SIZE = 2 * 1024 ** 3
+# 'stride' or 'numpy', the secondary structure and solvent accessibility engine (see script/ss_sasa_engine.py)
+SS_ENGINE = 'stride'
+# 'numpy' predicts with the support vectors exported from the pickled SVR (see script/svr_engine.py), 'sklearn' with the SVR itself
+SVR_ENGINE = 'numpy'
+SVR_ENGINE_DTYPE = np.float64
+SVR_ARTIFACT_PATH = join(expanduser('~'), '.cache', 'ZoomQA', 'svr_model.npz')
+# an approximation of the SVR from script/fit_svr_approximation.py for screening, None predicts with the exact SVR (--approximate)
+SVR_APPROXIMATION_PATH = None
 ZOOMQA = '''\
 
 
@@ -31,80 +52,45 @@ ZOOMQA = '''\
 '''
 
 
-def preprocess_input(pathToInput, pathToSave):
+def preprocess_input(pathToInput, pathToSave=None):
     """
     This method is responsible for taking the pdb input files and extract
-    all of the necesary features into the pickle files that can be easily
-    transformed into the correct format for the model input, saves it to a temp
-    directory in the output folder
+    all of the necesary features into the per server feature dictionaries that can be easily
+    transformed into the correct format for the model input. Every step runs in this process
+    and the data stays in memory (see script/pipeline.py)
 
     Parameters:
     ----------------
     pathToInput: string
         This is a string representation to the path to the input data
 
-    pathToSave: string
-        This is a string representation to the path to the save folder, so we can
-        make a temp folder to store the intermediary steps
+    pathToSave: string or None
+        This is a string representation to the path to the save folder, when given the intermediary
+        steps are kept in a tmp folder inside it. None does not write any intermediary files
 
     Return:
     ---------------
-    type: string
-        The return is the path to the final step (step2_generate_casp_fragment_structures)
-        output so that the next step can use it as the input
+    list: [(string, dictionary)]
+        The server names and their input feature dictionaries, the same as load_input_data
 
     """
-    pattern = re.compile(r"T\d{4}[a-zA-Z]*[0-9]*")
-    target_name = re.search(pattern, pathToInput)
-
-    if target_name is not None:
-        target_name = str(target_name[0])
-    else:
-        target_name = 'Target'
-
-    pathToTempDirectory = join(pathToSave, 'tmp')
-    create_folder(pathToTempDirectory)
-    # os.system("chmod +777 " + pathToTempDirectory)
-
-    clean_data_path = join(pathToTempDirectory, 'cleaned_pdbs')
-    pathToStep0 = join(pathToTempDirectory, 'step_0')
-    pathToJSON = join(pathToTempDirectory, 'JSON_Data')
-    pathToZoomQAInputData = join(pathToTempDirectory, 'ZoomQA_Input')
+    pathToTempDirectory = None
+    if pathToSave is not None:
+        pathToTempDirectory = join(pathToSave, 'tmp')
+        create_folder(pathToTempDirectory)
 
     print("Processing input data...")
-    create_folder(clean_data_path)
-    clean_data_program = join(PATHS.sw_install, 'script/re_number_residue_index.pl')
-    clean_data_command = "perl {} {} {}"
-    for pdb in os.listdir(pathToInput):
-        command = clean_data_command.format(clean_data_program, join(pathToInput, pdb), join(clean_data_path, pdb))
-        subprocess.run(command.split(" "))
-    print("Cleaned PDB's")
-
-    # chain_add_command = f'python ./script/step0_prepare_add_chain_to_folder.py ./script/assist_add_chainID_to_one_pdb.pl {pathToInput} {pathToStep0} > {join(pathToTempDirectory, "step0_log.txt")} 2>&1'
-    create_folder(pathToStep0)
-    pathToStep0OUT = join(pathToStep0, target_name)
-    # this was originally step0_prepare_add_chain_to_folder.py
-    step0_location = join(PATHS.sw_install, 'script/step0_prepare_add_chain_to_folder_v2.py')
-    chain_add_location = join(PATHS.sw_install, 'script/assist_add_chainID_to_one_pdb.pl')
-    chain_add_command = f'{PYTHON_INSTALL} {step0_location} {chain_add_location} {clean_data_path} {pathToStep0OUT}'
-    subprocess.run(chain_add_command.split(" "), stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    print('1/3 done...')
-
-    # change it to _linux for linux run, mac for mac run
-    # json_command = f'python ./script/step1_create_json_from_PDB.py ./script/stride_mac {pathToStep0} {pathToJSON} > {join(pathToTempDirectory, "step1_log.txt")} 2>&1'
-    step1_location = join(PATHS.sw_install, 'script/step1_create_json_from_PDB.py')
-    stride_location = join(PATHS.sw_install, 'script/stride_linux')
-    json_command = f'{PYTHON_INSTALL} {step1_location} {stride_location} {pathToStep0} {pathToJSON}'
-    subprocess.run(json_command.split(" "), stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    print('2/3 done...')
-
-    step2_location = join(PATHS.sw_install, 'script/step2_generate_casp_fragment_structures.py')
-    rfpredictions_locations = join(PATHS.sw_install, 'script/assist_generation_scripts/RF_Predictions/')
-    frag_structure_command = f'{PYTHON_INSTALL} {step2_location} {pathToJSON} {rfpredictions_locations} {pathToZoomQAInputData}'
-    subprocess.run(frag_structure_command.split(" "), stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    print('3/3 done...')
-
-    return f'{pathToZoomQAInputData}'
+    # only the features of the TOP_N ranked SVR inputs are computed
+    stride_cache = DiskCache(STRIDE_CACHE_PATH, STRIDE_CACHE_SIZE) if STRIDE_CACHE_PATH is not None else None
+    feature_cache = DiskCache(FEATURE_CACHE_PATH, FEATURE_CACHE_SIZE) if FEATURE_CACHE_PATH is not None else None
+    input_data = featurize_target(pathToInput, pathToTempDirectory, TOP_N, stride_cache=stride_cache, ss_engine=SS_ENGINE,
+                                  feature_cache=feature_cache)
+    print(f"Processed {len(input_data)} models...")
+    if feature_cache is not None:
+        cache_stats = feature_cache.get_stats()
+        print(f"Feature cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    return input_data
 
 
 def load_input_data(pathToData):
@@ -157,12 +143,22 @@ def load_model(pathToModel):
     Return:
     ---------
     SVR model:
-        This is the SVR trained on the top 100 features
+        This is the SVR trained on the top 100 features, the svr_engine.SVREngine of it when SVR_ENGINE is 'numpy' (from the
+        model bundle when install.py compiled one), or the approximation of it when SVR_APPROXIMATION_PATH is set
 
     """
-
-    with open(pathToModel, 'rb') as f:
-        model = pickle.load(f)
+    bundle = get_install_bundle() if pathToModel == PATHS.model_path else None
+
+    if SVR_APPROXIMATION_PATH is not None:
+        model = load_svr_artifact(SVR_APPROXIMATION_PATH, SVR_ENGINE_DTYPE)
+        if model.fingerprint != get_model_fingerprint(pathToModel):
+            print(f"Warning: {SVR_APPROXIMATION_PATH} was not fit to {pathToModel}, fit it again with script/fit_svr_approximation.py")
+    elif SVR_ENGINE == 'numpy' and bundle is not None:
+        model = SVREngine(bundle.get_svr_artifact(), SVR_ENGINE_DTYPE)
+    elif SVR_ENGINE == 'numpy':
+        model = get_svr_engine(pathToModel, SVR_ARTIFACT_PATH, SVR_ENGINE_DTYPE)
+    else:
+        model = load_pickled_model(pathToModel)
 
     print("Model parameters: ")
     print(model)
@@ -191,34 +187,57 @@ def make_predictions(model, input_data):
 
     """
 
-    def _un_norm_qa(score):
-        np.clip(score, 0, 1)
-        # sqrt(((1/norm)-1) * 12)
-        try:
-            return math.sqrt(((1 / np.clip(score, 1e-5, 1)) - 1) * 12)
-        except:
-            print(score)
+    # the compiled top n columns and normalization of the model bundle, the files of the install without one
+    bundle = get_install_bundle()
+    if bundle is not None and bundle.meta['top_n'] >= TOP_N:
+        feature_ranks, normalization = bundle['top_n_index'], bundle.meta['normalization']
+    else:
+        feature_ranks, normalization = get_feature_ranks(), QA_NORMALIZATION
 
-    predictions = {}
+    # one input matrix for all servers, the rows of each server start at its offset
+    server_names, server_inputs = [], []
     for (server_name, whole_target_data) in input_data:
-        server_prediction = []
         # turn data into correct input form
-        server_X, server_y = parse_server_data(whole_target_data, TOP_N)
+        server_X, server_y = parse_server_data(whole_target_data, TOP_N, feature_ranks)
+        server_names.append(server_name)
+        server_inputs.append(server_X)
+    offsets = np.cumsum([0] + [len(server_X) for server_X in server_inputs])
+    target_X = np.concatenate(server_inputs) if server_inputs else np.empty((0, TOP_N))
+
+    # get predictions
+    target_prediction_normalized = np.empty(len(target_X))
+    for start in range(0, len(target_X), PREDICTION_CHUNK_SIZE):
+        target_prediction_normalized[start:start + PREDICTION_CHUNK_SIZE] = model.predict(target_X[start:start + PREDICTION_CHUNK_SIZE])
+    # convert scores to distance
+    target_prediction_distance = un_norm_qa(target_prediction_normalized, normalization)
 
-        # get predictions
-        server_prediction_normalized = model.predict(server_X)
-        # convert scores to distance
-        server_prediction_distance = []
-        for prediction in server_prediction_normalized:
-            server_prediction_distance.append(_un_norm_qa(prediction))
-
-        # add clipping here np.clip
-        server_prediction_distance = np.clip(server_prediction_distance, 0, 25).tolist()
-        predictions[server_name] = server_prediction_distance
+    predictions = {}
+    for server_name, start, end in zip(server_names, offsets[:-1], offsets[1:]):
+        predictions[server_name] = target_prediction_distance[start:end].tolist()
 
     return predictions
 
 
+def un_norm_qa(scores, normalization=QA_NORMALIZATION):
+    """
+    This method converts normalized QA scores back to distances, sqrt(((1/norm)-1) * 12) clipped to 0 to 25 angstroms
+
+    Parameters:
+    --------------
+    scores: np.ndarray
+        The SVR outputs
+
+    normalization: dictionary
+        The constants of the conversion, see QA_NORMALIZATION
+
+    Return:
+    np.ndarray:
+        The distance in angstroms of every score
+    """
+    distances = np.sqrt(((1 / np.clip(scores, normalization['score_floor'], 1)) - 1) * normalization['distance_scale'])
+    return np.clip(distances, 0, normalization['max_distance'])
+
+
 def write_predictions(prediction_data, pathToSave, target_name):
     """
     This method writes out the predictions in CASP format
@@ -285,45 +304,127 @@ def write_predictions(prediction_data, pathToSave, target_name):
         f.write("END\n")
 
 
-def main(pathToInput, pathToSave):
-    start = timer()
+def run_pipeline(pathToInput, pathToSave=None, model=None, keep_intermediate=False):
+    """
+    This method runs the whole prediction for one target in this process, from the pdb files to the predictions
 
-    pathToModel = PATHS.model_path
+    Parameters:
+    --------------
+    pathToInput: string
+        This is the path to the folder with the pdb files of the target
 
-    pattern = re.compile(r"T\d{4}[a-zA-Z]*[0-9]*")
-    target_name = re.search(pattern, pathToInput)
+    pathToSave: string or None
+        When given, the predictions are written to TARGET.txt in this folder
 
-    if target_name is not None:
-        target_name = str(target_name[0])
-    else:
-        target_name = 'Target'
+    model: SVR model or None
+        The pretrained model, None loads the one of the install. Pass it in to predict many targets with one load
 
-    # create save folder
-    create_folder(pathToSave)
+    keep_intermediate: bool
+        If True the intermediary steps are kept in pathToSave/tmp
+
+    Return:
+    ---------
+    dictionary: {string: list[float]}
+        The predicted distance of every residue of every server, see make_predictions
+
+    """
+    target_name = get_target_name(pathToInput)
+
+    if pathToSave is not None:
+        create_folder(pathToSave)
 
     # make the data the proper input format for the model
-    model_input_path = preprocess_input(pathToInput, pathToSave)
+    input_data = preprocess_input(pathToInput, pathToSave if keep_intermediate else None)
     print("Input data created...")
 
-    # load input data
-    # remove when done testing
-    # model_input_path = './TEST_OUT/tmp/ZoomQA_Input/step/T1096/'
-    input_data = load_input_data(model_input_path)
-    print("Input data loaded...")
-
-    # load models
-    model = load_model(pathToModel)
+    if model is None:
+        model = load_model(PATHS.model_path)
 
-    # make predictions
     target_predictions = make_predictions(model, input_data)
 
-    # write predictions
-    write_predictions(target_predictions, pathToSave, target_name)
-    print(f"Prediction saved to {pathToSave}")
-    # remove tmp folder
-    print("Cleaning up...")
-    folder_to_remove = join(pathToSave, 'tmp')
-    os.system(f'rm -rf {folder_to_remove}')
+    if pathToSave is not None:
+        # write_predictions adds the global score to the front of every list
+        write_predictions({server_name: list(server_predictions) for server_name, server_predictions in target_predictions.items()},
+                          pathToSave, target_name)
+        print(f"Prediction saved to {pathToSave}")
+
+    return target_predictions
+
+
+def load_manifest(pathToManifest):
+    '''
+    This method reads a batch manifest, one target folder per line. Empty lines and lines starting with # are skipped,
+    relative folders are relative to the manifest
+    '''
+    pathToInputs = []
+    with open(pathToManifest) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                pathToInputs.append(join(os.path.dirname(os.path.abspath(pathToManifest)), line))
+    return pathToInputs
+
+
+def run_batch(pathToInputs, pathToSave, model=None, max_workers=None):
+    """
+    This method runs the prediction for many targets. The models of all targets are featurized by one pool of worker
+    processes (see script/pipeline.featurize_targets), the SVR, random forest predictions and feature ranks are loaded once,
+    and the predictions of a target are written as soon as its last model is done
+
+    Parameters:
+    --------------
+    pathToInputs: list[string]
+        The folders with the pdb files of the targets, a file in the list is read as a manifest (see load_manifest)
+
+    pathToSave: string
+        The predictions of every target are written to TARGET.txt in this folder
+
+    model: SVR model or None
+        The pretrained model, None loads the one of the install
+
+    max_workers: int or None
+        The number of worker processes, None uses the number of cores
+
+    Return:
+    ---------
+    dictionary: {string: {string: list[float]}}
+        The run_pipeline result of every target by input folder
+
+    """
+    targets = []
+    for pathToInput in pathToInputs:
+        targets += load_manifest(pathToInput) if isfile(pathToInput) else [pathToInput]
+
+    create_folder(pathToSave)
+    if model is None:
+        model = load_model(PATHS.model_path)
+
+    stride_cache = DiskCache(STRIDE_CACHE_PATH, STRIDE_CACHE_SIZE) if STRIDE_CACHE_PATH is not None else None
+    feature_cache = DiskCache(FEATURE_CACHE_PATH, FEATURE_CACHE_SIZE) if FEATURE_CACHE_PATH is not None else None
+
+    print(f"Processing {len(targets)} targets...")
+    batch_predictions = {}
+    for pathToInput, input_data in featurize_targets(targets, TOP_N, stride_cache=stride_cache, ss_engine=SS_ENGINE,
+                                                     feature_cache=feature_cache, max_workers=max_workers):
+        target_name = get_target_name(pathToInput)
+        target_predictions = make_predictions(model, input_data)
+        write_predictions({server_name: list(server_predictions) for server_name, server_predictions in target_predictions.items()},
+                          pathToSave, target_name)
+        print(f"Prediction of {target_name} ({len(input_data)} models) saved to {pathToSave}")
+        batch_predictions[pathToInput] = target_predictions
+
+    if feature_cache is not None:
+        cache_stats = feature_cache.get_stats()
+        print(f"Feature cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    return batch_predictions
+
+
+def main(pathToInput, pathToSave):
+    start = timer()
+
+    run_pipeline(pathToInput, pathToSave)
+
     end = timer()
     total_t = end - start
     print(f"Prediction complete, elapsed time: {total_t}")
@@ -343,14 +444,46 @@ def create_folder(pathToFolder):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print('Not enough arguments... example command: ')
+    # the flags are removed first, the arguments left are the inputs and the save folder
+    startup_profile = '--startup-profile' in sys.argv
+    if startup_profile:
+        sys.argv.remove('--startup-profile')
+
+    bad_flag = None
+    if '--approximate' in sys.argv:
+        flag_index = sys.argv.index('--approximate')
+        flag_value = sys.argv[flag_index + 1] if flag_index + 1 < len(sys.argv) else None
+        if flag_value is None or flag_value.startswith('--'):
+            bad_flag = '--approximate needs the path of an approximation file'
+            del sys.argv[flag_index]
+        elif not isfile(flag_value):
+            bad_flag = f'--approximate {flag_value}: there is no such file'
+            del sys.argv[flag_index:flag_index + 2]
+        else:
+            SVR_APPROXIMATION_PATH = flag_value
+            del sys.argv[flag_index:flag_index + 2]
+
+    if bad_flag is not None or len(sys.argv) < 3:
+        print(bad_flag if bad_flag is not None else 'Not enough arguments... example command: ')
         print(f'python {sys.argv[0]} /path/To/Input/folder/ /path/to/output/save')
+        print('Many targets are run in one batch by giving several input folders, or a manifest file with one folder per line: ')
+        print(f'python {sys.argv[0]} /path/To/Input/T1 /path/To/Input/T2 ... /path/to/output/save')
+        print(f'python {sys.argv[0]} /path/to/manifest.txt /path/to/output/save')
+        print('Add --approximate /path/to/approximation.npz to predict with an approximation of the SVR (script/fit_svr_approximation.py)')
+        print('Add --startup-profile to report the import time of every module')
         sys.exit()
 
     print(ZOOMQA)
     # sys.exit()
-    pathToInput = sys.argv[1]
-    pathToSave = sys.argv[2]
+    pathToInputs = sys.argv[1:-1]
+    pathToSave = sys.argv[-1]
+
+    if len(pathToInputs) == 1 and isdir(pathToInputs[0]):
+        main(pathToInputs[0], pathToSave)
+    else:
+        start = timer()
+        run_batch(pathToInputs, pathToSave)
+        print(f"Batch complete, elapsed time: {timer() - start}")
 
-    main(pathToInput, pathToSave)
+    if startup_profile:
+        print_import_profile()
@@ -0,0 +1,158 @@
+'''
+This file is responsible for building the random forest predictions of RF_Predictions from the trained random forests.
+
+The predictions are the stability of every amino acid and structure class at every whole degree (psi, phi) pair. The trained forests
+are read from a folder of pickles, one per structure class with the class in the file name like the prediction pickles
+(e.g. helix_models.pkl), each a dictionary of amino acid -> sklearn.ensemble.RandomForestRegressor of [[psi, phi]]. One (structure,
+amino acid) forest is a job: a worker process predicts its whole 361x361 grid in one batched predict call and writes it into the shared
+result tensor (see shared_arrays.py). The jobs are queued structure by structure and a worker holds only the pickle of its current
+structure, freeing it when it moves on to the next, so the peak memory is one structure's forests per worker. The tensor is saved as the dense rf_tensor.npy that
+make_random_forest_predictions.read_RF_tensor reads:
+
+    python build_random_forest_predictions.py /path/to/RF_models /path/to/RF_Predictions [--workers 8] [--angle-offset 180]
+
+Run install.py again afterwards to compile the new predictions into the model bundle.
+'''
+
+import os
+import sys
+import pickle
+import argparse
+import numpy as np
+from os.path import join, dirname, abspath
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from timeit import default_timer as timer
+
+sys.path.insert(1, dirname(dirname(abspath(__file__))))
+
+from shared_arrays import SharedArray, attach_array
+from make_random_forest_predictions import RF_STRUCTURES, RF_AMINO_ACIDS, RF_ANGLES, RF_TENSOR_FILE, save_RF_tensor
+
+# the result tensor and the path and forests of the pickle loaded by a worker process, see _init_build_worker
+worker_tensor = None
+worker_model_path = None
+worker_models = None
+
+
+def get_angle_grid(angle_offset=0):
+    '''
+    This method gets the random forest input of every (psi, phi) cell of the prediction grid
+
+    Parameters:
+    ----------
+    angle_offset: int
+        Subtracted from the grid index to get the angle the forests were trained on, 0 for the shifted angles (0 to 360) the
+        predictions are indexed by, 180 for degrees (-180 to 180)
+
+    Returns:
+    --------
+    np.ndarray((361 * 361, 2)):
+        The [psi, phi] rows, psi major like the predictions
+    '''
+    psi, phi = np.meshgrid(np.arange(RF_ANGLES) - angle_offset, np.arange(RF_ANGLES) - angle_offset, indexing='ij')
+    return np.stack([psi.ravel(), phi.ravel()], axis=1).astype(np.float64)
+
+
+def find_model_files(pathToModels):
+    '''
+    This method finds the forest pickle of every structure class
+
+    Returns:
+    --------
+    dictionary:
+        key -> structure class, value -> path of its pickle
+    '''
+    model_files = {}
+    for model_file in sorted(os.listdir(pathToModels)):
+        for structure_name in RF_STRUCTURES:
+            if structure_name in model_file:
+                model_files[structure_name] = join(pathToModels, model_file)
+    missing_structures = [structure_name for structure_name in RF_STRUCTURES if structure_name not in model_files]
+    if missing_structures:
+        raise FileNotFoundError(f"{pathToModels} has no random forests for {missing_structures}")
+    return model_files
+
+
+def _init_build_worker(tensor_handle):
+    global worker_tensor, worker_model_path, worker_models
+    worker_tensor = attach_array(tensor_handle)
+    worker_model_path = None
+    worker_models = None
+
+
+def _build_grid(pathToModel, structure, aa, angle_offset):
+    global worker_model_path, worker_models
+    if pathToModel != worker_model_path:
+        # the forests of the previous structure are freed before the next pickle is loaded
+        worker_model_path, worker_models = None, None
+        with open(pathToModel, 'rb') as f:
+            worker_models = pickle.load(f)
+        worker_model_path = pathToModel
+    model = worker_models[RF_AMINO_ACIDS[aa]]
+    # the pool already uses every core
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = 1
+    worker_tensor[structure, aa] = np.asarray(model.predict(get_angle_grid(angle_offset)), dtype=np.float32).reshape(RF_ANGLES, RF_ANGLES)
+    return structure, aa
+
+
+def build_RF_predictions(pathToModels, pathToPredictions, max_workers=None, angle_offset=0):
+    '''
+    This method predicts the grid of every forest in a process pool and saves the predictions to pathToPredictions/rf_tensor.npy
+
+    Parameters:
+    ----------
+    pathToModels: string
+        The folder of forest pickles, see find_model_files
+
+    pathToPredictions: string
+        The RF_Predictions folder, created if needed
+
+    max_workers: int or None
+        The number of worker processes, None uses the number of cores
+
+    angle_offset: int
+        See get_angle_grid
+
+    Returns:
+    --------
+    np.ndarray((4, 20, 361, 361)): float32
+        The predictions by RF_STRUCTURES, RF_AMINO_ACIDS, psi + 180 and phi + 180
+    '''
+    model_files = find_model_files(pathToModels)
+    jobs = [(model_files[structure_name], structure, aa) for structure, structure_name in enumerate(RF_STRUCTURES)
+            for aa in range(len(RF_AMINO_ACIDS))]
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    shared_tensor = SharedArray((len(RF_STRUCTURES), len(RF_AMINO_ACIDS), RF_ANGLES, RF_ANGLES), np.float32)
+    try:
+        with ProcessPoolExecutor(max(1, min(max_workers, len(jobs))), initializer=_init_build_worker,
+                                 initargs=(shared_tensor.handle,)) as executor:
+            futures = [executor.submit(_build_grid, pathToModel, structure, aa, angle_offset) for pathToModel, structure, aa in jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                structure, aa = future.result()
+                print(f"{done}/{len(jobs)} {RF_STRUCTURES[structure]} {RF_AMINO_ACIDS[aa]}")
+        tensor = np.array(shared_tensor.array)
+    finally:
+        shared_tensor.release()
+
+    os.makedirs(pathToPredictions, exist_ok=True)
+    save_RF_tensor(tensor, pathToPredictions)
+    return tensor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Script to build the random forest predictions of RF_Predictions from the trained forests')
+
+    parser.add_argument('models', help='The folder with one pickle of amino acid -> RandomForestRegressor per structure class')
+    parser.add_argument('predictions', help=f'The RF_Predictions folder the {RF_TENSOR_FILE} is written to')
+    parser.add_argument('--workers', type=int, default=None, help='The number of worker processes, the number of cores by default')
+    parser.add_argument('--angle-offset', type=int, default=0,
+                        help='0 if the forests were trained on the angles shifted to 0 to 360, 180 if they were trained on -180 to 180')
+
+    args = parser.parse_args()
+
+    start = timer()
+    build_RF_predictions(args.models, args.predictions, args.workers, args.angle_offset)
+    print(f"Saved {join(args.predictions, RF_TENSOR_FILE)}, elapsed time: {timer() - start}")
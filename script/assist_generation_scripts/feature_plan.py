@@ -0,0 +1,152 @@
+'''
+This file is responsible for compiling the feature plan, the (feature family, radius) cells of the SVR input that are actually used.
+
+The SVR input for a residue is a 47x51 matrix (see generate_formatted_SVR_input.parse_server_data) that is flattened and reduced to the
+top n features ranked in Pearson_Correlation_Individula_Features.txt. The plan maps each rank back to the feature family and the radius
+it came from, so the fragment structure generation can skip every family and radius the model never looks at.
+'''
+
+import numpy as np
+
+RADII = list(range(5, 56, 1))
+
+# (feature family key, number of rows in the SVR input matrix) in the order parse_server_data stacks them
+FEATURE_FAMILIES = [
+    ('aa_density_change', 20),
+    ('hydro_change', 1),
+    ('mass_change', 1),
+    ('sol_change', 1),
+    ('iso_change', 1),
+    ('average_distance', 1),
+    ('std_dev_distance', 1),
+    ('percent_contact', 1),
+    ('structure_contact_matrix', 20),
+]
+
+
+def load_feature_ranks(pathToFeatureScores):
+    '''
+    This method loads the ordered feature ranks, precomputed and saved
+
+    Parameters:
+    -------------
+    pathToFeatureScores: string
+        This is the path to Pearson_Correlation_Individula_Features.txt
+
+    Returns:
+    -----------
+    list: [string]
+        A list of strings of the feature indexes ranked from best to worst by pearson correlation
+    '''
+    raw_data = open(pathToFeatureScores).read()
+    feature_ranks = []
+    for line in raw_data.split('\n'):
+        line_data = line.split('\t')
+        feature_ranks.append(line_data[0])
+
+    return feature_ranks
+
+
+def get_feature_cell(feature_number):
+    '''
+    This method maps an index of the flattened 47x51 SVR input back to the cell it came from
+
+    Parameters:
+    ----------
+    feature_number: int
+        The index in the flattened SVR input matrix
+
+    Returns:
+    --------
+    tuple: (string, int, int)
+        The feature family key, the row inside the family (the amino acid column for the 20 row families, 0 otherwise) and the
+        radius index (0 is radius 5)
+
+    '''
+    matrix_row, radius_index = divmod(int(feature_number), len(RADII))
+    for family, num_rows in FEATURE_FAMILIES:
+        if matrix_row < num_rows:
+            return family, matrix_row, radius_index
+        matrix_row -= num_rows
+    raise ValueError(f"Feature {feature_number} is outside of the SVR input matrix")
+
+
+def compile_feature_plan(feature_ranks, top_n):
+    '''
+    This method compiles the feature plan for the top n ranked features
+
+    Parameters:
+    ----------
+    feature_ranks: list[string]
+        this is the ranks(ordered best-> worst) of the features from the flattened matrix, see load_feature_ranks
+
+    top_n: int
+        This is the number of top ranked features the model consumes
+
+    Returns:
+    --------
+    dictionary:
+        key -> feature family that has at least one selected cell
+        value -> sorted list of the radii (in angstroms) that family has to be computed for
+
+    '''
+    feature_plan = {}
+    for feature_number in feature_ranks[:top_n]:
+        family, _, radius_index = get_feature_cell(feature_number)
+        feature_plan.setdefault(family, set()).add(RADII[radius_index])
+
+    return {family: sorted(radii) for family, radii in feature_plan.items()}
+
+
+def get_full_feature_plan():
+    '''
+    This method gets the plan that computes every feature at every radius, used when no top n is given (e.g. training data generation)
+
+    Returns:
+    --------
+    dictionary:
+        key -> every feature family
+        value -> every radius in RADII
+
+    '''
+    return {family: list(RADII) for family, _ in FEATURE_FAMILIES}
+
+
+def get_family_shape(family):
+    '''
+    This method gets the shape of a feature family as it is stored for each residue by the fragment structure generation
+
+    Parameters:
+    ----------
+    family: string
+        The feature family key
+
+    Returns:
+    --------
+    tuple:
+        (51, 20) for the families with one column per amino acid, (51,) otherwise
+
+    '''
+    num_rows = dict(FEATURE_FAMILIES)[family]
+    if num_rows > 1:
+        return (len(RADII), num_rows)
+    return (len(RADII),)
+
+
+def get_unplanned_feature(family):
+    '''
+    This method gets the placeholder stored for a family that was skipped by the feature plan. The cells are nan so a plan that does not
+    match the model fails loudly when it reaches the SVR instead of silently scoring zeros
+
+    Parameters:
+    ----------
+    family: string
+        The feature family key
+
+    Returns:
+    --------
+    np.ndarray:
+        An array of nan with the shape of the family (see get_family_shape)
+
+    '''
+    return np.full(get_family_shape(family), np.nan)
@@ -1,6 +1,9 @@
 '''
 Isoelectric point data taken from
 https://www.anaspec.com/html/pK_n_pl_Values_of_AminoAcids.html
+
+The isoelectric point of every structure is solved with the method of Bio.SeqUtils.IsoelectricPoint (Bjellqvist pK values,
+bisection between pH 4.05 and 12), but for every (residue, radius) structure at once from the counts of the ionizable residues.
 '''
 
 import os
@@ -9,106 +12,162 @@ import json
 import numpy as np
 from os.path import join
 
-from Bio.SeqUtils.IsoelectricPoint import IsoelectricPoint as IP
-from Bio.SeqUtils.ProtParam import ProteinAnalysis as PA
+from radius_shell_features import get_radius_sums, get_radius_termini, radius_means_to_dict
 
 AA_LIST = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V','W', 'Y' ]
 
 RADII = RADII = list(range(5, 56, 1))
 
+# pK values used by Bio.SeqUtils.IsoelectricPoint, in the same order it sums the charges
+POSITIVE_PKS = {'Nterm': 7.5, 'K': 10.0, 'R': 12.0, 'H': 5.98}
+NEGATIVE_PKS = {'Cterm': 3.55, 'D': 4.05, 'E': 4.45, 'C': 9.0, 'Y': 10.0}
+PK_CTERMINAL = {'D': 4.55, 'E': 4.75}
+PK_NTERMINAL = {'A': 7.59, 'M': 7.0, 'S': 6.93, 'P': 8.36, 'T': 6.82, 'V': 7.44, 'E': 7.7}
+CHARGED_AAS = ['K', 'R', 'H', 'D', 'E', 'C', 'Y']
+
 
-def get_category(distance):
+def get_charge_at_pH(pH, charged_counts, nterm_pk, cterm_pk):
     '''
-    This method is responsible for finding the distance category a distance falls into
+    This method calculates the charge of many structures at once
 
     Parameters:
-    ----------
-    distance: float
-        This represents the distance in angstroms a target amino acid is away from the current center
+    -----------
+    pH: np.ndarray((N,))
+        The pH to calculate the charge of each structure at
+
+    charged_counts: np.ndarray((N, 7))
+        The number of each ionizable residue (CHARGED_AAS order) in each structure
+
+    nterm_pk, cterm_pk: np.ndarray((N,))
+        The pK of the N-terminus and the C-terminus of each structure
 
     Returns:
     --------
-    int/None
-        This integer represents the radius category that the distance falls into (e.g. a radius of 6.7 would return 7 meaning
-        that the target amino acid is within a radius of 7 angstroms). It will return None if the distance is greater
-        than the threshhold set by RADII
+    np.ndarray((N,)):
+        The net charge of each structure
 
     '''
-    for radius in RADII:
-        if distance <= radius:
-            return radius
-    return None
+    positive_charge = 1.0 / (10 ** (pH - nterm_pk) + 1.0)
+    for aa, pK in POSITIVE_PKS.items():
+        if aa != 'Nterm':
+            positive_charge = positive_charge + charged_counts[:, CHARGED_AAS.index(aa)] / (10 ** (pH - pK) + 1.0)
 
-def zero_local_radius_data():
+    negative_charge = 1.0 / (10 ** (cterm_pk - pH) + 1.0)
+    for aa, pK in NEGATIVE_PKS.items():
+        if aa != 'Cterm':
+            negative_charge = negative_charge + charged_counts[:, CHARGED_AAS.index(aa)] / (10 ** (pK - pH) + 1.0)
+
+    return positive_charge - negative_charge
+
+
+def solve_isoelectric_points(charged_counts, nterm_pk, cterm_pk, pH=7.775, min_=4.05, max_=12):
     '''
-    This method initializes a blank dictionary for the change function to fill
+    This method solves the isoelectric point of many structures at once with the same bisection as Bio.SeqUtils.IsoelectricPoint.pi
+
+    Parameters:
+    -----------
+    charged_counts: np.ndarray((N, 7))
+        The number of each ionizable residue (CHARGED_AAS order) in each structure
+
+    nterm_pk, cterm_pk: np.ndarray((N,))
+        The pK of the N-terminus and the C-terminus of each structure
+
+    pH, min_, max_: float
+        The starting pH and interval of the bisection, the Biopython defaults
 
     Returns:
-    ----------
-    dictionary:
-        This dictionary is nested. The outer dictionary has keys equal to the radius and the innder dictionary has keys of each amino acid and
-        is initialized to a value of 0
+    --------
+    np.ndarray((N,)):
+        The isoelectric point of each structure
 
     '''
-    blank_dict = {}
+    num_structures = len(nterm_pk)
+    pH = np.full(num_structures, pH, dtype=np.float64)
+    min_ = np.full(num_structures, min_, dtype=np.float64)
+    max_ = np.full(num_structures, max_, dtype=np.float64)
 
-    for radius in RADII:
-        blank_dict[radius] = []
+    active = max_ - min_ > 0.0001
+    while np.any(active):
+        charge = get_charge_at_pH(pH[active], charged_counts[active], nterm_pk[active], cterm_pk[active])
+        min_[active] = np.where(charge > 0.0, pH[active], min_[active])
+        max_[active] = np.where(charge > 0.0, max_[active], pH[active])
+        pH[active] = (min_[active] + max_[active]) / 2
+        active = max_ - min_ > 0.0001
 
-    return blank_dict
+    return pH
 
 
-def iso_change_from_json(target_data):
+def get_radius_isoelectric_points(contact_map, sequence, radii=None):
+    '''
+    This method gets the isoelectric point of the structure around every residue as the radius increases
+
+    Parameters:
+    -----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction
+
+    sequence: list[char]
+        The amino acid letter codes of the sequence, the structure is read in sequence order to find its termini
+
+    radii: list[int] or None
+        The radii to solve the isoelectric point for, every other radius is nan. None solves every radius
+
+    Returns:
+    --------
+    np.ndarray((L, 51)):
+        The isoelectric point of the structure with radius RADII[k] around the center (row), nan for empty structures
+
+    '''
+    one_hot_charged = np.asarray([[acid == aa for aa in CHARGED_AAS] for acid in sequence], dtype=np.float64)
+    charged_counts, counts = get_radius_sums(contact_map, one_hot_charged)
+    first_index, last_index = get_radius_termini(contact_map)
+
+    nterm_pks = np.asarray([PK_NTERMINAL.get(acid, POSITIVE_PKS['Nterm']) for acid in sequence])
+    cterm_pks = np.asarray([PK_CTERMINAL.get(acid, NEGATIVE_PKS['Cterm']) for acid in sequence])
+
+    solve = counts > 0
+    if radii is not None:
+        solve[:, [radius - RADII[0] for radius in RADII if radius not in radii]] = False
+
+    isoelectric_points = np.full(counts.shape, np.nan)
+    isoelectric_points[solve] = solve_isoelectric_points(charged_counts[solve], nterm_pks[first_index[solve]],
+                                                         cterm_pks[last_index[solve]])
+
+    return isoelectric_points
+
+
+def iso_change_from_json(target_data, radii=None):
     '''
     This method takes one servers data and extracts the change over radius increase data for the isoelectric point of a fragment as the
-    radius increases.
+    radius increases. The center amino acid is included.
 
     Parameters:
     -----------
     target_data: dictionary
         This dictionary is one server data from Dr. Cao's JSON database
 
+    radii: list[int] or None
+        The radii to solve the isoelectric point for (see feature_plan.compile_feature_plan), every other radius is nan. None solves every radius
+
     Returns:
     --------
     dictionary:
-        This is a dictionary with the keys mapping to each index of the input sequence. The values are a dictionary with keys being the radius in range (5,25)
-        and the values being the isoelectric point of the structure with that radius
+        This is a dictionary with the keys mapping to each index of the input sequence. The values are a dictionary with keys being the radius in range (5,55)
+        and the values being the normalized isoelectric point of the structure with that radius
 
 
     '''
-    cm = target_data['ContactMap']
-    sequence = target_data['aa']
-    pdb_radius_data = {}
-
-    for row in range(len(cm)):
-        cur_acid = sequence[row]
-        local_radius_change = zero_local_radius_data()
-#         print(local_radius_change.keys())
-        for col in range(len(cm[row])):
-            #remove this comment hases below if you do not want to include the center amino acid hydrophobicity
-            # if row == col:
-            #     continue
-            comp_acid = sequence[col]
-
-            radius_category = get_category(cm[row][col])
-#             print(radius_category, col)
-            if radius_category is not None:
-                #TODO: the original was 26
-                for rad_to_add in range(radius_category, 56, 1):
-                    local_radius_change[rad_to_add].append(comp_acid)
-
-        local_radius_iep = zero_local_radius_data()
-        for radius, aa_list in local_radius_change.items():
-            radius_seq = "".join([acid for acid in aa_list])
-            radius_aa_content = PA(radius_seq).count_amino_acids()
-            temp_protein = IP(radius_seq, radius_aa_content)
-#             print(temp_protein.pi())
-            temp_protein_pi = temp_protein.pi()
-            norm_protein_pi = np.clip([(temp_protein_pi - 2.98) / (10.76 - 2.98)], 0.0, 1.0)[0]
-            local_radius_iep[radius] = norm_protein_pi
-
-        pdb_radius_data[row] = local_radius_iep
-    return pdb_radius_data
+    isoelectric_points = get_radius_isoelectric_points(target_data['ContactMap'], target_data['aa'], radii)
+
+    return radius_means_to_dict(normalize_isoelectric_points(isoelectric_points))
+
+
+def normalize_isoelectric_points(isoelectric_points):
+    '''
+    This method scales isoelectric points from get_radius_isoelectric_points to the 0 to 1 range of the SVR input
+    '''
+    return np.clip((isoelectric_points - 2.98) / (10.76 - 2.98), 0.0, 1.0)
+
 
 
 
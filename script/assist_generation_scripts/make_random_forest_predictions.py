@@ -1,30 +1,35 @@
 import os
 import sys
 import copy 
-import json
 import pickle
 import traceback
 import numpy as np
 from os.path import join, isfile, isdir, getsize
 
+# the structure classes and amino acids of the random forest predictions, in the order of the axes of RF_tensor
+RF_STRUCTURES = ['allstruct', 'helix', 'sheet', 'coil']
+RF_AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+RF_AMINO_ACID_INDEX = {aa: index for index, aa in enumerate(RF_AMINO_ACIDS)}
+# every whole degree of psi and phi, shifted by 180 to 0 to 360
+RF_ANGLES = 361
+# the dense predictions in an RF_Predictions folder, read instead of the pickles when it is there (see save_RF_tensor)
+RF_TENSOR_FILE = 'rf_tensor.npy'
 
-from sklearn.ensemble import RandomForestRegressor
-
-allstruct_predictions = {}
-helix_predictions = {}
-sheet_predictions = {}
-coil_predictions = {}
+# the stability prediction of every structure class, amino acid, psi and phi, see load_RF_predictions
+RF_tensor = None
 
 
 def get_prediction(target_psi, target_phi, aa):
-    # TODO: update this documentation 
     '''
-    This model makes a prediction on the input psi, phi data 
+    This method gets the random forest predictions of one residue
 
     Parameters: 
     -----------
-    input_data: tuple(int, int)
-        The input data is a tuple of integers. The first index represents the psi angle, the second index is the phi angle 
+    target_psi: int
+        The psi angle in degrees shifted by 180, 0 to 360
+
+    target_phi: int
+        The phi angle in degrees shifted by 180, 0 to 360
 
     aa: string -> length 1 
         This is the letter code representation of the amino acid we are testing 
@@ -33,81 +38,134 @@ def get_prediction(target_psi, target_phi, aa):
     ---------
     tuple: (allstructure_stability, helix_stability, sheet_stability, coil_stability)
         This tuple is the stability predictions for the allstructure models, helix models, sheet models, and coil models that correspond to the input amino acid
+    '''
+    return tuple(RF_tensor[:, RF_AMINO_ACID_INDEX[aa], target_psi, target_phi].tolist())
 
-    
+
+def get_predictions(psi, phi, sequence):
     '''
-    target_all_struct = allstruct_predictions[aa][target_psi][target_phi]
-    target_helix = helix_predictions[aa][target_psi][target_phi]
-    target_sheet = sheet_predictions[aa][target_psi][target_phi]
-    target_coil = coil_predictions[aa][target_psi][target_phi]
+    This method gets the random forest predictions of every residue of a model at once
 
-    return (target_all_struct, target_helix, target_sheet, target_coil)
+    Parameters:
+    -----------
+    psi: np.ndarray((L,)): int
+        The psi angle of every residue in degrees, -180 to 180
 
+    phi: np.ndarray((L,)): int
+        The phi angle of every residue in degrees, -180 to 180
 
-def load_RF_predictions(pathToPredictions):
-    # TODO: redo the documentation on this
+    sequence: list[char]
+        The amino acid letter codes, KeyError for an amino acid without predictions
+
+    Return:
+    ---------
+    np.ndarray((L, 4)): float32
+        The get_prediction tuple of every residue
     '''
-    This method established the models in the global variable 'models' It is done this way 
-    so that when we multiprocess, we do not have to have 1000+ instances of the models, the exist
-    in the persistent version of this file that gets distributed through the multiprocessing. 
+    aa_index = np.fromiter((RF_AMINO_ACID_INDEX[aa] for aa in sequence), dtype=np.intp, count=len(sequence))
+    # have to add 180 because its in a ramachandran plot
+    psi_index, phi_index = np.asarray(psi) + 180, np.asarray(phi) + 180
+    if len(aa_index) and (psi_index.min() < 0 or phi_index.min() < 0):
+        raise IndexError("The psi and phi angles have to be at least -180 degrees")
+    return RF_tensor[:, aa_index, psi_index, phi_index].T
 
-    Parameters: 
-    ----------
-    pathToModels: string
-        This is the string representation to the models folder 
 
-    Returns: 
-    ---------
-    None
-        This function does not return models, but establishes the global models variable with a structure as follows: 
-
-        models: dictionary
-        keys -> structure ('allstruct', 'helix', 'sheet', 'coil')
-        values -> dictionary
-            key -> amino acid ('A', 'C', ... 'Y')
-            value -> random forest model corresponding to the structure and amino acid of the keys    
-    
+def build_RF_tensor(pathToPredictions):
     '''
-    global allstruct_predictions
-    global helix_predictions
-    global sheet_predictions
-    global coil_predictions
+    This method converts the pickled random forest predictions into one array
+
+    Parameters:
+    ----------
+    pathToPredictions: string
+        The RF_Predictions folder, one pickle per structure class (the file name contains the class) of
+        predictions[aa][psi + 180][phi + 180]
+
+    Returns:
+    --------
+    np.ndarray((4, 20, 361, 361)): float32
+        The predictions by RF_STRUCTURES, RF_AMINO_ACIDS, psi + 180 and phi + 180
+    '''
+    tensor = np.zeros((len(RF_STRUCTURES), len(RF_AMINO_ACIDS), RF_ANGLES, RF_ANGLES), dtype=np.float32)
+    missing_structures = set(RF_STRUCTURES)
     for pred_file in os.listdir(pathToPredictions):
-        if 'allstruct' in pred_file:
-            allstruct_predictions = pickle.load(open(join(pathToPredictions, pred_file), 'rb'))
-        if 'helix' in pred_file:
-            helix_predictions = pickle.load(open(join(pathToPredictions, pred_file), 'rb'))
-        if 'sheet' in pred_file:
-            sheet_predictions = pickle.load(open(join(pathToPredictions, pred_file), 'rb'))
-        if 'coil' in pred_file:
-            coil_predictions = pickle.load(open(join(pathToPredictions, pred_file), 'rb'))
+        for structure, structure_name in enumerate(RF_STRUCTURES):
+            if structure_name not in pred_file:
+                continue
+            predictions = pickle.load(open(join(pathToPredictions, pred_file), 'rb'))
+            for aa, amino_acid in enumerate(RF_AMINO_ACIDS):
+                for psi in range(RF_ANGLES):
+                    psi_predictions = predictions[amino_acid][psi]
+                    tensor[structure, aa, psi] = np.asarray([psi_predictions[phi] for phi in range(RF_ANGLES)],
+                                                            dtype=np.float32).reshape(RF_ANGLES)
+            missing_structures.discard(structure_name)
+    if missing_structures:
+        raise FileNotFoundError(f"{pathToPredictions} has no predictions for {sorted(missing_structures)}")
+    return tensor
+
+
+def read_RF_tensor(pathToPredictions):
+    '''
+    This method reads the predictions of an RF_Predictions folder, its RF_TENSOR_FILE is memory mapped when there is one and the
+    pickles are converted otherwise (see build_RF_tensor)
 
+    Returns:
+    --------
+    np.ndarray((4, 20, 361, 361)): float32
+        The predictions by RF_STRUCTURES, RF_AMINO_ACIDS, psi + 180 and phi + 180
+    '''
+    pathToTensor = join(pathToPredictions, RF_TENSOR_FILE)
+    if not isfile(pathToTensor):
+        return build_RF_tensor(pathToPredictions)
+    tensor = np.load(pathToTensor, mmap_mode='r')
+    if tensor.shape != (len(RF_STRUCTURES), len(RF_AMINO_ACIDS), RF_ANGLES, RF_ANGLES) or tensor.dtype != np.float32:
+        raise ValueError(f"{pathToTensor} is {tensor.dtype} {tensor.shape}, expected float32 "
+                         f"{(len(RF_STRUCTURES), len(RF_AMINO_ACIDS), RF_ANGLES, RF_ANGLES)}")
+    return tensor
 
 
-if __name__ == "__main__":
-    #change the paths
-    load_RF_predictions('/media/kyle/Samsung860Evo/Summer2020/CASP14/Data/Angles/AminoAcid_RF/RF_Predictions')
-    pathToData = '/media/kyle/IronWolf/CASP_ALL/'
+def save_RF_tensor(tensor, pathToPredictions):
+    '''
+    This method saves the dense predictions to RF_TENSOR_FILE in the RF_Predictions folder, written next to it and renamed so a
+    reader never sees a partial file
+    '''
+    tmp_path = join(pathToPredictions, RF_TENSOR_FILE + '.tmp.npy')
+    np.save(tmp_path, np.ascontiguousarray(tensor, dtype=np.float32))
+    os.replace(tmp_path, join(pathToPredictions, RF_TENSOR_FILE))
 
-    target = json.load(open(join(pathToData, sorted(os.listdir(pathToData))[10])))
 
-    print(allstruct_predictions.keys())
-    print(helix_predictions.keys())
-    print(sheet_predictions.keys())
-    print(coil_predictions.keys())
+def set_RF_tensor(tensor):
+    '''
+    This method sets the predictions get_prediction reads, e.g. the memory mapped rf_tensor of the model bundle (see model_bundle.py)
+    '''
+    global RF_tensor
+    RF_tensor = tensor
 
 
-    for server, data in target.items():
-        if '.pdb' not in server: 
-            continue
-        print(server)
-        index = 0
-        psi, phi = int(float(data['Angles']['psi_im1'][index])), int(float(data['Angles']['phi'][index]))
-        print(psi, phi)
-        print(data['ss'][index])
-        print(make_prediction((psi+180), (phi + 180), data['aa'][index]))
+def load_RF_predictions(pathToPredictions):
+    '''
+    This method establishes the predictions in the global variable 'RF_tensor'. It is done this way
+    so that when we multiprocess, we do not have to have 1000+ instances of the predictions, they exist
+    in the persistent version of this file that gets distributed through the multiprocessing. 
 
+    Parameters: 
+    ----------
+    pathToPredictions: string
+        This is the string representation to the RF_Predictions folder, see read_RF_tensor
+
+    Returns: 
+    ---------
+    None
+        This function does not return the predictions, but establishes the global RF_tensor
+    '''
+    set_RF_tensor(read_RF_tensor(pathToPredictions))
 
 
-    
-    
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("This script converts the random forest prediction pickles of an RF_Predictions folder to its dense " + RF_TENSOR_FILE)
+        print(f"python {sys.argv[0]} /path/to/RF_Predictions")
+        sys.exit(0)
+
+    pathToPredictions = sys.argv[1]
+    save_RF_tensor(build_RF_tensor(pathToPredictions), pathToPredictions)
+    print(f"Saved {join(pathToPredictions, RF_TENSOR_FILE)}")
@@ -2,6 +2,8 @@ import os
 import sys
 import numpy as np
 
+from radius_shell_features import get_radius_means, radius_means_to_dict
+
 AA_LIST = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V','W', 'Y' ]
 
 RADII = RADII = list(range(5, 56, 1))
@@ -29,50 +31,29 @@ monoisotopic_mass = {
     'Y' : 163.06333
 }
 
-def get_category(distance):
+
+def get_mass_values(target_data):
     '''
-    This method is responsible for finding the distance category a distance falls into
+    This method gets the normalized mass of every residue in the sequence, the value the radius engine averages
 
     Parameters:
-    ----------
-    distance: float
-        This represents the distance in angstroms a target amino acid is away from the current center
+    -----------
+    target_data: dictionary
+        This dictionary is one server data from Dr. Cao's JSON database
 
     Returns:
     --------
-    int/None
-        This integer represents the radius category that the distance falls into (e.g. a radius of 6.7 would return 7 meaning
-        that the target amino acid is within a radius of 7 angstroms). It will return None if the distance is greater
-        than the threshhold set by RADII
-
-    '''
-    for radius in RADII:
-        if distance <= radius:
-            return radius
-    return None
-
-def zero_local_radius_data():
-    '''
-    This method initializes a blank dictionary for the change function to fill
-
-    Returns:
-    ----------
-    dictionary:
-        This dictionary is nested. The outer dictionary has keys equal to the radius and the innder dictionary has keys of each amino acid and
-        is initialized to a value of 0
+    np.ndarray((L,)):
+        The normalized monoisotopic mass (between 0 and 1) of each residue in the sequence
 
     '''
-    blank_dict = {}
+    return np.asarray([(monoisotopic_mass[acid] - 57.02146)/(186.0793 - 57.02146) for acid in target_data['aa']])
 
-    for radius in RADII:
-        blank_dict[radius] = []
-
-    return blank_dict
 
 def mass_change_from_json(target_data):
     '''
     This method takes one servers data and extracts the change over radius increase data for the average mass of the fragment structure
-    as the radius increases.
+    as the radius increases. The center amino acid mass is included.
 
     Parameters:
     -----------
@@ -82,33 +63,10 @@ def mass_change_from_json(target_data):
     Returns:
     --------
     dictionary:
-        This is a dictionary with the keys mapping to each index of the input sequence. The values are a dictionary with keys being the radius in range (5,25)
+        This is a dictionary with the keys mapping to each index of the input sequence. The values are a dictionary with keys being the radius in range (5,55)
         and the values being the average mass of the structure with that radius
 
 
     '''
-    cm = target_data['ContactMap']
-    sequence = target_data['aa']
-    pdb_radius_data = {}
-
-    for row in range(len(cm)):
-        cur_acid = sequence[row]
-        local_radius_change = zero_local_radius_data()
-        for col in range(len(cm[row])):
-            #remove this comment hases below if you do not want to include the center amino acid mass
-            # if row == col:
-            #     continue
-            comp_acid = sequence[col]
-
-            radius_category = get_category(cm[row][col])
-            if radius_category is not None:
-                norm_mass = norm_mass = (monoisotopic_mass[comp_acid] - 57.02146)/(186.0793 - 57.02146)
-                #TODO: the original stop was 26
-                for rad_to_add in range(radius_category, 56, 1):
-                    local_radius_change[rad_to_add].append(norm_mass)
-
-        local_radius_dist = zero_local_radius_data()
-        for radius, density_list in local_radius_change.items():
-            local_radius_dist[radius] = np.mean(np.asarray(density_list))
-        pdb_radius_data[row] = local_radius_dist
-    return pdb_radius_data
+    radius_means = get_radius_means(target_data['ContactMap'], get_mass_values(target_data))
+    return radius_means_to_dict(radius_means[:, :, 0])
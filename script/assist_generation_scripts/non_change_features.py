@@ -107,7 +107,28 @@ isoelectric_point = {
     'Y' : [2.20, 9.11, 10.07, 5.63]
 }
 
-def get_non_change_features(casp_server_input, index):
+def get_psi_phi(casp_server_input):
+    '''
+    This method gets the psi and phi angles of every residue, truncated to whole degrees
+
+    Parameters: 
+    -----------
+    casp_server_input: dictionary
+        This dictionary is a single server from a single target. The angles are numbers, older JSON files that stored them
+        as strings are converted the same way
+
+    Return: 
+    ----------
+    np.ndarray((L,)): int, np.ndarray((L,)): int
+        The psi and phi angle of every residue in degrees
+    '''
+    angles = casp_server_input['Angles']
+    psi = np.asarray(angles['psi_im1'], dtype=np.float64).astype(np.int64)
+    phi = np.asarray(angles['phi'], dtype=np.float64).astype(np.int64)
+    return psi, phi
+
+
+def get_non_change_features(casp_server_input, index, psi_phi=None):
     '''
     This method is responsible for aquiring the center amino acid physical and chemical information
 
@@ -117,6 +138,8 @@ def get_non_change_features(casp_server_input, index):
         This dictionary is a single server from a single target (one of Dr. Cao's JSON files in the database)
     index: int
         This is the index of the center amino acid we are looking at. 
+    psi_phi: tuple(np.ndarray, np.ndarray) or None
+        The output of get_psi_phi, pass it when calling this for every residue so the angles are converted once
 
     Return: 
     ----------
@@ -131,7 +154,9 @@ def get_non_change_features(casp_server_input, index):
     local_qa = _normalize_lqa(casp_server_input['localQA'][index])
     sequence_aa = casp_server_input['aa'][index]
     local_ss = casp_server_input['ss'][index]
-    local_psi, local_phi = int(float(casp_server_input['Angles']['psi_im1'][index])), int(float(casp_server_input['Angles']['phi'][index]))
+    if psi_phi is None:
+        psi_phi = get_psi_phi(casp_server_input)
+    local_psi, local_phi = int(psi_phi[0][index]), int(psi_phi[1][index])
     local_sol = casp_server_input['sol'][index]
 
     #normalize the mass
@@ -0,0 +1,166 @@
+'''
+This file is responsible for the shared radius shell engine behind the change over radius increase features.
+
+Every distance in the contact map is binned once into the radius shell it first falls into (the same rule as get_category,
+a distance of 6.7 falls into the 7 angstrom shell). The per shell sums and counts are accumulated for every residue at the
+same time and then summed cumulatively over the radius axis, so the value stored at radius r covers every residue within
+r angstroms of the center.
+'''
+
+import numpy as np
+
+RADII = list(range(5, 56, 1))
+
+
+def get_radius_shells(contact_map):
+    '''
+    This method bins every distance of the contact map into its radius shell
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction, the distance in angstroms between every pair of residues
+
+    Returns:
+    --------
+    np.ndarray((L, L)): int
+        The index into RADII of the smallest radius that contains the distance (e.g. a distance of 6.7 returns 2, the index
+        of the 7 angstrom radius). Distances greater than the threshhold set by RADII are -1
+
+    '''
+    distances = np.asarray(contact_map, dtype=np.float64)
+    shells = np.full(distances.shape, -1, dtype=np.int64)
+
+    in_range = distances <= RADII[-1]
+    shells[in_range] = np.maximum(np.ceil(distances[in_range]) - RADII[0], 0).astype(np.int64)
+
+    return shells
+
+
+def get_radius_sums(contact_map, feature_values, exclude_center=False, row_offset=0):
+    '''
+    This method accumulates the per residue feature values of every residue within each radius of every center residue
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction
+
+    feature_values: list or np.ndarray((L,)) or np.ndarray((L, F))
+        This is the value of each feature for each residue in the sequence, F features are accumulated in the same pass
+
+    exclude_center: bool
+        If True the center residue is not counted in its own structure
+
+    row_offset: int
+        The sequence index of the first row when contact_map is a block of rows of the full contact map (see residue_blocks.py)
+
+    Returns:
+    --------
+    np.ndarray((L, 51, F)), np.ndarray((L, 51))
+        The first array holds the sum of each feature over all residues within RADII[k] of the center (row), the second
+        holds the number of residues that were summed
+
+    '''
+    shells = get_radius_shells(contact_map)
+    values = np.asarray(feature_values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+
+    num_rows, num_radii = shells.shape[0], len(RADII)
+    if exclude_center:
+        diagonal = np.arange(min(num_rows, shells.shape[1] - row_offset))
+        shells[diagonal, diagonal + row_offset] = -1
+
+    rows, cols = np.nonzero(shells >= 0)
+    flat_shells = rows * num_radii + shells[rows, cols]
+
+    counts = np.bincount(flat_shells, minlength=num_rows * num_radii).reshape(num_rows, num_radii)
+    sums = np.empty((num_rows, num_radii, values.shape[1]))
+    for feature in range(values.shape[1]):
+        feature_sums = np.bincount(flat_shells, weights=values[cols, feature], minlength=num_rows * num_radii)
+        sums[:, :, feature] = feature_sums.reshape(num_rows, num_radii)
+
+    return np.cumsum(sums, axis=1), np.cumsum(counts, axis=1)
+
+
+def get_radius_means(contact_map, feature_values, exclude_center=False):
+    '''
+    This method gets the average value of each feature of the structure around every residue as the radius increases
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction
+
+    feature_values: list or np.ndarray((L,)) or np.ndarray((L, F))
+        This is the value of each feature for each residue in the sequence
+
+    exclude_center: bool
+        If True the center residue is not counted in its own structure
+
+    Returns:
+    --------
+    np.ndarray((L, 51, F))
+        The average of each feature over the structure with radius RADII[k] around the center (row). A structure with no
+        residues is nan, the same as np.mean of an empty list
+
+    '''
+    sums, counts = get_radius_sums(contact_map, feature_values, exclude_center)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts[:, :, np.newaxis]
+
+
+def radius_means_to_dict(radius_means):
+    '''
+    This method converts one feature of the radius engine output into the dictionary layout used by the 'attribute'_change.py files
+
+    Parameters:
+    ----------
+    radius_means: np.ndarray((L, 51))
+        The average of one feature for every residue (row) and radius (column)
+
+    Returns:
+    --------
+    dictionary:
+        This is a dictionary with the keys mapping to each index of the input sequence. The values are a dictionary with keys being
+        the radius and the values being the average feature value of the structure with that radius
+
+    '''
+    pdb_radius_data = {}
+    for row, row_means in enumerate(radius_means):
+        pdb_radius_data[row] = dict(zip(RADII, row_means))
+    return pdb_radius_data
+
+
+def get_radius_termini(contact_map):
+    '''
+    This method finds the first and the last residue in the sequence that belong to the structure around every residue as the radius increases
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction
+
+    Returns:
+    --------
+    np.ndarray((L, 51)): int, np.ndarray((L, 51)): int
+        The smallest and the largest sequence index within RADII[k] of the center (row). A structure with no residues has a first
+        index of L and a last index of -1
+
+    '''
+    shells = get_radius_shells(contact_map)
+    num_rows, num_radii = shells.shape[0], len(RADII)
+
+    rows, cols = np.nonzero(shells >= 0)
+    flat_shells = rows * num_radii + shells[rows, cols]
+
+    first_index = np.full(num_rows * num_radii, shells.shape[1], dtype=np.int64)
+    last_index = np.full(num_rows * num_radii, -1, dtype=np.int64)
+    np.minimum.at(first_index, flat_shells, cols)
+    np.maximum.at(last_index, flat_shells, cols)
+
+    first_index = np.minimum.accumulate(first_index.reshape(num_rows, num_radii), axis=1)
+    last_index = np.maximum.accumulate(last_index.reshape(num_rows, num_radii), axis=1)
+
+    return first_index, last_index
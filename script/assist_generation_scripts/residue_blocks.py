@@ -0,0 +1,147 @@
+'''
+This file is responsible for splitting the contact map features of one model into blocks of residues.
+
+Every contact map feature of a residue only needs its own row of the contact map (and the per residue values of the whole sequence), so
+the rows are cut into blocks of BLOCK_SIZE residues and the blocks are computed one after the other, or by a pool of worker processes for
+very long models where one model would keep a single core busy for minutes. The workers read the contact map from shared memory instead
+of getting a pickled copy each and write their blocks into shared result arrays in sequence order (see shared_arrays.py), so the result
+is the same as computing the whole contact map at once.
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from shared_arrays import SharedArray, attach_array
+from radius_shell_features import get_radius_means
+from isoelectricpoint_change import get_radius_isoelectric_points
+from structure_contact import get_structure_contact_matrices
+from contact_statistics import get_contact_stats
+
+# the number of residues in a block, and the model length from which the blocks are split between worker processes
+BLOCK_SIZE = 256
+PARALLEL_MIN_LENGTH = 1500
+
+CONTACT_STAT_FAMILIES = ['average_distance', 'std_dev_distance', 'percent_contact']
+
+# the shared contact map, result arrays and inputs of a worker process, see _init_block_worker
+worker_contact_map = None
+worker_features = None
+worker_inputs = None
+
+
+def compute_block_features(contact_rows, row_offset, sequence, shell_values=None, iso_radii=None, structure_radii=None,
+                           contact_stats=False):
+    '''
+    This method computes the contact map features of a block of residues
+
+    Parameters:
+    ----------
+    contact_rows: np.ndarray((B, L))
+        The rows of the contact map of the residues in the block
+
+    row_offset: int
+        The sequence index of the first residue of the block
+
+    sequence: list[char]
+        The amino acid letter codes of the whole sequence
+
+    shell_values: np.ndarray((L, F)) or None
+        The per residue values averaged by the radius shell engine (see radius_shell_features.get_radius_means), None skips them
+
+    iso_radii: list[int] or None
+        The radii of the isoelectric point feature, None skips it
+
+    structure_radii: list[int] or None
+        The radii of the structure contact matrices, None skips them
+
+    contact_stats: bool
+        If True the contact statistics (see contact_statistics.get_contact_stats) are computed
+
+    Returns:
+    --------
+    dictionary:
+        'shell_means' np.ndarray((B, 51, F)), 'iso_points' np.ndarray((B, 51)), 'structure_contact_matrix' np.ndarray((B, 51, 20)) and
+        the CONTACT_STAT_FAMILIES np.ndarray((B, 51)), only the features that were asked for
+    '''
+    features = {}
+    if shell_values is not None:
+        features['shell_means'] = get_radius_means(contact_rows, shell_values)
+    if iso_radii is not None:
+        features['iso_points'] = get_radius_isoelectric_points(contact_rows, sequence, iso_radii)
+    if structure_radii is not None:
+        features['structure_contact_matrix'] = get_structure_contact_matrices(contact_rows, sequence, structure_radii, row_offset)
+    if contact_stats:
+        # the statistics average the distances of the row, in float64 like the JSON contact maps
+        contact_rows = np.asarray(contact_rows, dtype=np.float64)
+        row_stats = [get_contact_stats({'ContactMap': contact_rows, 'aa': sequence}, row) for row in range(len(contact_rows))]
+        for family in CONTACT_STAT_FAMILIES:
+            features[family] = np.asarray([stats[family] for stats in row_stats])
+    return features
+
+
+def _init_block_worker(contact_map_handle, feature_handles, inputs):
+    global worker_contact_map, worker_features, worker_inputs
+    worker_contact_map = attach_array(contact_map_handle)
+    worker_features = {feature: attach_array(handle) for feature, handle in feature_handles.items()}
+    worker_inputs = inputs
+
+
+def _compute_shared_block(start, stop):
+    for feature, values in compute_block_features(worker_contact_map[start:stop], start, **worker_inputs).items():
+        worker_features[feature][start:stop] = values
+
+
+def compute_residue_features(contact_map, sequence, shell_values=None, iso_radii=None, structure_radii=None, contact_stats=False,
+                             max_workers=1):
+    '''
+    This method computes the contact map features of every residue block by block (see compute_block_features for the parameters)
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction, float32 or float64
+
+    max_workers: int or None
+        The number of worker processes for models of at least PARALLEL_MIN_LENGTH residues, None uses the number of cores and 1
+        computes every block in this process
+
+    Returns:
+    --------
+    dictionary:
+        The compute_block_features result of the whole sequence
+    '''
+    # a float32 map (the binary step 1 output) is not copied to float64, the block features convert the rows of one block
+    contact_map = np.asarray(contact_map)
+    if contact_map.dtype != np.float32:
+        contact_map = contact_map.astype(np.float64, copy=False)
+    inputs = {'sequence': sequence, 'shell_values': shell_values, 'iso_radii': iso_radii, 'structure_radii': structure_radii,
+              'contact_stats': contact_stats}
+    num_residues = len(contact_map)
+    blocks = [(start, min(start + BLOCK_SIZE, num_residues)) for start in range(0, num_residues, BLOCK_SIZE)] or [(0, 0)]
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if max_workers <= 1 or num_residues < PARALLEL_MIN_LENGTH:
+        block_features = [compute_block_features(contact_map[start:stop], start, **inputs) for start, stop in blocks]
+        return {feature: np.concatenate([features[feature] for features in block_features]) for feature in block_features[0]}
+
+    # the first block gives the shape of every result, the workers write the other blocks into shared arrays
+    first_block = compute_block_features(contact_map[:blocks[0][1]], 0, **inputs)
+    shared_contact_map = SharedArray(values=contact_map)
+    shared_features = {feature: SharedArray((num_residues,) + values.shape[1:], values.dtype) for feature, values in first_block.items()}
+    try:
+        feature_handles = {feature: shared.handle for feature, shared in shared_features.items()}
+        with ProcessPoolExecutor(min(max_workers, len(blocks) - 1), initializer=_init_block_worker,
+                                 initargs=(shared_contact_map.handle, feature_handles, inputs)) as executor:
+            for _ in executor.map(_compute_shared_block, *zip(*blocks[1:])):
+                pass
+        features = {}
+        for feature, shared in shared_features.items():
+            shared.array[:blocks[0][1]] = first_block[feature]
+            features[feature] = np.array(shared.array)
+        return features
+    finally:
+        shared_contact_map.release()
+        for shared in shared_features.values():
+            shared.release()
@@ -5,136 +5,96 @@ import numpy as np
 
 from os.path import join
 
+from radius_shell_features import get_radius_sums
+
 # THRESHOLD = 10.0 # 10 angstrum threshold, we can change this later
 AA_LIST = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V','W', 'Y' ]
 
 RADII = RADII = list(range(5, 56, 1))
 
-def get_protein_contact_frequeny(casp_input, index):
+def get_structure_contact_matrices(contact_map, sequence, radii=None, row_offset=0):
     '''
-    This method gets a 21x20 matrix representing the weighted frequency of contacts from the center amino acid to other amino acids based on the letter code/
-    Row 0 represents the weighted contact frequency of the center in relation to all the amino acids (['A', 'C'...'Y']the columns) at radius 5. Row 1 is at radius 6 and so on.
+    This method gets the 51x20 weighted contact frequency matrix (see get_protein_contact_frequeny) of every residue at once.
+
+    We consider a fragment being any string of amino acids that are within the radius and are not seperated by any indices not present in
+    the fragment. A contact in the fragment that starts at the center counts once, a contact in any other fragment counts twice. Because the
+    contacts at radius r are a subset of the contacts at radius r+1, the fragment of the center only grows with the radius: a residue after
+    the center is in it as soon as the radius reaches the largest distance between the center and every residue up to it (a running maximum
+    along the row). Every other contact is in some other fragment, so
+
+        occurrence = 2 * (contacts of each amino acid) - (contacts of each amino acid in the center fragment)
+
+    and both terms are cumulative counts from the radius shell engine.
 
     Parameters:
     --------------
-    casp_input: dictionary
-        This dictionary comes from one server prediction for one target (one JSON file) from Dr. Cao's CASP JSON database
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        This is the contact map of one server prediction
 
-    index: int
-        This is the index of the target acid in the sequence
+    sequence: list[char]
+        The amino acid letter codes of the sequence
+
+    radii: list[int] or None
+        The radii to compute (see feature_plan.compile_feature_plan), the rows of every other radius are nan. None computes every radius
 
+    row_offset: int
+        The sequence index of the first row when contact_map is a block of rows of the full contact map (see residue_blocks.py)
 
     Returns:
     ----------
-    np.ndarray((21,20))
-        This method gets a 21x20 matrix representing the weighted frequency of contacts from the center amino acid to other amino acids based on the letter code/
-        Row 0 represents the weighted contact frequency of the center in relation to all the amino acids (['A', 'C'...'Y']the columns) at radius 5. Row 1 is at radius 6 and so on.
+    np.ndarray((L, 51, 20))
+        The weighted contact frequency matrix of each residue in the sequence
 
     '''
-    contacts = _get_contacts(casp_input, index)
-
-    contact_occurence_matrix = np.zeros((51,20)) #radius x amino acids
-    contact_frequency_matrix = np.zeros((51,20)) #radius x amino acids
-    for radius, contact_list in sorted(contacts.items()):
-        fragment_indices = _get_fragment_indices(contact_list, index)
-        # print(fragment_indices)
-        for contact_pair in contact_list:
-            contact_aa = contact_pair[1]
-            contact_sequence_index = contact_pair[2]
-            contact_occurence_index = AA_LIST.index(contact_aa)
-            for fragment in fragment_indices:
-                if contact_sequence_index in fragment:
-                    if index in fragment:
-                        contact_occurence_matrix[radius-5][contact_occurence_index] += 1
-                    else:
-                        contact_occurence_matrix[radius-5][contact_occurence_index] += 2
-
-    for radius_row in range(len(contact_occurence_matrix)):
-        total_row_contacts = np.sum(contact_occurence_matrix[radius_row])
-        for col in range(len(contact_occurence_matrix[radius_row])):
-            if total_row_contacts > 0:
-                contact_frequency_matrix[radius_row][col] = contact_occurence_matrix[radius_row][col] / total_row_contacts
-
-    return contact_frequency_matrix
-
-def _get_fragment_indices(contact_list, center_index):
-    '''
-    This method is reponsible for determing the fragments present within a radius.
+    distances = np.asarray(contact_map, dtype=np.float64)
+    aa_one_hot = np.asarray([[acid == aa for aa in AA_LIST] for acid in sequence], dtype=np.float64)
 
-    We consider a fragment being any string of amino acids that are within the radius and are not seperated by any indices not present in the fragment.
+    contact_counts, _ = get_radius_sums(distances, aa_one_hot, exclude_center=True, row_offset=row_offset)
 
-    Parameters:
-    ---------
-    contact_list: list[(center_aa, contact_aa, contact_index)]
-        This is a list of tuples, the length of however many residues are in contact with the targer aminoa acid at the center index. The tuples are as follows:
-        the center aa letter code, the contact amino acid letter code, and the index in the sequence of the contact amino acid
+    # distance needed for every residue after the center to join the center fragment, nan before the center
+    after_center = np.triu(np.ones(distances.shape, dtype=bool), 1 + row_offset)
+    fragment_distances = np.maximum.accumulate(np.where(after_center, distances, -np.inf), axis=1)
+    fragment_distances[~after_center] = np.nan
+    fragment_counts, _ = get_radius_sums(fragment_distances, aa_one_hot)
 
-    center_index: int
-        This is the index of the target amino acid in the sequence
+    contact_occurence_matrices = 2 * contact_counts - fragment_counts
+    total_contacts = np.sum(contact_occurence_matrices, axis=2, keepdims=True)
+    contact_frequency_matrices = np.divide(contact_occurence_matrices, total_contacts,
+                                           out=np.zeros(contact_occurence_matrices.shape), where=total_contacts > 0)
 
-    Returns:
-    --------
-    list[list]:
-        This method returns a list of lists. Each sub-list represents a fragment within the radius, all values represent residues in the sequence that are in contact
-        with the center
+    if radii is not None:
+        contact_frequency_matrices[:, [radius - 5 for radius in RADII if radius not in radii]] = np.nan
 
+    return contact_frequency_matrices
 
+
+def get_protein_contact_frequeny(casp_input, index, radii=None):
     '''
-    contact_indices = []
-    for pair in contact_list:
-        contact_indices.append(pair[2])
-
-    contact_indices = sorted(contact_indices)
-    fragment_indices = [[center_index]]
-    for i in range(len(contact_indices)):
-        comp_index = contact_indices[i]
-
-        inside_frag = False
-        for frag_ind in range(len(fragment_indices)):
-            if comp_index -1 in fragment_indices[frag_ind]:
-                fragment_indices[frag_ind].append(comp_index)
-                inside_frag = True
-                break
-        #not in the current fragments
-        if not inside_frag:
-            fragment_indices.append([comp_index])
-    return fragment_indices
-
-def _get_contacts(casp_input, row):
-    '''
-    This method compiles a dictionary with every relevant data for the contacts for every radius for a target residue in the sequence
+    This method gets a 21x20 matrix representing the weighted frequency of contacts from the center amino acid to other amino acids based on the letter code/
+    Row 0 represents the weighted contact frequency of the center in relation to all the amino acids (['A', 'C'...'Y']the columns) at radius 5. Row 1 is at radius 6 and so on.
+
+    This computes the matrices of the whole server, use get_structure_contact_matrices once when every residue is needed
 
     Parameters:
-    ------------
-    aa_adjacency_list: list[length of sequence]
-        This is a row of the contact list, index 0 represents the contact distance for the acid we are considering to the residue at index 0. Index 1 is the contact distance between
-        the residue we are considering and residue at index 2
+    --------------
+    casp_input: dictionary
+        This dictionary comes from one server prediction for one target (one JSON file) from Dr. Cao's CASP JSON database
+
+    index: int
+        This is the index of the target acid in the sequence
 
-    row: int
-        This represents the target amino acid index, it also represents the row of the contact map we are looking at
+    radii: list[int] or None
+        The radii to compute (see feature_plan.compile_feature_plan), the rows of every other radius are nan. None computes every radius
 
-    Returns:
-    ---------
-    dictionary:
-        Returns a dictionary with the keys being the radius and the values being a list of tuples. Each tuple is the following, the first index is the center amino acid letter code,
-        the second index is the letter code for the amino acid in contact with the center, and the third value is the index in the sequence the contact resides.
 
+    Returns:
+    ----------
+    np.ndarray((51,20))
+        This method gets a 21x20 matrix representing the weighted frequency of contacts from the center amino acid to other amino acids based on the letter code/
+        Row 0 represents the weighted contact frequency of the center in relation to all the amino acids (['A', 'C'...'Y']the columns) at radius 5. Row 1 is at radius 6 and so on.
 
     '''
-
-    contacts= {}
-    cm = casp_input['ContactMap']
-    sequence = casp_input['aa']
-    center_aa = sequence[row]
-    for radius in RADII:
-        contacts[radius] = []
-        for col in range(len(cm[row])):
-            contact_distance = cm[row][col]
-            contact_aa = sequence[col]
-            if contact_distance <= radius and row != col:
-                contacts[radius].append((center_aa, contact_aa, col))
-
-    return contacts
+    return get_structure_contact_matrices(casp_input['ContactMap'], casp_input['aa'], radii)[index]
 
 if __name__ == "__main__":
     # pathToCASP = '/media/kyle/IronWolf/CASP_ALL/'
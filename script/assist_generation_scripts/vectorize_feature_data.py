@@ -33,6 +33,8 @@ def vectorize_pdb_data(aa_data, hydro_data, mass_data, sol_data, iso_data, seque
     sequence: list[char]
         sequence is a list of chars representing the amino acid sequence of the input PDB
 
+    Any of the feature dictionaries can be None when the feature plan skips that family, its key is then left out of the output
+
 
     Returns: 
     Dictionary: 
@@ -41,21 +43,29 @@ def vectorize_pdb_data(aa_data, hydro_data, mass_data, sol_data, iso_data, seque
         average 'feature' value of the structure at each radius is range (5,25)
     '''
     
-    if len(aa_data) != len(hydro_data) or len(hydro_data) != len(mass_data) or len(mass_data) != len(sol_data):
+    change_data = [data for data in (aa_data, hydro_data, mass_data, sol_data, iso_data) if data is not None]
+    if len(set(len(data) for data in change_data)) > 1:
         print("Incorrect length of input data, cannot vectorize")
         return None
 
+    indices = change_data[0].keys() if change_data else range(len(sequence))
+
     out_dictionary = {}
-    for index in aa_data.keys():
+    for index in indices:
         local_dict = {}
 
         target_acid = sequence[index]
 
-        local_dict["aa_density_change"] = _vectorize_local_aa(aa_data, sequence, index)
-        local_dict['hydro_change'] = _vectorize_local_hydro(hydro_data, sequence, index)
-        local_dict['mass_change'] = _vectorize_local_mass(mass_data, sequence, index)
-        local_dict['sol_change'] = _vectorize_local_sol(sol_data, sequence, index)
-        local_dict['iso_change'] = _vectorize_local_iso(iso_data, sequence, index)
+        if aa_data is not None:
+            local_dict["aa_density_change"] = _vectorize_local_aa(aa_data, sequence, index)
+        if hydro_data is not None:
+            local_dict['hydro_change'] = _vectorize_local_hydro(hydro_data, sequence, index)
+        if mass_data is not None:
+            local_dict['mass_change'] = _vectorize_local_mass(mass_data, sequence, index)
+        if sol_data is not None:
+            local_dict['sol_change'] = _vectorize_local_sol(sol_data, sequence, index)
+        if iso_data is not None:
+            local_dict['iso_change'] = _vectorize_local_iso(iso_data, sequence, index)
 
         out_dictionary[index] = local_dict
 
@@ -0,0 +1,127 @@
+'''
+This file is responsible for the backbone geometry of a whole chain at once, computed from the N, CA and C coordinate arrays.
+
+Every value uses the same definitions as the Bio.PDB calc_angle / calc_dihedral calls it replaces: the angles and dihedrals that
+involve the previous residue (CA_C_N_angle, C_N_CA_angle, peptide_bond, psi_im1, omega, phi) are stored on the current residue,
+and the first residue keeps the PeptideBuilder Geometry defaults.
+'''
+
+import numpy as np
+
+RAD = 180.0 / np.pi
+
+# PeptideBuilder Geometry defaults, used for the first residue of the chain
+FIRST_RESIDUE_GEOMETRY = {
+    'CA_C_N_angle': 116.642992978143,
+    'C_N_CA_angle': 121.382215820277,
+    'CA_N_length': 1.46,
+    'CA_C_length': 1.52,
+    'peptide_bond': 1.33,
+    'psi_im1': 140.0,
+    'omega': 180.0,
+    'phi': -120.0,
+}
+FIRST_RESIDUE_N_CA_C_ANGLE = {
+    'A': 111.068, 'C': 110.8856, 'D': 111.03, 'E': 111.1703, 'F': 110.7528,
+    'G': 110.8914, 'H': 111.0859, 'I': 109.7202, 'K': 111.08, 'L': 110.8652,
+    'M': 110.9416, 'N': 111.5, 'P': 112.7499, 'Q': 111.0849, 'R': 110.98,
+    'S': 111.2812, 'T': 110.7014, 'V': 109.7698, 'W': 110.8914, 'Y': 110.9288,
+}
+
+BACKBONE_KEYS = ['CA_C_N_angle', 'C_N_CA_angle', 'CA_N_length', 'CA_C_length', 'peptide_bond', 'psi_im1', 'omega', 'phi',
+                 'N_CA_C_angle']
+
+
+def _vector_angles(vectors_one, vectors_two):
+    '''
+    This method gets the angle in radians between every pair of row vectors (Bio.PDB Vector.angle)
+    '''
+    norms = np.sqrt(np.sum(vectors_one * vectors_one, axis=-1)) * np.sqrt(np.sum(vectors_two * vectors_two, axis=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = np.sum(vectors_one * vectors_two, axis=-1) / norms
+    return np.arccos(np.clip(cosines, -1, 1))
+
+
+def calc_angles(points_one, points_two, points_three):
+    '''
+    This method gets the angle in radians at points_two of every triplet of points (Bio.PDB calc_angle)
+
+    Parameters:
+    ----------
+    points_one, points_two, points_three: np.ndarray((N, 3))
+        The three connected points of each angle
+
+    Returns:
+    --------
+    np.ndarray((N,)):
+        The angle of each triplet in radians
+    '''
+    return _vector_angles(points_one - points_two, points_three - points_two)
+
+
+def calc_dihedrals(points_one, points_two, points_three, points_four):
+    '''
+    This method gets the dihedral angle in radians, in ]-pi, pi], of every four connected points (Bio.PDB calc_dihedral)
+
+    Parameters:
+    ----------
+    points_one, points_two, points_three, points_four: np.ndarray((N, 3))
+        The four connected points of each dihedral
+
+    Returns:
+    --------
+    np.ndarray((N,)):
+        The dihedral angle of each set of points in radians
+    '''
+    ab = points_one - points_two
+    cb = points_three - points_two
+    db = points_four - points_three
+    u = np.cross(ab, cb)
+    v = np.cross(db, cb)
+    w = np.cross(u, v)
+    angles = _vector_angles(u, v)
+    # the sign comes from the direction of u x v along the central bond
+    return np.where(_vector_angles(cb, w) > 0.001, -angles, angles)
+
+
+def calc_backbone_geometry(n_coords, ca_coords, c_coords, sequence):
+    '''
+    This method gets the backbone bond lengths, bond angles and torsion angles of a whole chain
+
+    Parameters:
+    ----------
+    n_coords, ca_coords, c_coords: np.ndarray((L, 3))
+        The N, CA and C coordinates of every residue of the chain, in order
+
+    sequence: list[char]
+        The one letter code of every residue, used for the PeptideBuilder defaults of the first residue
+
+    Returns:
+    --------
+    dictionary:
+        key -> one of BACKBONE_KEYS
+        value -> np.ndarray((L,)): float64 lengths in angstroms and angles in degrees
+    '''
+    n_coords, ca_coords, c_coords = [np.asarray(coords, dtype=np.float64) for coords in (n_coords, ca_coords, c_coords)]
+    geometry = {key: np.empty(len(sequence)) for key in BACKBONE_KEYS}
+    if len(sequence) == 0:
+        return geometry
+
+    n_prev, ca_prev, c_prev = n_coords[:-1], ca_coords[:-1], c_coords[:-1]
+    n, ca, c = n_coords[1:], ca_coords[1:], c_coords[1:]
+
+    geometry['CA_C_N_angle'][1:] = calc_angles(ca_prev, c_prev, n) * RAD
+    geometry['C_N_CA_angle'][1:] = calc_angles(c_prev, n, ca) * RAD
+    geometry['CA_N_length'][1:] = np.linalg.norm(ca - n, axis=1)
+    geometry['CA_C_length'][1:] = np.linalg.norm(ca - c, axis=1)
+    geometry['peptide_bond'][1:] = np.linalg.norm(n - c_prev, axis=1)
+    geometry['psi_im1'][1:] = calc_dihedrals(n_prev, ca_prev, c_prev, n) * RAD
+    geometry['omega'][1:] = calc_dihedrals(ca_prev, c_prev, n, ca) * RAD
+    geometry['phi'][1:] = calc_dihedrals(c_prev, n, ca, c) * RAD
+    geometry['N_CA_C_angle'][1:] = calc_angles(n, ca, c) * RAD
+
+    for key, value in FIRST_RESIDUE_GEOMETRY.items():
+        geometry[key][0] = value
+    geometry['N_CA_C_angle'][0] = FIRST_RESIDUE_N_CA_C_ANGLE[sequence[0]]
+
+    return geometry
@@ -0,0 +1,208 @@
+'''
+This file is responsible for the binary step 1 output that replaces the per target JSON files.
+
+Every target is a directory and every server model inside it is a directory of .npy arrays that step 2 opens with memory mapping:
+
+    step0_T1096/
+        server01_TS1/
+            ContactMap.npy   condensed upper triangle of the CA distance matrix, float32 (the distances are float32 precise)
+            aa.npy, ss.npy   one letter codes, <U1
+            sol.npy          solvent accessible area, float64
+            localQA.npy      float64
+            Angles.npy       (len(angle_keys), L) float64, rows in the order of meta.json 'angle_keys'
+            meta.json        'name' (the TARGET:MODEL key of the JSON files), 'GDT', 'angle_keys', 'version'
+
+Run this file directly to convert a folder of existing step 1 JSON files.
+'''
+
+import os
+import sys
+import json
+import numpy as np
+from os.path import join, isdir
+
+FORMAT_VERSION = 1
+# the rows of the contact map filled at a time, see expand_contact_map
+EXPAND_BLOCK_ROWS = 256
+
+
+def condense_contact_map(contact_map):
+    '''
+    This method keeps the upper triangle (without the diagonal) of a symmetric contact map
+
+    Parameters:
+    ----------
+    contact_map: list[list[float]] or np.ndarray((L, L))
+        The CA distance matrix of one model
+
+    Returns:
+    --------
+    np.ndarray((L * (L - 1) / 2,)): float32
+        The distances above the diagonal, row by row
+    '''
+    contact_map = np.asarray(contact_map)
+    return contact_map[np.triu_indices(len(contact_map), 1)].astype(np.float32)
+
+
+def expand_contact_map(condensed_map, dtype=np.float32):
+    '''
+    This method rebuilds the full symmetric contact map from its condensed upper triangle, the diagonal is 0
+
+    The map is filled EXPAND_BLOCK_ROWS rows at a time: the rows of the block are copied from the triangle, then the part of the block
+    below the diagonal is copied from the rows above it. The triangle is read once front to back, so a memory mapped triangle is not
+    held in memory next to the map
+
+    Parameters:
+    ----------
+    condensed_map: np.ndarray((L * (L - 1) / 2,))
+        The output of condense_contact_map
+
+    dtype: numpy dtype
+        The dtype of the full contact map, the float32 distances are exact in float32
+
+    Returns:
+    --------
+    np.ndarray((L, L))
+        The full contact map
+    '''
+    num_residues = int(round((1 + np.sqrt(1 + 8 * len(condensed_map))) / 2))
+    contact_map = np.zeros((num_residues, num_residues), dtype=dtype)
+    start = 0
+    for block_start in range(0, num_residues, EXPAND_BLOCK_ROWS):
+        block_stop = min(block_start + EXPAND_BLOCK_ROWS, num_residues)
+        for row in range(block_start, block_stop):
+            stop = start + num_residues - row - 1
+            contact_map[row, row + 1:] = condensed_map[start:stop]
+            start = stop
+        contact_map[block_start:block_stop, :block_start] = contact_map[:block_start, block_start:block_stop].T
+        diagonal_block = contact_map[block_start:block_stop, block_start:block_stop]
+        diagonal_block += diagonal_block.T.copy()
+    return contact_map
+
+
+def save_model_data(model_dir, model_name, model_data):
+    '''
+    This method saves one model in the binary format
+
+    Parameters:
+    ----------
+    model_dir: string
+        The directory to save the model to, created if needed
+
+    model_name: string
+        The TARGET:MODEL key the model has in the JSON files
+
+    model_data: dictionary
+        The step 1 data of the model, the same keys as one model of the JSON files
+    '''
+    os.makedirs(model_dir, exist_ok=True)
+    angle_keys = list(model_data['Angles'].keys())
+
+    np.save(join(model_dir, 'ContactMap.npy'), condense_contact_map(model_data['ContactMap']))
+    np.save(join(model_dir, 'aa.npy'), np.asarray(model_data['aa'], dtype='<U1'))
+    np.save(join(model_dir, 'ss.npy'), np.asarray(model_data['ss'], dtype='<U1'))
+    np.save(join(model_dir, 'sol.npy'), np.asarray(model_data['sol'], dtype=np.float64))
+    np.save(join(model_dir, 'localQA.npy'), np.asarray(model_data['localQA'], dtype=np.float64))
+    np.save(join(model_dir, 'Angles.npy'),
+            np.asarray([model_data['Angles'][key] for key in angle_keys], dtype=np.float64).reshape(len(angle_keys), -1))
+
+    meta = {'name': model_name, 'GDT': model_data['GDT'], 'angle_keys': angle_keys, 'version': FORMAT_VERSION}
+    with open(join(model_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_model_data(model_dir, mmap_mode='r'):
+    '''
+    This method opens one model saved by save_model_data
+
+    Parameters:
+    ----------
+    model_dir: string
+        The directory of the model
+
+    mmap_mode: string or None
+        The np.load memory map mode of the arrays, None reads them into memory
+
+    Returns:
+    --------
+    string, dictionary:
+        The TARGET:MODEL key of the model and its data with the same keys as the JSON files. 'ContactMap' is the full (L, L)
+        float32 matrix, the other values are arrays
+    '''
+    with open(join(model_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    angles = np.load(join(model_dir, 'Angles.npy'), mmap_mode=mmap_mode)
+    model_data = {
+        'GDT': meta['GDT'],
+        'localQA': np.load(join(model_dir, 'localQA.npy'), mmap_mode=mmap_mode),
+        'ss': np.load(join(model_dir, 'ss.npy')).tolist(),
+        'aa': np.load(join(model_dir, 'aa.npy')).tolist(),
+        'sol': np.load(join(model_dir, 'sol.npy'), mmap_mode=mmap_mode),
+        'ContactMap': expand_contact_map(np.load(join(model_dir, 'ContactMap.npy'), mmap_mode=mmap_mode)),
+        'Angles': {key: angles[row] for row, key in enumerate(meta['angle_keys'])},
+    }
+    return meta['name'], model_data
+
+
+def is_binary_target(target_path):
+    '''
+    This method checks if a step 1 output is a binary target directory (instead of a JSON file)
+    '''
+    return isdir(target_path)
+
+
+def iter_target_data(target_dir, mmap_mode='r'):
+    '''
+    This method opens the models of a binary target directory one at a time, a model is only read (and its contact map expanded) when
+    it is reached, so a whole target is never held in memory at once
+
+    Parameters:
+    ----------
+    target_dir: string
+        The target directory written by step 1 or convert_json_target
+
+    mmap_mode: string or None
+        The np.load memory map mode of the arrays
+
+    Returns:
+    --------
+    generator[(string, dictionary)]:
+        The TARGET:MODEL key and the data of every model, see load_model_data
+    '''
+    for model_dir in sorted(os.listdir(target_dir)):
+        yield load_model_data(join(target_dir, model_dir), mmap_mode)
+
+
+def convert_json_target(json_path, target_dir):
+    '''
+    This method converts one step 1 JSON file into a binary target directory
+
+    Parameters:
+    ----------
+    json_path: string
+        Path to the JSON file
+
+    target_dir: string
+        The target directory to create
+    '''
+    json_data = json.load(open(json_path))
+    for model_name, model_data in json_data.items():
+        save_model_data(join(target_dir, model_name.split(':')[-1]), model_name, model_data)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("This script converts a folder of step 1 JSON files to the binary format, one target directory per JSON file")
+        print(f"python {sys.argv[0]} /path/to/JSON_Data /path/to/Binary_Data")
+        sys.exit(0)
+
+    pathToJSON = sys.argv[1]
+    pathToSave = sys.argv[2]
+    os.makedirs(pathToSave, exist_ok=True)
+
+    for json_file in sorted(os.listdir(pathToJSON)):
+        if not json_file.endswith('.json'):
+            continue
+        print(f"Converting {json_file}")
+        convert_json_target(join(pathToJSON, json_file), join(pathToSave, json_file[:-len('.json')]))
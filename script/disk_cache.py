@@ -0,0 +1,125 @@
+'''
+This file is responsible for the content addressed disk caches (e.g. the stride results), one pickle file per key in a folder.
+
+The cache is kept under a size limit by removing the least recently used entries. A hit updates the modification time of its file,
+so the modification times are the LRU order and the order survives across runs and processes. Entries are written to a temporary file
+and renamed, so processes sharing a folder never read a partial entry.
+
+A cache object scans the folder (one stat per entry) on its first put, then adds the size of every entry it writes to the size it
+found, and only scans again when that size is over the limit or after RESCAN_PUTS puts, which counts the entries of other processes.
+An eviction frees 1 - EVICT_FRACTION of the limit, so a full cache of N entries is scanned about once every (1 - EVICT_FRACTION) N
+puts instead of on every put.
+'''
+
+import os
+import pickle
+import tempfile
+from os.path import join, getsize, getmtime
+
+# the puts after which the folder is scanned again even under the size limit
+RESCAN_PUTS = 256
+# an eviction removes entries down to this fraction of the size limit, so a full cache is not scanned again on its next put
+EVICT_FRACTION = 0.9
+
+
+class DiskCache:
+    def __init__(self, cache_path, max_size=512 * 1024 ** 2):
+        '''
+        Parameters:
+        ----------
+        cache_path: string
+            The cache folder, created if needed
+
+        max_size: int
+            The size limit of the cache folder in bytes, the least recently used entries are removed above it
+        '''
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # the size of the folder counted by the last scan plus the entries written since, None before the first scan
+        self.cache_size = None
+        self.puts_since_scan = 0
+        os.makedirs(cache_path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return join(self.cache_path, f'{key}.pkl')
+
+    def get(self, key):
+        '''
+        This method loads the entry of a key, None on a miss
+        '''
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(entry_path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        This method stores the entry of a key and removes the least recently used entries if the cache is over its size limit
+        '''
+        entry_path = self._entry_path(key)
+        tmp_file, tmp_path = tempfile.mkstemp(dir=self.cache_path, suffix='.tmp')
+        with os.fdopen(tmp_file, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        entry_size = getsize(tmp_path)
+        try:
+            replaced_size = getsize(entry_path)
+        except OSError:
+            replaced_size = 0
+        os.replace(tmp_path, entry_path)
+
+        self.puts_since_scan += 1
+        if self.cache_size is None or self.puts_since_scan >= RESCAN_PUTS:
+            self.evict()
+            return
+        self.cache_size += entry_size - replaced_size
+        if self.cache_size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''
+        This method scans the folder and, if the cache is over its size limit, removes the least recently used entries until it is under
+        EVICT_FRACTION of the limit
+        '''
+        entries = []
+        for entry in os.listdir(self.cache_path):
+            if not entry.endswith('.pkl'):
+                continue
+            entry_path = join(self.cache_path, entry)
+            try:
+                entries.append((getmtime(entry_path), getsize(entry_path), entry_path))
+            except OSError:
+                # removed by another process
+                continue
+
+        cache_size = sum(entry_size for _, entry_size, _ in entries)
+        target_size = self.max_size * EVICT_FRACTION if cache_size > self.max_size else self.max_size
+        for _, entry_size, entry_path in sorted(entries):
+            if cache_size <= target_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            cache_size -= entry_size
+        self.cache_size = cache_size
+        self.puts_since_scan = 0
+
+    def get_stats(self):
+        '''
+        This method gets the hit and miss counts of this cache object
+
+        Returns:
+        --------
+        dictionary:
+            'hits', 'misses' and 'hit_rate' (0 when nothing was looked up)
+        '''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,245 @@
+'''
+This file is responsible for fitting a fast approximation of the trained SVR for screening many models.
+
+The exact SVR costs one kernel value per input row and support vector. The approximation replaces the kernel with D fixed features of
+the input row, so a prediction is one (N, D) x (D,) product whatever the number of support vectors:
+
+    nystroem  the kernel values to D landmark support vectors, the artifact is an ordinary svr_engine artifact with D support vectors
+    rff       D random Fourier features of the rbf kernel, sqrt(2 / D) cos(x W + b), run by svr_engine.RandomFeatureSVR
+
+The weights of the D features are fit by ridge regression to the exact predictions on the calibration rows: the support vectors of
+the model and the residues of the step 2 feature files (ZoomQA_Input/step/TARGET/MODEL.pkl, or the feature cache) given on the command
+line. Every other model of the calibration files is held out, and the report compares the approximation to the exact SVR on them, per
+residue (the predicted distance in angstroms) and per model (the global score of add_GDT.get_gdt).
+
+    python script/fit_svr_approximation.py /path/to/approximation.npz /path/to/calibration/folder ... [--method rff] [--components 2000]
+
+Set SVR_APPROXIMATION_PATH in prediction.py, or run prediction.py with --approximate /path/to/approximation.npz, to predict with it.
+'''
+
+import os
+import sys
+import pickle
+import argparse
+from os.path import join, dirname, abspath
+from timeit import default_timer as timer
+
+import numpy as np
+
+sys.path.insert(1, dirname(dirname(abspath(__file__))))
+
+from prediction import TOP_N, SVR_ARTIFACT_PATH, un_norm_qa
+from script.paths import PATHS
+from script.add_GDT import get_gdt
+from script.generate_formatted_SVR_input import parse_server_data, get_feature_ranks
+from script.svr_engine import get_svr_engine, get_model_fingerprint, save_svr_artifact, load_svr_artifact
+
+APPROXIMATION_METHODS = ['nystroem', 'rff']
+# the rows of one block of calibration features
+CALIBRATION_BLOCK_ROWS = 4096
+
+
+def load_calibration_rows(pathToFolders, top_n=TOP_N):
+    '''
+    This method loads the SVR input rows of every step 2 feature file (a pickled server dictionary) in the folders
+
+    Parameters:
+    ----------
+    pathToFolders: list[string]
+        The folders searched for .pkl files
+
+    top_n: int
+        The number of SVR inputs
+
+    Returns:
+    --------
+    list[np.ndarray((L, top_n))]:
+        The input rows of every model
+    '''
+    feature_ranks = get_feature_ranks()
+    model_rows = []
+    for pathToFolder in pathToFolders:
+        for path, dirs, files in os.walk(pathToFolder):
+            for file in sorted(files):
+                if not file.endswith('.pkl'):
+                    continue
+                try:
+                    with open(join(path, file), 'rb') as f:
+                        server_data = pickle.load(f)
+                    server_X, server_y = parse_server_data(server_data, top_n, feature_ranks)
+                except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError, ValueError) as e:
+                    print(f"Skipping {join(path, file)}: {e}")
+                    continue
+                if len(server_X):
+                    model_rows.append(server_X)
+    return model_rows
+
+
+def iter_calibration_blocks(X):
+    for start in range(0, len(X), CALIBRATION_BLOCK_ROWS):
+        yield X[start:start + CALIBRATION_BLOCK_ROWS]
+
+
+def solve_ridge(normal_matrix, normal_vector, ridge):
+    '''
+    This method solves (A + ridge * mean(diag(A)) I) w = c for the weights of the features
+    '''
+    scale = ridge * max(float(np.trace(normal_matrix)) / len(normal_matrix), 1e-12)
+    return np.linalg.solve(normal_matrix + scale * np.eye(len(normal_matrix)), normal_vector)
+
+
+def fit_nystroem(engine, X, num_components, ridge=1e-6, seed=0):
+    '''
+    This method fits the weights of the kernel values to num_components landmark support vectors
+
+    Parameters:
+    ----------
+    engine: svr_engine.SVREngine
+        The exact SVR
+
+    X: np.ndarray((N, F))
+        The calibration rows
+
+    num_components: int
+        The number of landmarks D
+
+    ridge: float
+        The ridge penalty relative to the mean feature energy
+
+    seed: int
+        The seed of the random landmarks
+
+    Returns:
+    --------
+    dictionary:
+        The arrays of the svr_engine artifact of the approximation
+    '''
+    landmarks = np.sort(np.random.default_rng(seed).choice(len(engine.support_vectors), num_components, replace=False))
+    normal_matrix = np.zeros((num_components, num_components))
+    normal_vector = np.zeros(num_components)
+    for block in iter_calibration_blocks(X):
+        # the kernel to every support vector gives the exact prediction and, in its landmark columns, the features
+        kernel_values = engine.kernel_block(np.asarray(block, dtype=engine.dtype))
+        residuals = kernel_values @ engine.dual_coef
+        features = kernel_values[:, landmarks].astype(np.float64)
+        normal_matrix += features.T @ features
+        normal_vector += features.T @ residuals
+
+    return {'support_vectors': engine.support_vectors[landmarks].astype(np.float64),
+            'dual_coef': solve_ridge(normal_matrix, normal_vector, ridge), 'intercept': engine.intercept, 'kernel': engine.kernel,
+            'gamma': engine.gamma, 'coef0': engine.coef0, 'degree': engine.degree}
+
+
+def fit_random_features(engine, X, num_components, ridge=1e-6, seed=0):
+    '''
+    This method fits the weights of num_components random Fourier features of the rbf kernel (see fit_nystroem for the parameters)
+    '''
+    if engine.kernel != 'rbf':
+        raise ValueError(f"Random Fourier features approximate the rbf kernel, the model uses {engine.kernel}")
+    rng = np.random.default_rng(seed)
+    # exp(-gamma |x - y|^2) is the expectation of 2 cos(x w + b) cos(y w + b) for w ~ N(0, 2 gamma) and b ~ U(0, 2 pi)
+    projection = rng.normal(0, np.sqrt(2 * engine.gamma), (X.shape[1], num_components))
+    offsets = rng.uniform(0, 2 * np.pi, num_components)
+    normal_matrix = np.zeros((num_components, num_components))
+    normal_vector = np.zeros(num_components)
+    for block in iter_calibration_blocks(X):
+        residuals = engine.predict(block) - engine.intercept
+        features = np.sqrt(2 / num_components) * np.cos(block @ projection + offsets)
+        normal_matrix += features.T @ features
+        normal_vector += features.T @ residuals
+
+    return {'projection': projection, 'offsets': offsets, 'weights': solve_ridge(normal_matrix, normal_vector, ridge),
+            'intercept': engine.intercept, 'kernel': 'rff'}
+
+
+def get_error_report(engine, approximation, model_rows):
+    '''
+    This method compares the approximation to the exact SVR
+
+    Parameters:
+    ----------
+    engine: svr_engine.SVREngine
+        The exact SVR
+
+    approximation: svr_engine.SVREngine or svr_engine.RandomFeatureSVR
+        The fitted approximation
+
+    model_rows: list[np.ndarray((L, F))]
+        The input rows of every held out model
+
+    Returns:
+    --------
+    dictionary:
+        The residue and model counts, the mean, 95th percentile and largest per residue distance error (angstroms), the mean and
+        largest global score error, and the prediction time of both
+    '''
+    X = np.concatenate(model_rows)
+    start = timer()
+    exact_distances = un_norm_qa(engine.predict(X))
+    exact_time = timer() - start
+    start = timer()
+    approximate_distances = un_norm_qa(approximation.predict(X))
+    approximate_time = timer() - start
+
+    residue_errors = np.abs(approximate_distances - exact_distances)
+    offsets = np.cumsum([0] + [len(rows) for rows in model_rows])
+    global_errors = np.asarray([abs(get_gdt(approximate_distances[start:end]) - get_gdt(exact_distances[start:end]))
+                                for start, end in zip(offsets[:-1], offsets[1:])])
+    return {'residues': len(X), 'models': len(model_rows), 'residue_mean': float(residue_errors.mean()),
+            'residue_95': float(np.percentile(residue_errors, 95)), 'residue_max': float(residue_errors.max()),
+            'global_mean': float(global_errors.mean()), 'global_max': float(global_errors.max()),
+            'exact_time': exact_time, 'approximate_time': approximate_time}
+
+
+def print_error_report(report):
+    print(f"Error versus the exact SVR on {report['residues']} residues of {report['models']} held out models")
+    print(f"  residue distance (A): mean {report['residue_mean']:.4f}, 95th percentile {report['residue_95']:.4f}, "
+          f"max {report['residue_max']:.4f}")
+    print(f"  global score:         mean {report['global_mean']:.5f}, max {report['global_max']:.5f}")
+    print(f"  prediction time:      exact {report['exact_time']:.3f}s, approximation {report['approximate_time']:.3f}s")
+
+
+def main(output, calibration, method='nystroem', components=1000, ridge=1e-6, seed=0, model=None):
+    pathToModel = model if model is not None else PATHS.model_path
+    engine = get_svr_engine(pathToModel, SVR_ARTIFACT_PATH)
+    print(f"Exact model: {engine}")
+
+    model_rows = load_calibration_rows(calibration)
+    fit_rows, held_out_rows = model_rows[0::2], model_rows[1::2]
+    X = np.concatenate([engine.support_vectors.astype(np.float64)] + fit_rows)
+    print(f"Fitting {components} {method} features on {len(X)} rows ({len(engine.support_vectors)} support vectors, "
+          f"{len(fit_rows)} models)...")
+
+    if method == 'nystroem':
+        if components >= len(engine.support_vectors):
+            print(f"{components} components are not fewer than the {len(engine.support_vectors)} support vectors, use the exact SVR")
+            sys.exit(1)
+        arrays = fit_nystroem(engine, X, components, ridge, seed)
+    else:
+        arrays = fit_random_features(engine, X, components, ridge, seed)
+    save_svr_artifact(output, fingerprint=get_model_fingerprint(pathToModel), **arrays)
+    print(f"Saved the approximation to {output}")
+
+    approximation = load_svr_artifact(output)
+    if held_out_rows:
+        print_error_report(get_error_report(engine, approximation, held_out_rows))
+    else:
+        print("No held out models (give calibration folders with at least two step 2 feature files), reporting on the support vectors")
+        print_error_report(get_error_report(engine, approximation, [engine.support_vectors.astype(np.float64)]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Script to fit a fast approximation of the ZoomQA SVR and report its error')
+
+    parser.add_argument('output', help='The .npz file of the approximation')
+    parser.add_argument('calibration', nargs='*', help='Folders with step 2 feature files (.pkl) to fit and check the approximation on')
+    parser.add_argument('--method', choices=APPROXIMATION_METHODS, default='nystroem',
+                        help='nystroem: kernel values to landmark support vectors, rff: random Fourier features (rbf kernel only)')
+    parser.add_argument('--components', type=int, default=1000, help='The number of features D')
+    parser.add_argument('--ridge', type=float, default=1e-6, help='The ridge penalty relative to the mean feature energy')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the landmarks or random features')
+    parser.add_argument('--model', help='The pickled SVR, the model of the install by default')
+
+    args = parser.parse_args()
+
+    main(**vars(args))
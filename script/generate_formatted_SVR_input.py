@@ -2,9 +2,13 @@ import numpy as np
 from os.path import join
 
 from .paths import PATHS
+from .assist_generation_scripts.feature_plan import load_feature_ranks
 
 MAX_RADIUS = 55
 
+# the feature ranks are read once per process, see get_feature_ranks
+loaded_feature_ranks = None
+
 
 def get_top_n_features(threshold, feature_ranks, X):
     '''
@@ -42,7 +46,7 @@ def get_top_n_features(threshold, feature_ranks, X):
 
 def get_feature_ranks():
     '''
-    This method returns the ordered feature ranks, precomputed and saved
+    This method returns the ordered feature ranks, precomputed and saved, the file is read once per process
 
     Parameters:
     -------------
@@ -54,16 +58,13 @@ def get_feature_ranks():
     list: [string]
         A list of strings of the feature indexes ranked from best to worst by pearson correlation
     '''
-    # load and parse the feature ranks
-    pathToFeatureScores = join(PATHS.sw_install, './script/Pearson_Correlation_Individula_Features.txt')
-
-    raw_data = open(pathToFeatureScores).read()
-    feature_ranks = []
-    for line in raw_data.split('\n'):
-        line_data = line.split('\t')
-        feature_ranks.append(line_data[0])
+    global loaded_feature_ranks
+    if loaded_feature_ranks is None:
+        # load and parse the feature ranks
+        pathToFeatureScores = join(PATHS.sw_install, './script/Pearson_Correlation_Individula_Features.txt')
+        loaded_feature_ranks = load_feature_ranks(pathToFeatureScores)
 
-    return feature_ranks
+    return loaded_feature_ranks
 
 
 def flatten(data):
@@ -84,7 +85,7 @@ def flatten(data):
         data[i] = x_flatten
 
 
-def parse_server_data(server_data, top_n):
+def parse_server_data(server_data, top_n, feature_ranks=None):
     '''
     This method is responsible for creating the final training and label data.
     Shape for the input data: (47,51)
@@ -95,12 +96,16 @@ def parse_server_data(server_data, top_n):
         This is one file created by the 'generate_casp_fragment_structures.py' script. It is all the relevant data for a server prediction for a
         target
 
+    feature_ranks: list[string] or None
+        The output of get_feature_ranks, pass it in when parsing many servers so the file is read once. None reads it
+
     Return:
     list[np.ndarray(47,51)], list[float]
         this method returns two items. The first is a list of 51x21 matrix reperesenting the input data for each residue in the target
         and the second is the localQA score for the corresponding input data
     '''
-    feature_ranks = get_feature_ranks()
+    if feature_ranks is None:
+        feature_ranks = get_feature_ranks()
 
     server_X, server_y = [], []
 
@@ -162,6 +167,9 @@ def parse_server_data(server_data, top_n):
         server_y.append(np.asarray(y))
 
     flatten(server_X)
-    svr_input = get_top_n_features(top_n, feature_ranks, server_X)
+    if not server_X:
+        return np.empty((0, len(feature_ranks[:top_n]))), np.array(server_y)
+    # the same columns as get_top_n_features, picked from every residue at once
+    svr_input = np.stack(server_X)[:, [int(feature_number) for feature_number in feature_ranks[:top_n]]]
 
-    return np.asarray(svr_input), np.array(server_y)
+    return svr_input, np.array(server_y)
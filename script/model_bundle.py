@@ -0,0 +1,278 @@
+'''
+This file is responsible for the model bundle, one binary file that holds everything a prediction reads from the install.
+
+Without it the model inputs are scattered: the pickled SVR in model/, the four random forest prediction pickles in RF_Predictions/ and
+the feature ranks in Pearson_Correlation_Individula_Features.txt. install.py compiles them into the bundle once:
+
+    magic     8 bytes, BUNDLE_MAGIC
+    header    4 bytes little endian length, then a JSON header:
+                  'version'   BUNDLE_VERSION
+                  'arrays'    name -> [offset from the start of the data, dtype, shape]
+                  'meta'      the SVR kernel parameters, top_n and the normalization constants
+                  'sources'   the fingerprint of every file the bundle was compiled from
+                  'checksum'  sha256 of the header (with an EMPTY_CHECKSUM) and the data
+    data      the arrays, each starting at a multiple of ARRAY_ALIGNMENT bytes
+
+    svr_support_vectors, svr_dual_coef   the SVR (see svr_engine.py)
+    rf_tensor                            (4, 20, 361, 361) float32 random forest predictions (see make_random_forest_predictions.py)
+    top_n_index                          the columns of the flattened SVR input matrix the SVR reads
+
+The arrays are read only views of one memory mapping, so opening the bundle reads nothing but the header and forked worker processes
+share the pages of the file instead of each holding a copy. A bundle whose sources changed since it was compiled is not used.
+
+A bundle whose size does not match the layout of its header is not mapped. The header and the data are checked against the checksum the first time a
+bundle is opened after it was written, and the result is recorded next to it (VERIFIED_SUFFIX), keyed by the checksum, size and
+modification time of the bundle, so later runs do not read the whole file again. A bundle that fails the check is not used.
+'''
+
+import os
+import json
+import struct
+import hashlib
+import tempfile
+import numpy as np
+from os.path import join, isdir, isfile, dirname, abspath
+
+BUNDLE_MAGIC = b'ZOOMQA\x00\x01'
+BUNDLE_VERSION = 2
+ARRAY_ALIGNMENT = 64
+# the bytes hashed at a time
+CHECKSUM_BLOCK = 16 * 1024 ** 2
+# the checksum field of the header while the checksum is computed
+EMPTY_CHECKSUM = '0' * 64
+# the record of a verified bundle is the bundle path with this suffix, see ModelBundle.verify_once
+VERIFIED_SUFFIX = '.verified'
+
+# path -> ModelBundle of the bundles opened by this process, see open_model_bundle
+opened_bundles = {}
+
+
+def get_source_fingerprints(sources):
+    '''
+    This method identifies the source files of a bundle by their size and modification time
+
+    Parameters:
+    ----------
+    sources: dictionary
+        key -> source name, value -> path of a file or folder (every file inside a folder counts)
+
+    Returns:
+    --------
+    dictionary:
+        key -> source name, value -> fingerprint string, None for a missing source
+    '''
+    fingerprints = {}
+    for name, path in sources.items():
+        if isdir(path):
+            paths = [join(path, f) for f in sorted(os.listdir(path))]
+        elif isfile(path):
+            paths = [path]
+        else:
+            fingerprints[name] = None
+            continue
+        fingerprints[name] = ';'.join(f'{os.path.basename(p)}:{os.stat(p).st_size}:{os.stat(p).st_mtime_ns}' for p in paths)
+    return fingerprints
+
+
+def write_model_bundle(pathToBundle, arrays, meta, sources):
+    '''
+    This method writes a bundle, to a temporary file of its own that is renamed so a reader never sees a partial bundle and installs
+    running at the same time do not write into each other's file
+
+    Parameters:
+    ----------
+    pathToBundle: string
+        The bundle file
+
+    arrays: dictionary
+        key -> array name, value -> np.ndarray
+
+    meta: dictionary
+        JSON values stored with the arrays
+
+    sources: dictionary
+        key -> source name, value -> path the bundle is compiled from (see get_source_fingerprints)
+    '''
+    layout, offset = {}, 0
+    arrays = {name: np.ascontiguousarray(values) for name, values in arrays.items()}
+    checksum = hashlib.sha256()
+    for name, values in arrays.items():
+        offset = -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        layout[name] = [offset, values.dtype.str, list(values.shape)]
+        offset += values.nbytes
+
+    tmp_file, tmp_path = tempfile.mkstemp(dir=dirname(abspath(pathToBundle)), suffix='.tmp')
+    try:
+        with os.fdopen(tmp_file, 'w+b') as f:
+            # the header is written again once the checksum is known, it is padded so its length does not change
+            header = {'version': BUNDLE_VERSION, 'arrays': layout, 'meta': meta, 'sources': get_source_fingerprints(sources),
+                      'checksum': EMPTY_CHECKSUM}
+            header_bytes = json.dumps(header).encode()
+            data_start = -(-(len(BUNDLE_MAGIC) + 4 + len(header_bytes)) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+            header_bytes = header_bytes.ljust(data_start - len(BUNDLE_MAGIC) - 4)
+            checksum.update(header_bytes)
+            for name, values in arrays.items():
+                f.seek(data_start + layout[name][0])
+                f.write(values.tobytes())
+            f.truncate(data_start + offset)
+
+            f.seek(data_start)
+            for block in iter(lambda: f.read(CHECKSUM_BLOCK), b''):
+                checksum.update(block)
+            header['checksum'] = checksum.hexdigest()
+            header_bytes = json.dumps(header).encode().ljust(len(header_bytes))
+            f.seek(0)
+            f.write(BUNDLE_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        # mkstemp makes the file private, the bundle is read by everyone who runs the install
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, pathToBundle)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class ModelBundle:
+    def __init__(self, pathToBundle):
+        '''
+        Parameters:
+        ----------
+        pathToBundle: string
+            The bundle from write_model_bundle, ValueError when it is not a bundle of this version
+        '''
+        with open(pathToBundle, 'rb') as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"{pathToBundle} is not a ZoomQA model bundle")
+            header_length, = struct.unpack('<I', f.read(4))
+            header_bytes = f.read(header_length)
+            header = json.loads(header_bytes)
+        if header['version'] != BUNDLE_VERSION:
+            raise ValueError(f"{pathToBundle} is version {header['version']}, expected {BUNDLE_VERSION}")
+
+        self.path = pathToBundle
+        self.meta = header['meta']
+        self.sources = header['sources']
+        self.checksum = header['checksum']
+        # the header as the checksum covers it, see write_model_bundle
+        self.checksum_header = header_bytes.replace(f'"checksum": "{self.checksum}"'.encode(),
+                                                    f'"checksum": "{EMPTY_CHECKSUM}"'.encode(), 1)
+        self.data_start = -(-(len(BUNDLE_MAGIC) + 4 + header_length) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        data_size = max([offset + int(np.prod(shape)) * np.dtype(dtype).itemsize for offset, dtype, shape in header['arrays'].values()],
+                        default=0)
+        file_size = os.path.getsize(pathToBundle)
+        if file_size != self.data_start + data_size:
+            raise ValueError(f"{pathToBundle} is {file_size} bytes, its header describes {self.data_start + data_size} bytes")
+        mapping = np.memmap(pathToBundle, dtype=np.uint8, mode='r')
+        self.arrays = {}
+        for name, (offset, dtype, shape) in header['arrays'].items():
+            self.arrays[name] = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=mapping, offset=self.data_start + offset)
+
+    def __repr__(self):
+        return f'ModelBundle({self.path}, arrays={list(self.arrays)})'
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def verify(self):
+        '''
+        This method checks the header and the data against the checksum of the header, it reads the whole file
+
+        Returns:
+        --------
+        bool:
+            True if the data is intact
+        '''
+        checksum = hashlib.sha256(self.checksum_header)
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start)
+            for block in iter(lambda: f.read(CHECKSUM_BLOCK), b''):
+                checksum.update(block)
+        return checksum.hexdigest() == self.checksum
+
+    def verify_once(self):
+        '''
+        This method verifies the bundle unless the record next to it shows that this bundle was verified before, a passed check is
+        recorded (an install folder that can not be written verifies the bundle on every run)
+
+        Returns:
+        --------
+        bool:
+            True if the data is intact
+        '''
+        bundle_stat = os.stat(self.path)
+        record = {'checksum': self.checksum, 'size': bundle_stat.st_size, 'mtime_ns': bundle_stat.st_mtime_ns}
+        pathToRecord = self.path + VERIFIED_SUFFIX
+        try:
+            with open(pathToRecord) as f:
+                if json.load(f) == record:
+                    return True
+        except (OSError, ValueError):
+            pass
+
+        if not self.verify():
+            return False
+        try:
+            tmp_file, tmp_path = tempfile.mkstemp(dir=dirname(abspath(pathToRecord)), suffix='.tmp')
+            with os.fdopen(tmp_file, 'w') as f:
+                json.dump(record, f)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, pathToRecord)
+        except OSError:
+            pass
+        return True
+
+    def is_current(self, sources):
+        '''
+        This method checks that the files the bundle was compiled from have not changed (see get_source_fingerprints)
+        '''
+        return get_source_fingerprints(sources) == self.sources
+
+    def get_svr_artifact(self):
+        '''
+        This method gets the SVR in the form of an svr_engine artifact, the arrays stay memory mapped
+
+        Returns:
+        --------
+        dictionary:
+            The keys of svr_engine.get_svr_arrays and the artifact 'version'
+        '''
+        svr = self.meta['svr']
+        return {'version': svr['version'], 'support_vectors': self.arrays['svr_support_vectors'], 'dual_coef': self.arrays['svr_dual_coef'],
+                'intercept': svr['intercept'], 'kernel': svr['kernel'], 'gamma': svr['gamma'], 'coef0': svr['coef0'],
+                'degree': svr['degree'], 'fingerprint': svr['fingerprint']}
+
+
+def open_model_bundle(pathToBundle, sources=None):
+    '''
+    This method opens a bundle once per process
+
+    Parameters:
+    ----------
+    pathToBundle: string
+        The bundle file
+
+    sources: dictionary or None
+        The paths the bundle must have been compiled from, None does not check them
+
+    Returns:
+    --------
+    ModelBundle or None:
+        The bundle, None when there is none, it can not be read, its sources changed or it fails its checksum
+    '''
+    if pathToBundle not in opened_bundles:
+        bundle = None
+        if isfile(pathToBundle):
+            try:
+                bundle = ModelBundle(pathToBundle)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not open the model bundle {pathToBundle}, the model files are read instead: {e}")
+            if bundle is not None and sources is not None and not bundle.is_current(sources):
+                print(f"The model bundle {pathToBundle} is older than the model files, run install.py again to rebuild it")
+                bundle = None
+            if bundle is not None and not bundle.verify_once():
+                print(f"The model bundle {pathToBundle} does not match its checksum, run install.py again to rebuild it")
+                bundle = None
+        opened_bundles[pathToBundle] = bundle
+    return opened_bundles[pathToBundle]
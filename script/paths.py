@@ -5,9 +5,18 @@ from os.path import join
 class Paths:
     def __init__(self):
         self.sw_install = '/data/Evo/Research/ZoomQA'
-        self.model_path = join(self.sw_install, "model/")
-        model_name = os.listdir(self.model_path)[0]
-        self.model_path = join(self.model_path, model_name)
+        self._model_path = None
+        self.bundle_path = join(self.sw_install, 'ZoomQA.bundle')
+
+    @property
+    def model_path(self):
+        '''
+        The first file in model/, found the first time it is asked for so importing the paths touches no files
+        '''
+        if self._model_path is None:
+            model_folder = join(self.sw_install, "model/")
+            self._model_path = join(model_folder, os.listdir(model_folder)[0])
+        return self._model_path
 
 
 PATHS = Paths()
@@ -0,0 +1,127 @@
+'''
+This file is responsible for the step 0 cleanup of the input models in one streaming pass, it replaces running
+re_number_residue_index.pl and then assist_add_chainID_to_one_pdb.pl on every file.
+
+Only the ATOM records are kept (like re_number_residue_index.pl), the atoms are renumbered from 1, the residues are renumbered
+from 1 in the order they appear (a new residue starts when the residue sequence number changes) and the chain is set to A.
+The output lines are byte identical to the two perl scripts, so clean_pdb_lines can be put between an open file and
+pdb_reader.read_pdb_lines instead of writing the two intermediate copies.
+
+Run this file directly to clean a folder of models.
+'''
+
+import os
+import sys
+import hashlib
+from os.path import join
+
+
+def _get_residue_number(residue_field):
+    '''
+    This method reads the residue sequence number columns the way perl int() does for the numbers found in models
+    '''
+    try:
+        return int(residue_field)
+    except ValueError:
+        return residue_field.strip()
+
+
+def clean_pdb_lines(pdb_lines, chain_id='A'):
+    '''
+    This method renumbers the atoms and residues of the ATOM records and sets their chain
+
+    Parameters:
+    ----------
+    pdb_lines: iterable[string]
+        The lines of a PDB file, an open file or any other line iterator works
+
+    chain_id: string
+        The chain every atom is put in
+
+    Returns:
+    --------
+    generator[string]:
+        The cleaned ATOM lines, with their line endings
+    '''
+    atom_number = 0
+    residue_number = 0
+    current_residue = None
+    for line in pdb_lines:
+        fields = line.split()
+        if not fields or fields[0] != 'ATOM' or line[0].isspace():
+            continue
+
+        residue = _get_residue_number(line[22:26])
+        if residue != current_residue:
+            # this is a new residue
+            current_residue = residue
+            residue_number += 1
+        atom_number += 1
+
+        yield f'{line[:6]}{atom_number:5d}{line[11:21]}{chain_id}{residue_number:4d}{line[26:]}'
+
+
+def clean_pdb(pathToPDB, pathToOutput=None, chain_id='A'):
+    '''
+    This method cleans one PDB file (see clean_pdb_lines)
+
+    Parameters:
+    ----------
+    pathToPDB: string
+        Path to the input model
+
+    pathToOutput: string or None
+        The cleaned model is written here when given, e.g. for stride
+
+    chain_id: string
+        The chain every atom is put in
+
+    Returns:
+    --------
+    list[string]:
+        The cleaned lines, they can be passed to pdb_reader.read_pdb_lines
+    '''
+    with open(pathToPDB) as pdb_file:
+        cleaned_lines = list(clean_pdb_lines(pdb_file, chain_id))
+
+    if pathToOutput is not None:
+        with open(pathToOutput, 'w') as output_file:
+            output_file.writelines(cleaned_lines)
+
+    return cleaned_lines
+
+
+def get_coordinate_hash(cleaned_lines):
+    '''
+    This method gets the content address of a cleaned model, the hash of the atom names, residues and coordinates (columns 13-60)
+    of every line. The atom serial numbers and the B-factors do not change the hash
+
+    Parameters:
+    ----------
+    cleaned_lines: list[string]
+        The output of clean_pdb_lines or clean_pdb
+
+    Returns:
+    --------
+    string:
+        The sha256 hex digest
+    '''
+    model_hash = hashlib.sha256()
+    for line in cleaned_lines:
+        model_hash.update(line[12:60].encode())
+        model_hash.update(b'\n')
+    return model_hash.hexdigest()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("This script renumbers the atoms and residues of every model in a folder and puts them in chain A")
+        print(f"python {sys.argv[0]} ./QA_examples/Input/T1096 ./step_0/T1096")
+        sys.exit(0)
+
+    pathToInput = sys.argv[1]
+    pathToSave = sys.argv[2]
+    os.makedirs(pathToSave, exist_ok=True)
+
+    for pdb in os.listdir(pathToInput):
+        clean_pdb(join(pathToInput, pdb), join(pathToSave, pdb))
@@ -0,0 +1,142 @@
+'''
+This file is responsible for reading a PDB file once into NumPy arrays that every step 1 extractor shares.
+
+Only the ATOM records of the first model are read, by their fixed columns:
+    1-6   Record name     13-16 Atom name      17    Alternate location
+    18-20 Residue name    22    Chain          23-26 Residue sequence number
+    27    Insertion code  31-54 x, y, z        55-60 Occupancy
+
+Like Bio.PDB, an atom with alternate locations keeps the location with the highest occupancy (the first one on ties).
+'''
+
+import numpy as np
+
+
+def read_pdb(pdb_path, chain_id=None):
+    '''
+    This method reads one PDB file into a structure dictionary, see read_pdb_lines
+
+    Parameters:
+    ----------
+    pdb_path: string
+        Path to the PDB file
+
+    chain_id: string or None
+        The chain to read, None reads the first chain in the file
+
+    Returns:
+    --------
+    dictionary:
+        The parsed structure, see read_pdb_lines
+    '''
+    with open(pdb_path) as pdb_file:
+        return read_pdb_lines(pdb_file, chain_id)
+
+
+def read_pdb_lines(pdb_lines, chain_id=None):
+    '''
+    This method reads the ATOM records of PDB formatted lines into a structure dictionary
+
+    Parameters:
+    ----------
+    pdb_lines: iterable[string]
+        The lines of a PDB file, an open file or any other line iterator works
+
+    chain_id: string or None
+        The chain to read, None reads the first chain found
+
+    Returns:
+    --------
+    dictionary:
+        'chain_id' -> the chain that was read
+        'res_name' -> np.ndarray((R,)) the three letter residue names in file order
+        'res_seq' -> np.ndarray((R,)) the residue sequence numbers
+        'icode' -> np.ndarray((R,)) the residue insertion codes
+        'atom_name' -> np.ndarray((N,)) the atom names
+        'element' -> np.ndarray((N,)) the element symbols, '' where the file has none
+        'atom_res_index' -> np.ndarray((N,)) the residue (0 based, file order) each atom belongs to
+        'coords' -> np.ndarray((N, 3)): float32 the atom coordinates
+    '''
+    res_name, res_seq, icode = [], [], []
+    atom_name, element, atom_res_index, coords, occupancy = [], [], [], [], []
+    residue_keys = {}
+    atom_keys = {}
+
+    for line in pdb_lines:
+        if line.startswith('ENDMDL'):
+            break
+        if not line.startswith('ATOM'):
+            continue
+
+        line_chain = line[21:22]
+        if chain_id is None:
+            chain_id = line_chain
+        if line_chain != chain_id:
+            continue
+
+        residue_key = (int(line[22:26]), line[26:27])
+        if residue_key not in residue_keys:
+            residue_keys[residue_key] = len(res_name)
+            res_name.append(line[17:20].strip())
+            res_seq.append(residue_key[0])
+            icode.append(residue_key[1])
+        residue_index = residue_keys[residue_key]
+
+        name = line[12:16].strip()
+        atom_occupancy = float(line[54:60]) if line[54:60].strip() else 1.0
+        atom_coords = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+
+        atom_key = (residue_index, name)
+        if atom_key in atom_keys:
+            # alternate location, keep the highest occupancy like Bio.PDB
+            previous = atom_keys[atom_key]
+            if atom_occupancy > occupancy[previous]:
+                coords[previous] = atom_coords
+                occupancy[previous] = atom_occupancy
+            continue
+
+        atom_keys[atom_key] = len(atom_name)
+        atom_name.append(name)
+        element.append(line[76:78].strip())
+        atom_res_index.append(residue_index)
+        coords.append(atom_coords)
+        occupancy.append(atom_occupancy)
+
+    return {
+        'chain_id': chain_id,
+        'res_name': np.asarray(res_name, dtype=str),
+        'res_seq': np.asarray(res_seq, dtype=np.int64),
+        'icode': np.asarray(icode, dtype=str),
+        'atom_name': np.asarray(atom_name, dtype=str),
+        'element': np.asarray(element, dtype=str),
+        'atom_res_index': np.asarray(atom_res_index, dtype=np.int64),
+        'coords': np.asarray(coords, dtype=np.float32).reshape(-1, 3),
+    }
+
+
+def get_atom_coords(structure, atom_name):
+    '''
+    This method gets the coordinates of one atom type for every residue of a structure
+
+    Parameters:
+    ----------
+    structure: dictionary
+        A structure from read_pdb
+
+    atom_name: string
+        The atom name, e.g. 'CA'
+
+    Returns:
+    --------
+    np.ndarray((R, 3)): float32, np.ndarray((R,)): bool
+        The coordinates of the atom in each residue (nan where the residue does not have it) and the mask of the residues that have it
+    '''
+    num_residues = len(structure['res_name'])
+    atom_coords = np.full((num_residues, 3), np.nan, dtype=np.float32)
+    has_atom = np.zeros(num_residues, dtype=bool)
+
+    selected = structure['atom_name'] == atom_name
+    atom_coords[structure['atom_res_index'][selected]] = structure['coords'][selected]
+    has_atom[structure['atom_res_index'][selected]] = True
+
+    return atom_coords, has_atom
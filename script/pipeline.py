@@ -0,0 +1,466 @@
+'''
+This file is responsible for running the whole feature generation (step 0 -> step 1 -> step 2) for one target inside the calling process.
+
+The step functions are called directly and the cleaned models, contact maps and feature vectors are passed along in memory, so a target does
+not pay for starting three python interpreters and reading every step back from disk. The intermediate files of the command line steps are
+only written when a folder is given for them:
+
+    pathToIntermediate/
+        step_0/TARGET/                    renumbered pdbs with chain A, see pdb_cleanup.py
+        step_1/step_0_TARGET/MODEL/       binary step 1 data, see binary_model_data.py
+        ZoomQA_Input/step/TARGET/MODEL.pkl  step 2 feature vectors
+
+The SVR, the random forest predictions and the feature ranks are read from the model bundle of the install when install.py compiled
+one (see model_bundle.py), and from their files otherwise.
+
+The step 2 feature vectors can be cached on disk (see disk_cache.py) by the coordinate hash of the cleaned model and the version of the
+feature code, so a model that was featurized before only goes through step 0. Step 1 files are not written for cached models.
+'''
+
+import os
+import re
+import sys
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join, dirname, abspath
+
+SCRIPT_PATH = dirname(abspath(__file__))
+sys.path.insert(1, SCRIPT_PATH)
+sys.path.insert(1, join(SCRIPT_PATH, 'assist_generation_scripts'))
+
+from paths import PATHS
+from pdb_reader import read_pdb_lines
+from pdb_cleanup import clean_pdb, get_coordinate_hash
+from stride_runner import run_stride_models
+from ss_sasa_engine import calc_ss_sasa
+from binary_model_data import save_model_data
+from step1_create_json_from_PDB import extract_model_data
+from step2_generate_casp_fragment_structures import generate_server_vectors
+from make_random_forest_predictions import load_RF_predictions, set_RF_tensor, read_RF_tensor
+from feature_plan import compile_feature_plan, load_feature_ranks
+from model_bundle import open_model_bundle, write_model_bundle, get_source_fingerprints, ModelBundle
+from svr_engine import get_svr_arrays, load_pickled_model, ARTIFACT_VERSION
+
+TARGET_NAME_PATTERN = re.compile(r"T\d{4}[a-zA-Z]*[0-9]*")
+
+# the files the step 1 and step 2 features depend on (folders stand for their python files), a change to any of them invalidates
+# the feature cache
+FEATURE_CODE_FILES = ['pdb_reader.py', 'stride_runner.py', 'stride_extension.py', 'ss_sasa_engine.py', 'backbone_geometry.py',
+                      'step1_create_json_from_PDB.py', 'step2_generate_casp_fragment_structures.py',
+                      'Pearson_Correlation_Individula_Features.txt', 'assist_generation_scripts']
+feature_code_version = None
+# the feature plan of a featurize_targets worker process, see init_feature_worker
+worker_feature_plan = None
+
+# the random forest predictions are module globals, they are only loaded again when a different folder is asked for
+loaded_RF_predictions = None
+# the model files of the install, see get_install_sources
+install_sources = None
+
+
+def get_target_name(pathToInput):
+    '''
+    This method gets the CASP target name (e.g. T1096) from the input path, 'Target' if there is none
+    '''
+    target_name = re.search(TARGET_NAME_PATTERN, pathToInput)
+    if target_name is not None:
+        return str(target_name[0])
+    return 'Target'
+
+
+def get_install_sources():
+    '''
+    This method gets the model files of the install that are compiled into the model bundle, they are found once per process
+
+    Returns:
+    --------
+    dictionary:
+        'model' the pickled SVR, 'random_forest' the RF_Predictions folder, 'feature_ranks' Pearson_Correlation_Individula_Features.txt
+    '''
+    global install_sources
+    if install_sources is None:
+        install_sources = {'model': PATHS.model_path,
+                           'random_forest': join(PATHS.sw_install, 'script/assist_generation_scripts/RF_Predictions/'),
+                           'feature_ranks': join(PATHS.sw_install, 'script/Pearson_Correlation_Individula_Features.txt')}
+    return install_sources
+
+
+def get_install_bundle():
+    '''
+    This method opens the model bundle of the install once per process
+
+    Returns:
+    --------
+    model_bundle.ModelBundle or None:
+        The bundle, None when install.py did not compile one or the model files changed since
+    '''
+    return open_model_bundle(PATHS.bundle_path, get_install_sources())
+
+
+def compile_install_bundle(top_n, normalization):
+    '''
+    This method compiles the model files of the install into the model bundle (see model_bundle.py)
+
+    Parameters:
+    ----------
+    top_n: int
+        The number of SVR inputs, the top_n_index of the bundle holds their columns
+
+    normalization: dictionary
+        The normalization constants of the SVR outputs, stored in the bundle meta
+    '''
+    sources = get_install_sources()
+    svr = get_svr_arrays(load_pickled_model(sources['model']), sources['model'])
+    arrays = {'svr_support_vectors': svr.pop('support_vectors'), 'svr_dual_coef': svr.pop('dual_coef'),
+              'rf_tensor': read_RF_tensor(sources['random_forest']),
+              'top_n_index': np.asarray([int(feature_number) for feature_number in load_feature_ranks(sources['feature_ranks'])[:top_n]],
+                                        dtype=np.int64)}
+    svr['version'] = ARTIFACT_VERSION
+    write_model_bundle(PATHS.bundle_path, arrays, {'svr': svr, 'top_n': top_n, 'normalization': normalization}, sources)
+    # verified here, so the first prediction does not read the whole bundle again
+    if not ModelBundle(PATHS.bundle_path).verify_once():
+        raise ValueError(f"The checksum of {PATHS.bundle_path} does not match its data")
+
+
+def prepare_RF_predictions(pathToRandomForestPredictions=None):
+    '''
+    This method loads the random forest predictions used by step 2 once per process
+
+    Parameters:
+    ----------
+    pathToRandomForestPredictions: string or None
+        The RF_Predictions folder, None uses the model bundle of the install or its RF_Predictions folder
+    '''
+    global loaded_RF_predictions
+    if pathToRandomForestPredictions is None:
+        bundle = get_install_bundle()
+        if bundle is not None:
+            if loaded_RF_predictions != bundle.path:
+                set_RF_tensor(bundle['rf_tensor'])
+                loaded_RF_predictions = bundle.path
+            return
+        pathToRandomForestPredictions = get_install_sources()['random_forest']
+    if loaded_RF_predictions != pathToRandomForestPredictions:
+        load_RF_predictions(pathToRandomForestPredictions)
+        loaded_RF_predictions = pathToRandomForestPredictions
+
+
+def get_feature_code_version():
+    '''
+    This method hashes the source of the feature code (see FEATURE_CODE_FILES) once per process
+    '''
+    global feature_code_version
+    if feature_code_version is None:
+        code_hash = hashlib.sha256()
+        for code_file in FEATURE_CODE_FILES:
+            code_path = join(SCRIPT_PATH, code_file)
+            code_paths = [join(code_path, f) for f in sorted(os.listdir(code_path)) if f.endswith('.py')] if os.path.isdir(code_path) \
+                else [code_path]
+            for code_path in code_paths:
+                code_hash.update(code_path[len(SCRIPT_PATH):].encode())
+                with open(code_path, 'rb') as f:
+                    code_hash.update(f.read())
+        feature_code_version = code_hash.hexdigest()
+    return feature_code_version
+
+
+def get_RF_fingerprint(pathToRandomForestPredictions=None):
+    '''
+    This method identifies the random forest predictions step 2 reads (see prepare_RF_predictions) by their contents rather than their
+    path, so predictions rebuilt in the same place give new feature cache keys
+
+    Returns:
+    --------
+    string:
+        The checksum of the model bundle when the predictions come from it, else the size and modification time of every file of
+        the RF_Predictions folder
+    '''
+    if pathToRandomForestPredictions is None:
+        bundle = get_install_bundle()
+        if bundle is not None:
+            return f'bundle:{bundle.checksum}'
+        pathToRandomForestPredictions = get_install_sources()['random_forest']
+    return str(get_source_fingerprints({'random_forest': pathToRandomForestPredictions})['random_forest'])
+
+
+def get_feature_key(model_hash, top_n=None, ss_engine='stride', RF_fingerprint=None):
+    '''
+    This method gets the feature cache key of a model, the features depend on its coordinates, the feature code, the planned
+    features, the secondary structure engine and the random forest predictions (see get_RF_fingerprint)
+    '''
+    key = f'{model_hash}:{get_feature_code_version()}:{top_n}:{ss_engine}:{RF_fingerprint}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_feature_plan(top_n=None):
+    '''
+    This method compiles the feature plan of the top n ranked SVR inputs, None computes every feature
+    '''
+    if top_n is None:
+        return None
+    bundle = get_install_bundle()
+    if bundle is not None and bundle.meta['top_n'] >= top_n:
+        return compile_feature_plan(bundle['top_n_index'], top_n)
+    return compile_feature_plan(load_feature_ranks(get_install_sources()['feature_ranks']), top_n)
+
+
+def clean_target_models(pathToInput, pathToStep0):
+    '''
+    This method runs step 0 on every model of a target
+
+    Returns:
+    --------
+    list[string], list[list[string]], list[string]:
+        The model file names (sorted), the cleaned lines and the coordinate hash of every model
+    '''
+    os.makedirs(pathToStep0, exist_ok=True)
+    # the stride executable reads the cleaned models from disk, step 1 parses the cleaned lines directly
+    model_pdbs, model_lines, model_hashes = [], [], []
+    for pdb in sorted(os.listdir(pathToInput)):
+        cleaned_lines = clean_pdb(join(pathToInput, pdb), join(pathToStep0, pdb))
+        model_pdbs.append(pdb)
+        model_lines.append(cleaned_lines)
+        model_hashes.append(get_coordinate_hash(cleaned_lines))
+    return model_pdbs, model_lines, model_hashes
+
+
+def get_cached_features(model_hashes, feature_cache=None, top_n=None, ss_engine='stride', pathToRandomForestPredictions=None):
+    '''
+    This method looks the models up in the feature cache
+
+    Returns:
+    --------
+    list[string], list[dictionary]:
+        The feature cache key and the cached step 2 feature vectors of every model, None for a miss (all None without a cache)
+    '''
+    if feature_cache is None:
+        return [None] * len(model_hashes), [None] * len(model_hashes)
+    RF_fingerprint = get_RF_fingerprint(pathToRandomForestPredictions)
+    feature_keys = [get_feature_key(model_hash, top_n, ss_engine, RF_fingerprint) for model_hash in model_hashes]
+    return feature_keys, [feature_cache.get(feature_key) for feature_key in feature_keys]
+
+
+def init_feature_worker(pathToRandomForestPredictions=None, feature_plan=None):
+    '''
+    This method prepares a worker process of featurize_targets, the random forest predictions and the feature plan are loaded once
+    per worker (nothing is loaded again when the worker was forked from a process that has them)
+    '''
+    global worker_feature_plan
+    prepare_RF_predictions(pathToRandomForestPredictions)
+    worker_feature_plan = feature_plan
+
+
+def featurize_model(pathToPDB, cleaned_lines, model_hash, pathToStride, stride_cache=None, ss_engine='stride', ss_data=None,
+                    pathToStep1=None, model_name=None, block_workers=1):
+    '''
+    This method runs step 1 and step 2 on one cleaned model in a worker started with init_feature_worker
+
+    Parameters:
+    ----------
+    ss_data: (np.ndarray, np.ndarray, np.ndarray) or None
+        The secondary structure and solvent accessibility of the model when they were computed already, None computes them
+        with ss_engine
+
+    pathToStep1: string or None
+        When given, the step 1 data is saved to this binary model directory with the name model_name
+
+    block_workers: int
+        The number of processes the residues of a very long model are split between (see residue_blocks.py)
+
+    Returns:
+    --------
+    dictionary or None:
+        The step 2 feature vectors of the model, None if the model could not be processed
+    '''
+    try:
+        model_structure = read_pdb_lines(cleaned_lines)
+        if ss_data is None and ss_engine == 'numpy':
+            ss_data = calc_ss_sasa(model_structure)
+        elif ss_data is None:
+            ss_data = run_stride_models([pathToPDB], pathToStride, [model_hash], stride_cache, max_workers=1,
+                                        pdb_lines=[cleaned_lines])[0]
+        model_data = extract_model_data(pathToPDB, pathToStride, model_structure, ss_data)
+        if model_data is None:
+            return None
+        if pathToStep1 is not None:
+            save_model_data(pathToStep1, model_name, model_data)
+        return generate_server_vectors(model_data, worker_feature_plan, block_workers)
+    except Exception as e:
+        print(f"Error processing {pathToPDB}: {e}")
+        return None
+
+
+def featurize_target(pathToInput, pathToIntermediate=None, top_n=None, pathToRandomForestPredictions=None,
+                     pathToStride=None, stride_cache=None, ss_engine='stride', feature_cache=None, max_workers=None):
+    '''
+    This method runs step 0, step 1 and step 2 on every model of one target, step 1 and step 2 of the models run in a pool of
+    worker processes
+
+    Parameters:
+    ----------
+    pathToInput: string
+        The folder with the pdb files of the target
+
+    pathToIntermediate: string or None
+        The folder the intermediate files are written to (see the top of this file), None only keeps them in memory
+
+    top_n: int or None
+        Only the features of the top n ranked SVR inputs are computed, None computes every feature
+
+    pathToRandomForestPredictions: string or None
+        The RF_Predictions folder, None uses the one of the install
+
+    pathToStride: string or None
+        The stride executable, None uses stride_linux of the install
+
+    stride_cache: disk_cache.DiskCache or None
+        The cache of stride results by model coordinate hash, None always runs stride
+
+    ss_engine: string
+        'stride' assigns the secondary structure and solvent accessibility with stride, 'numpy' with the stride free
+        engine of ss_sasa_engine.py (close to stride but not identical, see the agreement report of that file)
+
+    feature_cache: disk_cache.DiskCache or None
+        The cache of step 2 feature vectors by get_feature_key, None always runs step 1 and step 2
+
+    max_workers: int or None
+        The number of worker processes, None uses the number of cores and 1 runs every model in this process
+
+    Returns:
+    --------
+    list: [(string, dictionary)]
+        The model file name and the step 2 feature vectors of every model that could be processed, the same
+        layout as prediction.load_input_data
+    '''
+    target_name = get_target_name(pathToInput)
+    if pathToStride is None:
+        pathToStride = join(PATHS.sw_install, 'script/stride_linux')
+    input_data = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        keep_intermediate = pathToIntermediate is not None
+        work_dir = pathToIntermediate if keep_intermediate else tmp_dir
+
+        pathToStep0 = join(work_dir, 'step_0', target_name)
+        pathToStep1 = join(work_dir, 'step_1', f'step_0_{target_name}')
+        pathToZoomQAInput = join(work_dir, 'ZoomQA_Input', 'step', target_name)
+        if keep_intermediate:
+            os.makedirs(pathToStep1, exist_ok=True)
+            os.makedirs(pathToZoomQAInput, exist_ok=True)
+
+        model_pdbs, model_lines, model_hashes = clean_target_models(pathToInput, pathToStep0)
+
+        # models featurized before skip step 1 and step 2
+        feature_keys, model_vectors = get_cached_features(model_hashes, feature_cache, top_n, ss_engine, pathToRandomForestPredictions)
+        to_featurize = [index for index, server_vectors in enumerate(model_vectors) if server_vectors is None]
+
+        if to_featurize:
+            # loaded before the pool starts so forked workers share them
+            prepare_RF_predictions(pathToRandomForestPredictions)
+            feature_plan = get_feature_plan(top_n)
+
+            # stride runs in this process when its library is built, otherwise on every model at the same time. Models
+            # seen before come from the cache. The numpy engine runs in the workers
+            stride_results = [None] * len(to_featurize)
+            if ss_engine != 'numpy':
+                stride_results = run_stride_models([join(pathToStep0, model_pdbs[index]) for index in to_featurize], pathToStride,
+                                                   [model_hashes[index] for index in to_featurize], stride_cache,
+                                                   pdb_lines=[model_lines[index] for index in to_featurize])
+
+            if max_workers is None:
+                max_workers = os.cpu_count()
+            # the cores left over by a target with few models split the residues of its models
+            block_workers = max(1, max_workers // len(to_featurize))
+            jobs = [(join(pathToStep0, model_pdbs[index]), model_lines[index], model_hashes[index], pathToStride, stride_cache,
+                     ss_engine, ss_data, join(pathToStep1, model_pdbs[index]) if keep_intermediate else None,
+                     f'{target_name}:{model_pdbs[index]}', block_workers) for index, ss_data in zip(to_featurize, stride_results)]
+            if max_workers == 1 or len(jobs) == 1:
+                init_feature_worker(pathToRandomForestPredictions, feature_plan)
+                results = [featurize_model(*job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(min(max_workers, len(jobs)), initializer=init_feature_worker,
+                                         initargs=(pathToRandomForestPredictions, feature_plan)) as executor:
+                    results = list(executor.map(featurize_model, *zip(*jobs)))
+
+            for index, server_vectors in zip(to_featurize, results):
+                model_vectors[index] = server_vectors
+                if feature_cache is not None and server_vectors is not None:
+                    feature_cache.put(feature_keys[index], server_vectors)
+
+        for pdb, server_vectors in zip(model_pdbs, model_vectors):
+            if server_vectors is None:
+                continue
+            if keep_intermediate:
+                pickle.dump(server_vectors, open(join(pathToZoomQAInput, f'{pdb}.pkl'), 'wb'))
+            input_data.append((pdb, server_vectors))
+
+    return input_data
+
+
+def featurize_targets(pathToInputs, top_n=None, pathToRandomForestPredictions=None, pathToStride=None, stride_cache=None,
+                      ss_engine='stride', feature_cache=None, max_workers=None):
+    '''
+    This method runs step 0, step 1 and step 2 on every model of many targets with one process pool. Every model of every target is
+    a job of the pool, and each target is handed back as soon as its last model is done
+
+    Parameters:
+    ----------
+    pathToInputs: list[string]
+        The folders with the pdb files of the targets
+
+    max_workers: int or None
+        The number of worker processes, None uses the number of cores
+
+    The other parameters are the ones of featurize_target, no intermediate files are kept
+
+    Returns:
+    --------
+    generator: (string, list[(string, dictionary)])
+        The input folder and the featurize_target result of every target, in the order the targets complete
+    '''
+    if pathToStride is None:
+        pathToStride = join(PATHS.sw_install, 'script/stride_linux')
+    # loaded before the pool starts so forked workers share them
+    prepare_RF_predictions(pathToRandomForestPredictions)
+    feature_plan = get_feature_plan(top_n)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ProcessPoolExecutor(max_workers, initializer=init_feature_worker,
+                                initargs=(pathToRandomForestPredictions, feature_plan)) as executor:
+        targets = {}
+        jobs = {}
+        for target_index, pathToInput in enumerate(pathToInputs):
+            try:
+                # the targets get their own step 0 folder, two inputs can have the same target name
+                model_pdbs, model_lines, model_hashes = clean_target_models(pathToInput, join(tmp_dir, str(target_index)))
+            except OSError as e:
+                print(f"Error processing {pathToInput}: {e}")
+                continue
+            feature_keys, model_vectors = get_cached_features(model_hashes, feature_cache, top_n, ss_engine,
+                                                              pathToRandomForestPredictions)
+            to_featurize = [index for index, server_vectors in enumerate(model_vectors) if server_vectors is None]
+            if not to_featurize:
+                yield pathToInput, [(pdb, server_vectors) for pdb, server_vectors in zip(model_pdbs, model_vectors)]
+                continue
+
+            targets[target_index] = {'path': pathToInput, 'pdbs': model_pdbs, 'vectors': model_vectors, 'keys': feature_keys,
+                                     'remaining': len(to_featurize)}
+            for index in to_featurize:
+                job = executor.submit(featurize_model, join(tmp_dir, str(target_index), model_pdbs[index]), model_lines[index],
+                                      model_hashes[index], pathToStride, stride_cache, ss_engine)
+                jobs[job] = (target_index, index)
+
+        for job in as_completed(jobs):
+            target_index, index = jobs[job]
+            target = targets[target_index]
+            target['vectors'][index] = job.result()
+            if feature_cache is not None and target['vectors'][index] is not None:
+                feature_cache.put(target['keys'][index], target['vectors'][index])
+
+            target['remaining'] -= 1
+            if target['remaining'] == 0:
+                del targets[target_index]
+                yield target['path'], [(pdb, server_vectors) for pdb, server_vectors in zip(target['pdbs'], target['vectors'])
+                                       if server_vectors is not None]
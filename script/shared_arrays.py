@@ -0,0 +1,82 @@
+'''
+This file is responsible for handing numpy arrays (contact maps, per residue feature arrays) between processes through shared memory.
+
+The owner copies an array once into a memory mapped file in /dev/shm (a RAM backed file system, the temporary folder is used where there
+is none) and only the handle of the array, its path, shape and dtype, is pickled to the worker. The worker maps the same file with
+attach_array, so an (L, L) contact map is never pickled or copied again. Workers can also write their results into arrays the owner
+created, so nothing is pickled on the way back either. A mapping lives as long as the array that uses it, and the file is removed when
+the owner releases the array.
+'''
+
+import os
+import tempfile
+import numpy as np
+from os.path import isdir
+
+SHARED_FOLDER = '/dev/shm' if isdir('/dev/shm') else None
+
+
+class SharedArray:
+    def __init__(self, shape=None, dtype=np.float64, values=None):
+        '''
+        Parameters:
+        ----------
+        shape: tuple or None
+            The shape of the array, None uses the shape of values
+
+        dtype: np.dtype
+            The type of the array, ignored when values are given
+
+        values: np.ndarray or None
+            The values copied into the shared array, None fills it with zeros
+        '''
+        if values is not None:
+            values = np.asarray(values)
+            shape, dtype = values.shape, values.dtype
+        dtype = np.dtype(dtype)
+
+        self.path = None
+        if int(np.prod(shape)) == 0:
+            # an empty file can not be mapped, there is nothing to share
+            self.array = np.zeros(shape, dtype=dtype)
+        else:
+            shared_file, self.path = tempfile.mkstemp(prefix='zoomqa_', suffix='.bin', dir=SHARED_FOLDER)
+            os.close(shared_file)
+            self.array = np.memmap(self.path, dtype=dtype, mode='w+', shape=shape)
+        if values is not None:
+            self.array[...] = values
+
+    @property
+    def handle(self):
+        '''
+        The (path, shape, dtype) of the array, pass it to a worker and open it with attach_array
+        '''
+        return self.path, self.array.shape, self.array.dtype.str
+
+    def release(self):
+        '''
+        This method removes the shared file, the mappings of the owner and the workers stay valid until their arrays are freed
+        '''
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+
+
+def attach_array(handle):
+    '''
+    This method maps the array of a SharedArray handle in the calling process
+
+    Parameters:
+    ----------
+    handle: tuple
+        The SharedArray.handle of the array
+
+    Returns:
+    --------
+    np.ndarray:
+        The shared array, writes are seen by the owner and the other workers
+    '''
+    path, shape, dtype = handle
+    if path is None:
+        return np.zeros(shape, dtype=np.dtype(dtype))
+    return np.memmap(path, dtype=np.dtype(dtype), mode='r+', shape=shape)
@@ -0,0 +1,399 @@
+'''
+This file is responsible for the stride free secondary structure and solvent accessibility of a model, computed with NumPy from the
+parsed coordinate arrays (see pdb_reader.py).
+
+    - the solvent accessible area of each residue is a Shrake-Rupley estimate, the atoms have the radii of stride (plus a 1.4 angstrom
+      probe) and the neighbors of each atom are found through a spatial grid
+    - the 3 state secondary structure comes from DSSP style backbone hydrogen bonds (Kabsch-Sander energy below -0.5 kcal/mol): n-turn
+      helices (H, G, I) are H, bridge partners (E, B) are E and everything else is C, the same mapping as convert_8_to_3
+
+The values are close to stride but not identical, run this file directly for the agreement report against stride on a folder of models.
+'''
+
+import os
+import sys
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from pdb_reader import get_atom_coords
+from stride_runner import RESIDUE_CODES
+
+# stride geometry.c GetAtomRadius, every other heavy atom is 1.80
+STRIDE_ATOM_RADII = {'O': 1.40, 'N': 1.65, 'CA': 1.87, 'C': 1.76}
+DEFAULT_ATOM_RADIUS = 1.80
+PROBE_RADIUS = 1.4
+
+# Kabsch-Sander electrostatic hydrogen bond energy, 0.42 * 0.20 * 332 kcal/mol
+HBOND_ENERGY_FACTOR = 0.084 * 332
+HBOND_ENERGY_CUTOFF = -0.5
+
+
+def is_hydrogen(atom_name, element=''):
+    '''
+    This method checks if an atom is a hydrogen by its element, or the way stride does (strutil.c IsHydrogen) by its name when the
+    file has no element
+    '''
+    if element:
+        return element.upper() in ('H', 'D')
+    first, second = atom_name[:1], atom_name[1:2]
+    # '' is in every string, an empty name is not a hydrogen
+    return first != '' and (first in 'HDTQ' or (first.isdigit() and second != '' and second in 'HDTQ'))
+
+
+def get_sphere_points(num_points):
+    '''
+    This method spreads points evenly over the unit sphere (golden spiral)
+
+    Returns:
+    --------
+    np.ndarray((num_points, 3)):
+        The unit vectors
+    '''
+    index = np.arange(num_points) + 0.5
+    z = 1 - 2 * index / num_points
+    radius = np.sqrt(1 - z * z)
+    theta = np.pi * (1 + 5 ** 0.5) * index
+    return np.stack([radius * np.cos(theta), radius * np.sin(theta), z], axis=1)
+
+
+def get_neighbor_pairs(coords, radii):
+    '''
+    This method finds every pair of overlapping spheres through a spatial grid with a cell edge of the largest sphere diameter
+
+    Parameters:
+    ----------
+    coords: np.ndarray((N, 3))
+        The sphere centers
+
+    radii: np.ndarray((N,))
+        The sphere radii
+
+    Returns:
+    --------
+    np.ndarray((P,)): int, np.ndarray((P,)): int
+        The two spheres of every overlapping pair (both orders are listed), sorted by the first sphere
+    '''
+    num_atoms = len(coords)
+    if num_atoms == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cell_size = 2 * radii.max()
+    cells = np.floor((coords - coords.min(axis=0)) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    cell_ids = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(cell_ids, kind='stable')
+    sorted_ids = cell_ids[order]
+
+    pairs_one, pairs_two = [], []
+    for offset in itertools.product((-1, 0, 1), repeat=3):
+        neighbor_cells = cells + np.asarray(offset)
+        valid = np.all((neighbor_cells >= 0) & (neighbor_cells < dims), axis=1)
+        neighbor_ids = (neighbor_cells[:, 0] * dims[1] + neighbor_cells[:, 1]) * dims[2] + neighbor_cells[:, 2]
+        start = np.searchsorted(sorted_ids, neighbor_ids, side='left')
+        counts = np.where(valid, np.searchsorted(sorted_ids, neighbor_ids, side='right') - start, 0)
+
+        # expand every atom into the atoms of its neighbor cell
+        one = np.repeat(np.arange(num_atoms), counts)
+        position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        two = order[np.repeat(start, counts) + position]
+
+        distance = np.linalg.norm(coords[one] - coords[two], axis=1)
+        keep = (one != two) & (distance < radii[one] + radii[two])
+        pairs_one.append(one[keep])
+        pairs_two.append(two[keep])
+
+    pairs_one, pairs_two = np.concatenate(pairs_one), np.concatenate(pairs_two)
+    pair_order = np.argsort(pairs_one, kind='stable')
+    return pairs_one[pair_order], pairs_two[pair_order]
+
+
+def calc_atom_sasa(coords, radii, num_points=200, chunk_size=20000):
+    '''
+    This method gets the Shrake-Rupley solvent accessible area of every atom
+
+    Parameters:
+    ----------
+    coords: np.ndarray((N, 3))
+        The atom coordinates
+
+    radii: np.ndarray((N,))
+        The atom radii with the probe radius added
+
+    num_points: int
+        The number of test points on each atom sphere
+
+    chunk_size: int
+        The number of neighbor pairs tested at a time, bounds the memory use
+
+    Returns:
+    --------
+    np.ndarray((N,)):
+        The accessible area of each atom in square angstroms
+    '''
+    coords = np.asarray(coords, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)
+    sphere = get_sphere_points(num_points)
+    pairs_one, pairs_two = get_neighbor_pairs(coords, radii)
+
+    buried = np.zeros((len(coords), num_points), dtype=bool)
+    for chunk in range(0, len(pairs_one), chunk_size):
+        one, two = pairs_one[chunk:chunk + chunk_size], pairs_two[chunk:chunk + chunk_size]
+        points = coords[one][:, np.newaxis, :] + radii[one][:, np.newaxis, np.newaxis] * sphere[np.newaxis]
+        inside = np.sum((points - coords[two][:, np.newaxis, :]) ** 2, axis=2) < (radii[two] ** 2)[:, np.newaxis]
+
+        # the pairs are sorted by the first atom, so each atom is one run of rows
+        starts = np.flatnonzero(np.r_[True, one[1:] != one[:-1]])
+        buried[one[starts]] |= np.logical_or.reduceat(inside, starts, axis=0)
+
+    return 4 * np.pi * radii ** 2 * (1 - buried.mean(axis=1))
+
+
+def get_residue_atoms(structure):
+    '''
+    This method selects the residues stride keeps (the ones with a CA) and their heavy atoms
+
+    Returns:
+    --------
+    np.ndarray((R,)): int, np.ndarray((N,)): bool
+        The index of every kept residue in the structure and the mask of the atoms used for the solvent accessible area
+    '''
+    has_ca = np.zeros(len(structure['res_name']), dtype=bool)
+    has_ca[structure['atom_res_index'][structure['atom_name'] == 'CA']] = True
+    heavy_atoms = np.array([not is_hydrogen(name, element) for name, element in zip(structure['atom_name'], structure['element'])],
+                           dtype=bool)
+    return np.flatnonzero(has_ca), heavy_atoms & has_ca[structure['atom_res_index']]
+
+
+def calc_residue_sasa(structure, num_points=200):
+    '''
+    This method gets the solvent accessible area of every residue with a CA, the sum over its heavy atoms
+
+    Parameters:
+    ----------
+    structure: dictionary
+        A structure from pdb_reader.read_pdb
+
+    num_points: int
+        The number of test points on each atom sphere
+
+    Returns:
+    --------
+    np.ndarray((R,)):
+        The accessible area of each residue with a CA, in structure order
+    '''
+    residues, atoms = get_residue_atoms(structure)
+    radii = np.array([STRIDE_ATOM_RADII.get(name, DEFAULT_ATOM_RADIUS) for name in structure['atom_name'][atoms]]) + PROBE_RADIUS
+    atom_sasa = calc_atom_sasa(structure['coords'][atoms], radii, num_points)
+    residue_sasa = np.bincount(structure['atom_res_index'][atoms], weights=atom_sasa, minlength=len(structure['res_name']))
+    return residue_sasa[residues]
+
+
+def _shift(matrix, row_shift, col_shift):
+    '''
+    This method gets S[i, j] = matrix[i + row_shift, j + col_shift], False outside of the matrix
+    '''
+    rows, cols = matrix.shape
+    shifted = np.zeros_like(matrix)
+    shifted[max(-row_shift, 0):rows - max(row_shift, 0), max(-col_shift, 0):cols - max(col_shift, 0)] = \
+        matrix[max(row_shift, 0):rows - max(-row_shift, 0), max(col_shift, 0):cols - max(-col_shift, 0)]
+    return shifted
+
+
+def calc_hbond_matrix(n_coords, ca_coords, c_coords, o_coords, is_proline):
+    '''
+    This method finds the backbone hydrogen bonds with the DSSP electrostatic energy
+
+    Parameters:
+    ----------
+    n_coords, ca_coords, c_coords, o_coords: np.ndarray((L, 3))
+        The backbone atoms of every residue, nan where missing
+
+    is_proline: np.ndarray((L,)): bool
+        Prolines have no backbone hydrogen
+
+    Returns:
+    --------
+    np.ndarray((L, L)): bool
+        [i, j] is True if the C=O of residue i accepts a hydrogen bond from the N-H of residue j
+    '''
+    num_residues = len(n_coords)
+    h_coords = np.full((num_residues, 3), np.nan)
+    if num_residues > 1:
+        # the hydrogen sits 1 angstrom from N, parallel to the C=O of the previous residue (DSSP)
+        co = c_coords[:-1] - o_coords[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h_coords[1:] = n_coords[1:] + co / np.linalg.norm(co, axis=1)[:, np.newaxis]
+        # no hydrogen across a chain break
+        peptide_bond = np.linalg.norm(n_coords[1:] - c_coords[:-1], axis=1)
+        h_coords[1:][~(peptide_bond < 2.5)] = np.nan
+    h_coords[is_proline] = np.nan
+
+    def _distances(acceptor, donor):
+        return np.linalg.norm(acceptor[:, np.newaxis, :] - donor[np.newaxis, :, :], axis=2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        energy = HBOND_ENERGY_FACTOR * (1 / _distances(o_coords, n_coords) + 1 / _distances(c_coords, h_coords) -
+                                        1 / _distances(o_coords, h_coords) - 1 / _distances(c_coords, n_coords))
+        close = _distances(ca_coords, ca_coords) < 9.0
+
+    index = np.arange(num_residues)
+    return (energy < HBOND_ENERGY_CUTOFF) & close & (np.abs(index[:, np.newaxis] - index[np.newaxis, :]) >= 2)
+
+
+def assign_secondary_structure(hbonds):
+    '''
+    This method assigns the 3 state secondary structure from the hydrogen bond matrix
+
+    Parameters:
+    ----------
+    hbonds: np.ndarray((L, L)): bool
+        The output of calc_hbond_matrix
+
+    Returns:
+    --------
+    np.ndarray((L,)): <U1
+        H for the 4, 3 and 5 turn helices, E for bridge partners (parallel or antiparallel), C otherwise. The alpha helix wins over
+        the strands and the strands win over the 3 and 5 turn helices, like the DSSP priority
+    '''
+    num_residues = len(hbonds)
+    helices = {}
+    for turn in (3, 4, 5):
+        turns = np.zeros(num_residues, dtype=bool)
+        turns[:num_residues - turn] = hbonds[np.arange(num_residues - turn), np.arange(turn, num_residues)]
+        # two consecutive n-turns at i-1 and i make residues i .. i+n-1 helical
+        starts = np.zeros(num_residues, dtype=bool)
+        starts[1:] = turns[:-1] & turns[1:]
+        helix = np.zeros(num_residues, dtype=bool)
+        for offset in range(turn):
+            helix[offset:] |= starts[:num_residues - offset]
+        helices[turn] = helix
+
+    transposed = hbonds.T
+    parallel = (_shift(hbonds, -1, 0) & _shift(transposed, 1, 0)) | (_shift(transposed, 0, -1) & _shift(hbonds, 0, 1))
+    antiparallel = (hbonds & transposed) | (_shift(hbonds, -1, 1) & _shift(transposed, 1, -1))
+    index = np.arange(num_residues)
+    bridges = (parallel | antiparallel) & (np.abs(index[:, np.newaxis] - index[np.newaxis, :]) >= 3)
+
+    ss = np.full(num_residues, 'C', dtype='<U1')
+    ss[helices[3] | helices[5]] = 'H'
+    ss[bridges.any(axis=1)] = 'E'
+    ss[helices[4]] = 'H'
+    return ss
+
+
+def calc_secondary_structure(structure):
+    '''
+    This method gets the 3 state secondary structure of every residue with a CA
+
+    Parameters:
+    ----------
+    structure: dictionary
+        A structure from pdb_reader.read_pdb
+
+    Returns:
+    --------
+    np.ndarray((R,)): <U1
+        The secondary structure of each residue with a CA, in structure order
+    '''
+    residues, _ = get_residue_atoms(structure)
+    n, ca, c, o = [get_atom_coords(structure, atom)[0][residues].astype(np.float64) for atom in ('N', 'CA', 'C', 'O')]
+    hbonds = calc_hbond_matrix(n, ca, c, o, structure['res_name'][residues] == 'PRO')
+    return assign_secondary_structure(hbonds)
+
+
+def calc_ss_sasa(structure, num_points=200):
+    '''
+    This method replaces stride for one model
+
+    Parameters:
+    ----------
+    structure: dictionary
+        A structure from pdb_reader.read_pdb
+
+    num_points: int
+        The number of test points on each atom sphere for the solvent accessible area
+
+    Returns:
+    --------
+    np.ndarray((L,)): <U1, np.ndarray((L,)): <U1, np.ndarray((L,)): float64
+        The same arrays as stride_runner.parse_stride_output: the 3 state secondary structure, the amino acid and the solvent
+        accessible area of every recognized residue with a CA
+    '''
+    residues, _ = get_residue_atoms(structure)
+    ss = calc_secondary_structure(structure)
+    sol = calc_residue_sasa(structure, num_points)
+
+    res_names = [name.upper() for name in structure['res_name'][residues]]
+    known = np.array([name in RESIDUE_CODES for name in res_names], dtype=bool)
+    for name in sorted(set(name for name, is_known in zip(res_names, known) if not is_known)):
+        print("Warning, the residue " + name + " is not recognized, skip it")
+
+    aa = np.array([RESIDUE_CODES[name] for name, is_known in zip(res_names, known) if is_known], dtype='<U1')
+    return ss[known], aa, np.round(sol[known], 1)
+
+
+def calc_ss_sasa_models(structures, num_points=200, max_workers=None):
+    '''
+    This method runs calc_ss_sasa on many models with a thread pool, the NumPy work releases the GIL
+
+    Returns:
+    --------
+    list: [(np.ndarray, np.ndarray, np.ndarray) or None]
+        The calc_ss_sasa result of every model, in order, None for a model that failed (the other models are still computed)
+    '''
+    def calc_model(index, structure):
+        try:
+            return calc_ss_sasa(structure, num_points)
+        except Exception as e:
+            print(f"Error computing the secondary structure and solvent accessibility of model {index}: {e}")
+            return None
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(calc_model, itertools.count(), structures))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("This script compares the NumPy secondary structure and solvent accessibility with stride on a folder of models")
+        print(f"python {sys.argv[0]} ./script/stride_linux ./QA_examples/Input/T1096")
+        sys.exit(0)
+
+    import tempfile
+    from os.path import join
+    from pdb_reader import read_pdb_lines
+    from pdb_cleanup import clean_pdb
+    from stride_runner import run_stride_models
+
+    strideTool = sys.argv[1]
+    pathToInput = sys.argv[2]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_names = sorted(os.listdir(pathToInput))
+        model_lines = [clean_pdb(join(pathToInput, model), join(tmp_dir, model)) for model in model_names]
+        stride_results = run_stride_models([join(tmp_dir, model) for model in model_names], strideTool)
+    engine_results = calc_ss_sasa_models([read_pdb_lines(lines) for lines in model_lines])
+
+    print(f"{'model':<30}{'residues':>10}{'ss agree':>10}{'H agree':>10}{'E agree':>10}{'sol r':>8}{'sol mae':>9}")
+    all_ss, all_sol = [], []
+    for model, (stride_ss, stride_aa, stride_sol), engine_result in zip(model_names, stride_results, engine_results):
+        if engine_result is None:
+            print(f"{model:<30} failed, skipped")
+            continue
+        ss, aa, sol = engine_result
+        if len(stride_aa) != len(aa) or np.any(stride_aa != aa):
+            print(f"{model:<30} the residues differ from stride ({len(stride_aa)} vs {len(aa)}), skipped")
+            continue
+        agree = ss == stride_ss
+        all_ss.append(agree)
+        all_sol.append((stride_sol, sol))
+        state_agree = [np.mean(agree[stride_ss == state]) if np.any(stride_ss == state) else np.nan for state in 'HE']
+        print(f"{model:<30}{len(aa):>10}{np.mean(agree):>10.3f}{state_agree[0]:>10.3f}{state_agree[1]:>10.3f}"
+              f"{np.corrcoef(stride_sol, sol)[0, 1]:>8.3f}{np.mean(np.abs(stride_sol - sol)):>9.2f}")
+
+    if all_ss:
+        stride_sol, sol = [np.concatenate(values) for values in zip(*all_sol)]
+        print(f"{'all':<30}{len(sol):>10}{np.mean(np.concatenate(all_ss)):>10.3f}{'':>20}"
+              f"{np.corrcoef(stride_sol, sol)[0, 1]:>8.3f}{np.mean(np.abs(stride_sol - sol)):>9.2f}")
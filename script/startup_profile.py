@@ -0,0 +1,92 @@
+'''
+This file is responsible for the --startup-profile report of prediction.py, the time spent importing every module.
+
+start_import_profile puts a finder in front of sys.meta_path that times the loading (create_module and exec_module) of every module
+imported after it, the same measurement as python -X importtime: the cumulative time of a module includes the modules it imports, its
+self time does not. print_import_profile prints the modules with the largest cumulative times.
+'''
+
+import sys
+from timeit import default_timer as timer
+
+# (module name, self seconds, cumulative seconds, import depth) of every module loaded while profiling
+import_times = []
+# the time spent in the imports of the modules being loaded, one entry per level
+import_stack = []
+profile_start = None
+
+
+class _TimedLoader:
+    def __init__(self, loader):
+        self.loader = loader
+        self.start = None
+
+    def __getattr__(self, attribute):
+        return getattr(self.loader, attribute)
+
+    def _finish(self, name):
+        elapsed = timer() - self.start
+        children = import_stack.pop()
+        if import_stack:
+            import_stack[-1] += elapsed
+        import_times.append((name, elapsed - children, elapsed, len(import_stack)))
+
+    def create_module(self, spec):
+        import_stack.append(0.0)
+        self.start = timer()
+        try:
+            return self.loader.create_module(spec)
+        except BaseException:
+            self._finish(spec.name)
+            raise
+
+    def exec_module(self, module):
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self._finish(module.__name__)
+            # the module keeps its real loader, only the first load is timed
+            module.__loader__ = self.loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self.loader
+
+
+class _ImportTimer:
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def start_import_profile():
+    '''
+    This method starts timing the modules imported from now on
+    '''
+    global profile_start
+    if profile_start is None:
+        profile_start = timer()
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def print_import_profile(num_modules=30):
+    '''
+    This method prints the total import time and the num_modules modules with the largest cumulative import times
+
+    Parameters:
+    ----------
+    num_modules: int
+        The number of modules listed
+    '''
+    if profile_start is None:
+        return
+    total = sum(cumulative for name, self_time, cumulative, depth in import_times if depth == 0)
+    print(f"Startup profile: {len(import_times)} modules imported in {total:.3f}s, {timer() - profile_start:.3f}s since the profile started")
+    print(f"{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for name, self_time, cumulative, depth in sorted(import_times, key=lambda entry: -entry[2])[:num_modules]:
+        print(f"{cumulative * 1000:16.1f} {self_time * 1000:10.1f}  {'  ' * depth}{name}")
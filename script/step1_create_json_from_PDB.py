@@ -33,11 +33,6 @@ import sys
 import os
 import numpy
 from os import path
-import Bio.PDB
-from Bio.PDB import *
-import math
-from PeptideBuilder import Geometry
-import PeptideBuilder
 from os import listdir
 try:
     import cPickle as pickle
@@ -45,127 +40,68 @@ except ImportError:  # python 3.x
     import pickle
 import json
 
+from pdb_reader import read_pdb, get_atom_coords
+from backbone_geometry import calc_backbone_geometry
+from binary_model_data import save_model_data
+from stride_runner import run_stride_models
+from ss_sasa_engine import calc_ss_sasa_models
+
 resdict = { 'ALA': 'A', 'CYS': 'C', 'ASP': 'D', 'GLU': 'E', 'PHE': 'F', \
 	    'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LYS': 'K', 'LEU': 'L', \
 	    'MET': 'M', 'ASN': 'N', 'PRO': 'P', 'GLN': 'Q', 'ARG': 'R', \
 	    'SER': 'S', 'THR': 'T', 'VAL': 'V', 'TRP': 'W', 'TYR': 'Y' }
 
-def extract_backbone_model(pdb_path):
-    parser=PDBParser()
-    structure=parser.get_structure('sample', pdb_path)
-    model=structure[0]
-    chain=model['A']
-    prev="0"
-    N_prev="0"
-    CA_prev="0"
-    CO_prev="0"
-    ##O_prev="0"
-    prev_res=""
-    rad=180.0/math.pi
-
-    result = dict() 
-    result['CA_C_N_angle'] = []
-    result['C_N_CA_angle'] = []
-    result['CA_N_length'] = []
-    result['CA_C_length'] = [] 
-    result['peptide_bond'] = []
-    result['psi_im1'] = []
-    result['omega'] = []
-    result['phi'] = []
-    result['CA_N_length'] = []
-    result['CA_C_length'] = []
-    result['N_CA_C_angle'] = []
-    ### now first print the headers, please filter them when you really load the file ###
-    #headers = "# residue CA_C_N_angle C_N_CA_angle CA_N_length CA_C_length peptide_bond psi_im1 omega phi CA_N_length CA_C_length N_CA_C_angle\n"
-    
-    for res in chain:
-        if(res.get_resname() in resdict.keys()):
-            geo=Geometry.geometry(resdict[res.get_resname()])
-            if(prev=="0"):
-                 N_prev=res['N']
-                 CA_prev=res['CA']
-                 C_prev=res['C']
-                 ##O_prev=res['O']
-                 prev="1"
-            else:
-                 n1=N_prev.get_vector()
-                 ca1=CA_prev.get_vector()
-                 c1=C_prev.get_vector()
-                 ##o1=O_prev.get_vector()
-
-                 ##O_curr=res['O']
-                 C_curr=res['C']
-                 N_curr=res['N']
-                 CA_curr=res['CA']
-
-                 ##o=O_curr.get_vector()
-                 c=C_curr.get_vector()
-                 n=N_curr.get_vector()
-                 ca=CA_curr.get_vector()
-
-                 geo.CA_C_N_angle=calc_angle(ca1, c1, n)*rad
-                 geo.C_N_CA_angle=calc_angle(c1, n, ca)*rad
-                 geo.CA_N_length= CA_curr-N_curr
-                 geo.CA_C_length= CA_curr-C_curr
-                 geo.peptide_bond= N_curr-C_prev
-
-                 psi= calc_dihedral(n1, ca1, c1, n) ##goes to current res
-                 omega= calc_dihedral(ca1, c1, n, ca) ##goes to current res
-                 phi= calc_dihedral(c1, n, ca, c) ##goes to current res
-
-                 geo.psi_im1=psi*rad
-                 geo.omega=omega*rad
-                 geo.phi=phi*rad
-
-                 geo.CA_N_length= CA_curr - N_curr
-                 geo.CA_C_length= CA_curr - C_curr
-                 ##geo.C_O_length= C_curr - O_curr
-
-                 geo.N_CA_C_angle= calc_angle(n, ca, c)*rad
-                 ##geo.CA_C_O_angle= calc_angle(ca, c, o)*rad
-
-                 ##geo.N_CA_C_O= calc_dihedral(n, ca, c, o)*rad
-
-                 N_prev=res['N']
-                 CA_prev=res['CA']
-                 C_prev=res['C']
-                 ##O_prev=res['O']
-            # now add angles to result
-            result['CA_C_N_angle'].append(str(geo.CA_C_N_angle))
-            result['C_N_CA_angle'].append(str(geo.C_N_CA_angle))
-            result['CA_N_length'].append(str(geo.CA_N_length))
-            result['CA_C_length'].append(str(geo.CA_C_length))
-            result['peptide_bond'].append(str(geo.peptide_bond))
-            result['psi_im1'].append(str(geo.psi_im1))
-            result['omega'].append(str(geo.omega))	
-            result['phi'].append(str(geo.phi))
-            result['CA_N_length'].append(str(geo.CA_N_length))
-            result['CA_C_length'].append(str(geo.CA_C_length))
-            result['N_CA_C_angle'].append(str(geo.N_CA_C_angle))
-    return result
+def extract_backbone_model(structure):
+    """Returns the backbone geometry (see backbone_geometry.calc_backbone_geometry) of every standard residue as lists of floats.
+    structure is a parsed structure from pdb_reader.read_pdb (or the path to a PDB file), raises KeyError if a residue misses N, CA or C"""
+    if isinstance(structure, str):
+        structure = read_pdb(structure)
+    standard = numpy.array([res_name in resdict for res_name in structure['res_name']], dtype=bool)
+    backbone = []
+    for atom_name in ['N', 'CA', 'C']:
+        atom_coords, has_atom = get_atom_coords(structure, atom_name)
+        if not numpy.all(has_atom[standard]):
+            raise KeyError(atom_name)
+        backbone.append(atom_coords[standard])
+    sequence = [resdict[res_name] for res_name in structure['res_name'][standard]]
+    result = calc_backbone_geometry(backbone[0], backbone[1], backbone[2], sequence)
+    return {key: values.tolist() for key, values in result.items()}
 
 def calc_residue_dist(residue_one, residue_two) :
     """Returns the C-alpha distance between two residues"""
     diff_vector  = residue_one["CA"].coord - residue_two["CA"].coord
     return numpy.sqrt(numpy.sum(diff_vector * diff_vector))
 
-def calc_dist_matrix(chain_one, chain_two) :
-    """Returns a matrix of C-alpha distances between two chains"""
-    answer = numpy.zeros((len(chain_one), len(chain_two)), numpy.float)
-    for row, residue_one in enumerate(chain_one) :
-        for col, residue_two in enumerate(chain_two) :
-            if row <= col:
-                answer[row, col] = calc_residue_dist(residue_one, residue_two)
-            else:
-                answer[row, col] = answer[col, row]
+def extract_ca_coords(chain):
+    """Returns the (L, 3) C-alpha coordinates of every residue in a chain, raises KeyError if a residue has no CA"""
+    return numpy.array([residue["CA"].coord for residue in chain])
+
+def calc_dist_matrix_from_coords(ca_coords, other_coords=None, dtype=numpy.float64, block_size=1024):
+    """Returns the matrix of C-alpha distances between two (L, 3) coordinate arrays, other_coords defaults to ca_coords.
+    Rows are computed block_size at a time so the temporary memory stays at block_size * L * 3 values for very long chains,
+    the distances are computed in the precision of the coordinates and stored as dtype (float32 or float64)"""
+    ca_coords = numpy.asarray(ca_coords)
+    other_coords = ca_coords if other_coords is None else numpy.asarray(other_coords)
+    answer = numpy.empty((len(ca_coords), len(other_coords)), dtype)
+    for start in range(0, len(ca_coords), block_size):
+        diff_block = ca_coords[start:start + block_size, numpy.newaxis, :] - other_coords[numpy.newaxis, :, :]
+        answer[start:start + block_size] = numpy.sqrt(numpy.sum(diff_block * diff_block, axis=2))
     return answer
 
-def extract_contacts_model(pdb_path):
-    parser=PDBParser()
-    structure=parser.get_structure('sample', pdb_path)
-    model=structure[0]
-    chain=model['A']
-    dist_matrix = calc_dist_matrix(model["A"], model["A"])
+def calc_dist_matrix(chain_one, chain_two, dtype=numpy.float64) :
+    """Returns a matrix of C-alpha distances between two chains"""
+    coords_one = extract_ca_coords(chain_one)
+    coords_two = coords_one if chain_two is chain_one else extract_ca_coords(chain_two)
+    return calc_dist_matrix_from_coords(coords_one, coords_two, dtype)
+
+def extract_contacts_model(structure, dtype=numpy.float64):
+    """structure is a parsed structure from pdb_reader.read_pdb (or the path to a PDB file), raises KeyError if a residue has no CA"""
+    if isinstance(structure, str):
+        structure = read_pdb(structure)
+    ca_coords, has_ca = get_atom_coords(structure, 'CA')
+    if not numpy.all(has_ca):
+        raise KeyError('CA')
+    dist_matrix = calc_dist_matrix_from_coords(ca_coords, dtype=dtype)
     return dist_matrix
 
 #   H,G,I -> H
@@ -199,6 +135,42 @@ def extract_ss(pdb_path, tool_path):
         sol.append(float(tem[9]))
     return (ss, aa, sol)
 
+def extract_model_data(pdbPath, strideTool, structure=None, ss_data=None):
+    """Returns the step 1 data of one model (the value stored for each model of a target), None if the model is skipped.
+    The ContactMap is a numpy array. structure is the model already parsed by pdb_reader (e.g. from the cleaned lines of
+    pdb_cleanup), None reads pdbPath. ss_data is the (ss, aa, sol) stride result from stride_runner, None runs stride here"""
+    F_GDT = -1
+    # extract all secondary structure, amino acid, and solvent accessibility
+    if ss_data is not None:
+        (F_ss, F_aa, F_sol) = [numpy.asarray(values).tolist() for values in ss_data]
+    else:
+        (F_ss, F_aa, F_sol) = extract_ss(pdbPath, strideTool)
+    # parse the model once, the contact map and the backbone angles share it
+    F_structure = structure if structure is not None else read_pdb(pdbPath)
+    F_localQA = []
+    for j in range(len(F_ss)):
+       F_localQA.append(-1)     # we don't know the local QA score, put -1 
+    try:
+       F_dis_matrix = extract_contacts_model(F_structure)
+    except:
+       print("Error to extract contact map, use 0 "+pdbPath)
+       F_dis_matrix = numpy.zeros((len(F_ss), len(F_ss)), numpy.float64)
+    # now we need to get all angles information, and we are done for this model!
+    try:
+        F_backboneAngles = extract_backbone_model(F_structure)
+    except:
+        print("This model "+pdbPath+" may only contains CA, we skip those kind of models for now")
+        return None
+    model_data = dict()
+    model_data['GDT'] = F_GDT
+    model_data['localQA'] = F_localQA
+    model_data['ss'] = F_ss
+    model_data['aa'] = F_aa
+    model_data['sol'] = F_sol
+    model_data['ContactMap'] = F_dis_matrix
+    model_data['Angles'] = F_backboneAngles
+    return model_data
+
 
 if __name__ == "__main__":
     if(len(sys.argv)<3):
@@ -207,11 +179,14 @@ if __name__ == "__main__":
        print("This script need three inputs, the first is the Stride exe file, the second is directory for all targets like CASP5, the second is the output directory for json file. \n")
        print("For example:\n")
        print("python "+sys.argv[0]+" ./stride ../test/CASP5 ../test/json_CASP5")
+       print("Use numpy instead of the Stride exe file to assign the secondary structure and solvent accessibility without stride (see ss_sasa_engine.py)")
+       print("An optional fourth input 'json' saves the old json file, by default each target is saved as a binary directory (see binary_model_data.py)")
        sys.exit(0)
     strideTool = sys.argv[1] 
     inputDir = sys.argv[2]
     #LGAScoreDir = sys.argv[3]
     outputDir = sys.argv[3]
+    outputFormat = sys.argv[4] if len(sys.argv) > 4 else "binary"
     #outFilePath = outputDir+"/"+inputDir.split('/')[-1]+".json"
     #DB = dict()
     try:
@@ -219,7 +194,9 @@ if __name__ == "__main__":
     except:
        os.mkdir(outputDir)
     for targetName in listdir(inputDir):
-        outFilePath = outputDir+"/"+inputDir.split('/')[-1]+"_"+targetName+".json"
+        outFilePath = outputDir+"/"+inputDir.split('/')[-1]+"_"+targetName
+        if outputFormat == "json":
+            outFilePath += ".json"
         DB = dict()
         checkRun = outFilePath+".tmpRun"
         if os.path.exists(checkRun):
@@ -229,57 +206,38 @@ if __name__ == "__main__":
             fh1.write("I am running ...")
             fh1.close()
         #GDTdict = loadGDT(GDTallPath)  # we don't know the GDT score for prediction
-        for modelName in listdir(inputDir+"/"+targetName):
-            pdbPath = inputDir+"/"+targetName+"/"+modelName
+        modelNames = listdir(inputDir+"/"+targetName)
+        modelPaths = [inputDir+"/"+targetName+"/"+modelName for modelName in modelNames]
+        if strideTool == "numpy":
+            modelStructures = [read_pdb(pdbPath) for pdbPath in modelPaths]
+            strideResults = calc_ss_sasa_models(modelStructures)
+        else:
+            # stride runs on all models of the target at the same time
+            modelStructures = [None] * len(modelPaths)
+            strideResults = run_stride_models(modelPaths, strideTool)
+        for modelName, pdbPath, modelStructure, ssData in zip(modelNames, modelPaths, modelStructures, strideResults):
             print("processing "+pdbPath)
+            if ssData is None and strideTool == "numpy":
+                print("Error to extract the secondary structure of "+pdbPath+", skip it")
+                continue
             uniqKey = targetName + ":" + modelName   # don't use tuple as key for the dictionary for keep all of our information, use X:X because we use NMA tool to expand models, there would be duplicated targetName, but those two would be unique, only the native casp pdb would overlap, but I guess we could keep one of them, it's fine
-            F_GDT = -1
-            # extract all secondary structure, amino acid, and solvent accessibility
-            (F_ss, F_aa, F_sol) = extract_ss(pdbPath, strideTool)
-            F_localQA = []
-            for j in range(len(F_ss)):
-               F_localQA.append(-1)     # we don't know the local QA score, put -1 
-            try:
-               F_dis_matrix = extract_contacts_model(pdbPath).tolist()
-            except:
-               print("Error to extract contact map, use 0 "+pdbPath)
-               F_dis_matrix = numpy.zeros((len(F_ss), len(F_ss)), numpy.float)
-            # now we need to get all angles information, and we are done for this model!
-            try:
-                F_backboneAngles = extract_backbone_model(pdbPath)
-            except:
-                print("This model "+pdbPath+" may only contains CA, we skip those kind of models for now")
+            model_data = extract_model_data(pdbPath, strideTool, modelStructure, ssData)
+            if model_data is None:
                 continue
             print("Adding ...") 
-            DB[uniqKey] = dict()
-            DB[uniqKey]['GDT'] = F_GDT
-            DB[uniqKey]['localQA'] = F_localQA
-            DB[uniqKey]['ss'] = F_ss
-            DB[uniqKey]['aa'] = F_aa
-            DB[uniqKey]['sol'] = F_sol
-            DB[uniqKey]['ContactMap'] = F_dis_matrix
-            DB[uniqKey]['Angles'] = F_backboneAngles
-            #print(pdbPath)
-            #print(F_GDT)
-            #print(F_localQA)
-            #print(F_ss)
-            #print(F_aa)
-            #print(F_sol)
-            #print(F_dis_matrix)
-            #print(F_backboneAngles)
-            #print(len(F_localQA))
-            #print(len(F_ss))
-            #print(len(F_aa))
-            #print(len(F_sol))
-            #print(len(F_dis_matrix))
-            #print(len(F_backboneAngles['CA_C_N_angle']))
-            #sys.exit(0)
+            if outputFormat == "json":
+                model_data['ContactMap'] = model_data['ContactMap'].tolist()
+                DB[uniqKey] = model_data
+            else:
+                # binary models are written as soon as they are done instead of holding the whole target
+                save_model_data(outFilePath+"/"+modelName, uniqKey, model_data)
         # now store everything in a json file
         #print("Now we have the following:")
         #for each in DB:
         #   print(each)
         #   print(DB[each]) 
-        with open(outFilePath, 'w') as fp:
-           json.dump(DB, fp)
+        if outputFormat == "json":
+            with open(outFilePath, 'w') as fp:
+               json.dump(DB, fp)
         #pickle.dump(str(DB), fp, protocol=pickle.HIGHEST_PROTOCOL)
     # now you could load it back using : json.load
@@ -48,12 +48,15 @@ import pickle
 import traceback
 import numpy as np
 from os.path import join, getsize
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 
 from paths import PATHS
+from binary_model_data import is_binary_target, iter_target_data
+from shared_arrays import SharedArray, attach_array
 
 sys.path.insert(1, join(PATHS.sw_install, './script/assist_generation_scripts'))
 
+from radius_shell_features import *
 from amino_acid_density_change import *
 from hydrophobicity_change import *
 from mass_change import *
@@ -64,9 +67,11 @@ from make_random_forest_predictions import *
 from non_change_features import *
 from contact_statistics import *
 from structure_contact import *
+from feature_plan import *
+from residue_blocks import compute_residue_features, CONTACT_STAT_FAMILIES
 
 
-def process_target(target_path, pathToSave):
+def process_target(target_path, pathToSave, feature_plan=None):
     '''
     This method compiles all of the data from the scripts in assist_generation_scripts
     and compiles them into a dictionary with the following structure:
@@ -74,7 +79,7 @@ def process_target(target_path, pathToSave):
     Parameters:
     ----------
     target_path: string
-        path to a json target file from Dr. Cao's JSON Database
+        path to a json target file from Dr. Cao's JSON Database, or a binary target directory from step 1
 
     File: (dictionary)
         Keys -> index in sequence
@@ -119,66 +124,173 @@ def process_target(target_path, pathToSave):
                 - 'structure_contact_matrix' a 21x20 matrix. Row 0 represents the weighted contact frequency of the center in relation to all the
                    amino acids (the columns) at radius 5. Row 1 is at radius 6 and so on.
 
+    feature_plan: dictionary or None
+        The plan from feature_plan.compile_feature_plan, only the feature families and radii in the plan are computed.
+        None computes every feature (e.g. for training data)
+
     This is then saved to the pathToSave location
     '''
-    json_data = load_json_file(target_path)
+    target_save = get_target_save_path(target_path, pathToSave)
+    for server, server_data in iter_target_models(target_path):
+        save_server_vectors(server, server_data, target_save, feature_plan)
+
+
+def generate_server_vectors(server_data, feature_plan=None, max_workers=1):
+    '''
+    This method generates the per residue feature dictionaries for one server prediction, see process_target for the keys
+
+    Parameters:
+    ----------
+    server_data: dictionary
+        One server prediction of a target from Dr. Cao's JSON Database
+
+    feature_plan: dictionary or None
+        The plan from feature_plan.compile_feature_plan. Families outside of the plan are not computed and are stored as nan
+        (see feature_plan.get_unplanned_feature), radii outside of the plan are nan. None computes every feature
+
+    max_workers: int or None
+        The number of worker processes the contact map features of a very long model are split between (see residue_blocks.py),
+        None uses the number of cores and 1 computes them in this process
+
+    Returns:
+    ---------
+    dictionary:
+        key -> index in sequence
+        value -> dictionary of the features of that residue
+    '''
+    if feature_plan is None:
+        feature_plan = get_full_feature_plan()
+
+    sequence = server_data['aa']
+    aa_data = aa_change_from_json(server_data) if 'aa_density_change' in feature_plan else None
+
+    # hydro, mass and sol share one pass of the radius shell engine
+    shell_families = [(family, get_values) for family, get_values in
+                      [('hydro_change', get_hydro_values), ('mass_change', get_mass_values), ('sol_change', get_sol_values)]
+                      if family in feature_plan]
+    shell_values = np.stack([get_values(server_data) for _, get_values in shell_families], axis=1) if shell_families else None
+    planned_contact_stats = any(family in feature_plan for family in CONTACT_STAT_FAMILIES)
+
+    # every contact map feature is computed block by block of residues, in parallel for very long models
+    residue_features = compute_residue_features(server_data['ContactMap'], sequence, shell_values, feature_plan.get('iso_change'),
+                                                feature_plan.get('structure_contact_matrix'), planned_contact_stats, max_workers)
+
+    shell_data = {}
+    for feature, (family, _) in enumerate(shell_families):
+        shell_data[family] = radius_means_to_dict(residue_features['shell_means'][:, :, feature])
+
+    iso_data = radius_means_to_dict(normalize_isoelectric_points(residue_features['iso_points'])) if 'iso_points' in residue_features \
+        else None
+
+    server_vectors = vectorize_pdb_data(aa_data, shell_data.get('hydro_change'), shell_data.get('mass_change'),
+                                        shell_data.get('sol_change'), iso_data, sequence)
+
+    psi_phi = get_psi_phi(server_data)
+    # the random forest predictions of every residue in one lookup, (L, 4)
+    rf_predictions = get_predictions(psi_phi[0], psi_phi[1], sequence).tolist()
+    unplanned_families = [family for family, _ in FEATURE_FAMILIES if family not in feature_plan]
+    for index in server_vectors.keys():
+        # add a few comments here to describe what it adds
+        server_vectors[index]['rf_predictions'] = tuple(rf_predictions[index])
+
+        non_change_data = get_non_change_features(server_data, index, psi_phi)
+        for key, data_values in non_change_data.items():
+            server_vectors[index][key] = data_values
+
+        if planned_contact_stats:
+            for key in CONTACT_STAT_FAMILIES:
+                server_vectors[index][key] = residue_features[key][index]
+
+        if 'structure_contact_matrix' in residue_features:
+            server_vectors[index]['structure_contact_matrix'] = residue_features['structure_contact_matrix'][index]
+
+        # families the model never looks at are stored as nan so the SVR input keeps its shape
+        for family in unplanned_families:
+            server_vectors[index][family] = get_unplanned_feature(family)
+
+    return server_vectors
+
+
+def get_target_save_path(target_path, pathToSave):
+    '''
+    This method creates the pathToSave/CASP/TARGET folder of a step 1 target and returns it
+    '''
     casp_name = target_path.split("/")[-1].split("_")[0]
     target_name = target_path.split("_")[-1]
     create_file(join(pathToSave, casp_name))
     create_file(join(pathToSave, casp_name, target_name))
-    for server, server_data in json_data.items():
-        try:
+    return join(pathToSave, casp_name, target_name)
 
-            server_name = server.split(":")[-1]
-            server_save = join(pathToSave, casp_name, target_name, f"{server_name}.pkl")
 
-            sequence = server_data['aa']
-            aa_data = aa_change_from_json(server_data)
-            hydro_data = hydro_change_from_json(server_data)
-            mass_data = mass_change_from_json(server_data)
-            sol_data = sol_change_from_json(server_data)
-            iso_data = iso_change_from_json(server_data)
+def save_server_vectors(server, server_data, target_save, feature_plan=None):
+    '''
+    This method generates the feature vectors of one server prediction and saves them to target_save/SERVER.pkl
 
-            server_vectors = vectorize_pdb_data(aa_data, hydro_data, mass_data, sol_data, iso_data, sequence)
+    Returns:
+    ---------
+    string or None:
+        The server name, None if the features could not be generated
+    '''
+    server_name = server.split(":")[-1]
+    try:
+        server_save = join(target_save, f"{server_name}.pkl")
 
-            for index in server_vectors.keys():
-                # add a few comments here to describe what it adds
+        server_vectors = generate_server_vectors(server_data, feature_plan)
 
-                local_qa = server_data['localQA'][index]
-                sequence_aa = server_data['aa'][index]
-                local_ss = server_data['ss'][index]
+        pickle.dump(server_vectors, open(server_save, 'wb'))
+        print(f"Saved {server_name} to {server_save}")
+        return server_name
+    except Exception as e:
+        print(f"Error creating {server_name} of {target_save}: {e}")
+        return None
 
-                local_psi, local_phi = int(float(server_data['Angles']['psi_im1'][index])), int(
-                    float(server_data['Angles']['phi'][index]))
-                rf_predictions = get_prediction((local_psi + 180), (local_phi + 180),
-                                                sequence_aa)  # have to add 180 because its in a ramachandran plot
-                server_vectors[index]['rf_predictions'] = rf_predictions
 
-                non_change_data = get_non_change_features(server_data, index)
-                for key, data_values in non_change_data.items():
-                    server_vectors[index][key] = data_values
+def process_model(server, server_data, contact_map_handle, target_save, feature_plan=None):
+    '''
+    This method is the work unit of main, it generates and saves the feature vectors of one server prediction of a target
 
-                radius_change_statistics = get_contact_stats(server_data, index)
-                for key, data_values in radius_change_statistics.items():
-                    server_vectors[index][key] = data_values
+    Parameters:
+    ----------
+    server_data: dictionary
+        The step 1 data of the server prediction without its 'ContactMap'
 
-                structure_contact_matrix = get_protein_contact_frequeny(server_data, index)
-                server_vectors[index]['structure_contact_matrix'] = structure_contact_matrix
+    contact_map_handle: tuple
+        The shared_arrays.SharedArray handle of the contact map
 
-            pickle.dump(server_vectors, open(server_save, 'wb'))
-            print(f"Saved {server_name} to {server_save}")
-        except Exception as e:
-            print(f"Error creating {target_name}")
+    Returns:
+    ---------
+    string or None:
+        The server name, None if the features could not be generated
+    '''
+    server_data['ContactMap'] = attach_array(contact_map_handle)
+    return save_server_vectors(server, server_data, target_save, feature_plan)
 
 
 def load_json_file(target_path):
     return json.load(open(target_path))
 
 
-def main(pathToData, pathToRandomForestPredictions, pathToSave):
+def iter_target_models(target_path):
+    '''
+    This method yields the (TARGET:MODEL key, data) of every model of a step 1 target, either a binary target directory (memory mapped,
+    see binary_model_data.py) or a JSON file. The models of a binary target directory are only read when they are reached
+    '''
+    if is_binary_target(target_path):
+        yield from iter_target_data(target_path)
+    else:
+        yield from load_json_file(target_path).items()
+
+
+def main(pathToData, pathToRandomForestPredictions, pathToSave, top_n=None):
     # load the random forest models so we don't have to distribute a list of them
     load_RF_predictions(pathToRandomForestPredictions)
 
+    # only compute the features the top n ranked SVR inputs need, None computes everything
+    feature_plan = None
+    if top_n is not None:
+        pathToFeatureScores = join(PATHS.sw_install, './script/Pearson_Correlation_Individula_Features.txt')
+        feature_plan = compile_feature_plan(load_feature_ranks(pathToFeatureScores), top_n)
+
     targets_list = os.listdir(pathToData)
     path_list = []
     for target in targets_list:
@@ -189,8 +301,60 @@ def main(pathToData, pathToRandomForestPredictions, pathToSave):
 
     create_file(pathToSave)
     print('Saving data...')
-    with ProcessPoolExecutor(max_workers=int(os.cpu_count() * 0.70)) as executor:
-        executor.map(process_target, path_list, [pathToSave] * len(path_list))
+    # the work unit is one model so the cores are used even when there is only one target, the results are gathered per target.
+    # The contact maps go to the workers through shared memory, a bounded number of models is in flight so they are not all held at once
+    max_workers = max(1, int(os.cpu_count() * 0.70))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        jobs = {}
+        # target path -> [running models, saved models, all models submitted]
+        targets = {}
+
+        def finish_jobs(return_when):
+            done, _ = wait(jobs, return_when=return_when)
+            for job in done:
+                target_path, shared_contact_map = jobs.pop(job)
+                shared_contact_map.release()
+                targets[target_path][0] -= 1
+                try:
+                    targets[target_path][1] += job.result() is not None
+                except Exception as e:
+                    print(f"Error creating a model of {target_path}: {e}")
+                report_target(target_path)
+
+        def report_target(target_path):
+            running, saved, submitted = targets[target_path]
+            if submitted and running == 0:
+                print(f"Finished {target_path}, saved {saved} models")
+                del targets[target_path]
+
+        try:
+            for target_path in path_list:
+                targets[target_path] = [0, 0, False]
+                # a target that can not be read is reported and skipped, the models of it already submitted still finish
+                try:
+                    target_save = get_target_save_path(target_path, pathToSave)
+                    for server, server_data in iter_target_models(target_path):
+                        if len(jobs) >= 2 * max_workers:
+                            finish_jobs(FIRST_COMPLETED)
+                        shared_contact_map = SharedArray(values=np.asarray(server_data['ContactMap']))
+                        try:
+                            model_data = {key: values for key, values in server_data.items() if key != 'ContactMap'}
+                            job = executor.submit(process_model, server, model_data, shared_contact_map.handle, target_save, feature_plan)
+                        except BaseException:
+                            shared_contact_map.release()
+                            raise
+                        jobs[job] = (target_path, shared_contact_map)
+                        targets[target_path][0] += 1
+                except Exception as e:
+                    print(f"Error creating {target_path}: {e}")
+                targets[target_path][2] = True
+                report_target(target_path)
+
+            finish_jobs(ALL_COMPLETED)
+        finally:
+            # the shared contact maps of the models still in flight when the run stops early
+            for _, shared_contact_map in jobs.values():
+                shared_contact_map.release()
 
     # for target_path in path_list:
     #     process_target(target_path, pathToSave)
@@ -214,12 +378,14 @@ if __name__ == "__main__":
     if len(sys.argv) < 4:
         print("Not enough arguemnts, example command: ")
         print(
-            f"python {sys.argv[0]} /data/shared/databases/CASP_ALL_JSON /data/summer2020/Kyle/CASP14/Data/Angles/AminoAcid_RF/RF_Predictions /data/summer2020/Kyle/CASP14/Data/Graphs/CASP_Fragment_Databse/ ")
+            f"python {sys.argv[0]} /data/shared/databases/CASP_ALL_JSON /data/summer2020/Kyle/CASP14/Data/Angles/AminoAcid_RF/RF_Predictions /data/summer2020/Kyle/CASP14/Data/Graphs/CASP_Fragment_Databse/ [top_n]")
+        print("top_n is optional, when given only the features used by the top n ranked SVR inputs are computed")
 
         sys.exit()
 
     pathToData = sys.argv[1]
     pathToRandomForestPredictions = sys.argv[2]
     pathToSave = sys.argv[3]
+    top_n = int(sys.argv[4]) if len(sys.argv) > 4 else None
 
-    main(pathToData, pathToRandomForestPredictions, pathToSave)
+    main(pathToData, pathToRandomForestPredictions, pathToSave, top_n)
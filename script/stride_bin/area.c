@@ -3,7 +3,7 @@
 void Area(CHAIN **Chain, int NChain, COMMAND *Cmd)
 {
 
-  double *Coord, *Radii, OverallArea, *AreaPerAtom, *p1, *p2;
+  double *Coord, *Radii, OverallArea, *AreaPerAtom, *AreaStart, *p1, *p2;
   int At, TotalAt=0, Cn, Res, DotsPerSphere=600;
 
   for( Cn=0; Cn<NChain; Cn++ ) {
@@ -42,8 +42,10 @@ void Area(CHAIN **Chain, int NChain, COMMAND *Cmd)
   p1 = Coord;
   p2 = Radii;
 
+  AreaPerAtom = NULL;
   NSC(Coord,Radii,TotalAt,DotsPerSphere,FLAG_ATOM_AREA,&OverallArea,
       &AreaPerAtom,NULL,NULL,NULL);
+  AreaStart = AreaPerAtom;
     
     for( Cn=0; Cn<NChain; Cn++ ) {
 
@@ -60,6 +62,7 @@ void Area(CHAIN **Chain, int NChain, COMMAND *Cmd)
     }
   free(Coord);
   free(Radii);
+  free(AreaStart);
 }
 
     
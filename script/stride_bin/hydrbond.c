@@ -508,6 +508,8 @@ int FindHydrogenBonds(CHAIN **Chain, int NChain, HBOND **HBond, COMMAND *Cmd)
     free(BondedDonor);
   if( NAcc )
     free(BondedAcceptor);
+  free(Dnr);
+  free(Acc);
 
   return(hc);
 }
@@ -15,6 +15,7 @@ void InitChain(CHAIN **Chain)
   (*Chain)->NSheet              = -1;
   (*Chain)->NTurn               = 0;
   (*Chain)->NAssignedTurn       = 0;
+  (*Chain)->MaxAssignedTurn     = MAX_TURN;
   (*Chain)->NBond               = 0;
   (*Chain)->NHydrBond           = 0;
   (*Chain)->NHydrBondTotal      = 0;
@@ -1,13 +1,26 @@
 #include "stride.h"
 
 int ReadPDBFile(CHAIN **Chain, int *Cn, COMMAND *Cmd)
+{
+  FILE *pdb;
+  int Result;
+
+  if( !(pdb = fopen(Cmd->InputFile,"r")) )
+    return(FAILURE); 
+
+  Result = ReadPDBStream(pdb,Chain,Cn,Cmd);
+  fclose(pdb);
+
+  return(Result);
+}
+
+int ReadPDBStream(FILE *pdb, CHAIN **Chain, int *Cn, COMMAND *Cmd)
 {
 
   int ChainCnt, InfoCnt, i;
   enum METHOD Method = XRay;
   BOOLEAN First_ATOM, Published=YES, DsspAssigned=NO;
   float Resolution = 0.0;
-  FILE *pdb;
   BUFFER Buffer;
   char *Info[MAX_INFO], PdbIdent[5];
   RESIDUE *r;
@@ -17,9 +30,6 @@ int ReadPDBFile(CHAIN **Chain, int *Cn, COMMAND *Cmd)
   InfoCnt = 0;
   strcpy(PdbIdent,"~~~~");
 
-  if( !(pdb = fopen(Cmd->InputFile,"r")) )
-    return(FAILURE); 
-     
   First_ATOM = YES;
   
   while( fgets(Buffer,BUFSZ,pdb) ) {
@@ -77,7 +87,6 @@ int ReadPDBFile(CHAIN **Chain, int *Cn, COMMAND *Cmd)
     else if(!strncmp(Buffer,"ATOM",4) && !Process_ATOM(Buffer,Chain,Cn,&First_ATOM,Cmd)) 
       return(FAILURE);
   }
-  fclose(pdb);
 
   for( ChainCnt=0; ChainCnt< *Cn; ChainCnt++ ) {
     c = Chain[ChainCnt];
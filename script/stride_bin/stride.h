@@ -201,7 +201,7 @@ typedef struct {
 typedef struct {
                  int NRes, NHetRes, NonStandRes, Ter;
 		 int NHet, NAtom, NonStandAtom, NHelix, NSheet;
-		 int NTurn, NAssignedTurn, NBond, NHydrBond, NHydrBondInterchain, NHydrBondTotal, NInfo;
+		 int NTurn, NAssignedTurn, MaxAssignedTurn, NBond, NHydrBond, NHydrBondInterchain, NHydrBondTotal, NInfo;
 		 char Id, *File;
 		 float Resolution;
 		 enum METHOD Method;
@@ -0,0 +1,194 @@
+#include <setjmp.h>
+#include "stride.h"
+
+/* Library entry point used by script/stride_extension.py: runs the same assignment as main() with the
+ * default options on a PDB file held in memory and returns the ASG columns as arrays instead of a report.
+ * Build with "make libstride", die.c is replaced by the die() below so an error returns to Python
+ * instead of exiting the interpreter. */
+
+static jmp_buf StrideError;
+
+void die(char *format, ... )
+{
+  va_list ptr;
+
+  va_start(ptr,format);
+  vfprintf(stderr,format,ptr);
+  va_end(ptr);
+  longjmp(StrideError,1);
+}
+
+/* ReadDone: the chains were completely read, Prop, Inv and Info are only set at the end of ReadPDBStream */
+static void FreeChains(CHAIN **Chain, int NChain, BOOLEAN ReadDone)
+{
+  int Cn, i;
+
+  for( Cn=0; Cn<NChain; Cn++ ) {
+    for( i=0; i<Chain[Cn]->NRes; i++ ) {
+      if( ReadDone ) {
+	free(Chain[Cn]->Rsd[i]->Prop);
+	free(Chain[Cn]->Rsd[i]->Inv);
+      }
+      free(Chain[Cn]->Rsd[i]);
+    }
+    for( i=0; i<Chain[Cn]->NAssignedTurn; i++ ) free(Chain[Cn]->AssignedTurn[i]);
+    if( ReadDone )
+      for( i=0; i<Chain[Cn]->NInfo; i++ ) free(Chain[Cn]->Info[i]);
+    free(Chain[Cn]->File);
+    free(Chain[Cn]->Rsd);
+    free(Chain[Cn]->HetRsd);
+    free(Chain[Cn]->Het);
+    free(Chain[Cn]->Helix);
+    free(Chain[Cn]->Sheet);
+    free(Chain[Cn]->Turn);
+    free(Chain[Cn]->AssignedTurn);
+    free(Chain[Cn]->SSbond);
+    free(Chain[Cn]->Info);
+    free(Chain[Cn]);
+  }
+}
+
+static int ComparePointers(const void *a, const void *b)
+{
+  const char *PtrA = *(const char **)a, *PtrB = *(const char **)b;
+
+  return( (PtrA > PtrB) - (PtrA < PtrB) );
+}
+
+/* the donors and acceptors of the bonds are shared between bonds, each one is freed once */
+static void FreeHBonds(HBOND **HBond, int NHBond)
+{
+  void **Partner;
+  int i, NPartner=0;
+
+  Partner = (void **)ckalloc((2*NHBond+1)*sizeof(void *));
+  for( i=0; i<NHBond; i++ ) {
+    Partner[NPartner++] = HBond[i]->Dnr;
+    Partner[NPartner++] = HBond[i]->Acc;
+    free(HBond[i]);
+  }
+  qsort(Partner,NPartner,sizeof(void *),ComparePointers);
+  for( i=0; i<NPartner; i++ )
+    if( i == 0 || Partner[i] != Partner[i-1] )
+      free(Partner[i]);
+  free(Partner);
+}
+
+/* PdbText: the PDB file, TextLength bytes
+ * MaxRes: the size of the output arrays
+ * ResType: MaxRes*4 chars, the residue names (NULL terminated)
+ * Asn: MaxRes chars, the stride secondary structure code
+ * Solv: MaxRes doubles, the solvent accessible area rounded like the %7.1f of the report
+ * Returns the number of residues written, -1 if stride failed and -2 if there are more than MaxRes residues */
+int StrideAssignBuffer(char *PdbText, int TextLength, int MaxRes, char *ResType, char *Asn, double *Solv)
+{
+  static CHAIN **Chain;
+  static HBOND **HBond;
+  static COMMAND *Cmd;
+  static FILE *pdb;
+  static int NChain, NHBond, NRes;
+  static BOOLEAN ReadDone;
+  float **PhiPsiMapHelix, **PhiPsiMapSheet;
+  int Cn, ValidChain=0;
+  char Tmp[20];
+  register int i;
+
+  Chain = (CHAIN  **)ckalloc(MAX_CHAIN*sizeof(CHAIN *));
+  HBond = (HBOND  **)ckalloc(MAXHYDRBOND*sizeof(HBOND *));
+  Cmd   = (COMMAND *)ckalloc(sizeof(COMMAND));
+  pdb = NULL;
+  NChain = 0;
+  NHBond = 0;
+  NRes = -1;
+  ReadDone = NO;
+
+  if( setjmp(StrideError) ) {
+    /* die() was called, the partial results are released below */
+    NRes = -1;
+    goto cleanup;
+  }
+
+  DefaultCmd(Cmd);
+  strcpy(Cmd->InputFile,"memory");
+
+  if( !(pdb = fmemopen(PdbText,TextLength,"r")) )
+    die("Can not open the PDB buffer\n");
+
+  if( !ReadPDBStream(pdb,Chain,&NChain,Cmd) || !NChain )
+    die("Error reading PDB file %s\n",Cmd->InputFile);
+  ReadDone = YES;
+
+  for( Cn=0; Cn<NChain; Cn++ )
+    ValidChain += CheckChain(Chain[Cn],Cmd);
+
+  if( !ValidChain )
+    die("No valid chain in %s\n",Chain[0]->File);
+
+  BackboneAngles(Chain,NChain);
+
+  PhiPsiMapHelix = DefaultHelixMap(Cmd);
+  PhiPsiMapSheet = DefaultSheetMap(Cmd);
+
+  for( Cn=0; Cn<NChain; Cn++ )
+    PlaceHydrogens(Chain[Cn]);
+
+  if( (NHBond = FindHydrogenBonds(Chain,Cn,HBond,Cmd)) == 0 )
+    die("No hydrogen bonds found in %s\n",Cmd->InputFile);
+
+  NoDoubleHBond(HBond,NHBond);
+
+  DiscrPhiPsi(Chain,NChain,Cmd);
+
+  if(Cmd->ExposedArea)
+    Area(Chain,NChain,Cmd);
+
+  for( Cn=0; Cn<NChain; Cn++ ) {
+
+    if( Chain[Cn]->Valid ) {
+
+      Helix(Chain,Cn,HBond,Cmd,PhiPsiMapHelix);
+
+      for( i=0; i<NChain; i++ )
+	if( Chain[i]->Valid )
+	  Sheet(Chain,Cn,i,HBond,Cmd,PhiPsiMapSheet);
+
+      BetaTurn(Chain,Cn);
+      GammaTurn(Chain,Cn,HBond);
+
+    }
+  }
+
+  free(PhiPsiMapHelix);
+  free(PhiPsiMapSheet);
+
+  /* the same residues and values as the ASG lines of Report() */
+  NRes = 0;
+  for( Cn=0; Cn<NChain; Cn++ ) {
+
+    if( !Chain[Cn]->Valid )
+      continue;
+
+    for( i=0; i<Chain[Cn]->NRes; i++ ) {
+      if( NRes == MaxRes ) {
+	NRes = -2;
+	goto cleanup;
+      }
+      strncpy(ResType+4*NRes,Chain[Cn]->Rsd[i]->ResType,3);
+      ResType[4*NRes+3] = '\0';
+      Asn[NRes] = Chain[Cn]->Rsd[i]->Prop->Asn;
+      sprintf(Tmp,"%7.1f",Chain[Cn]->Rsd[i]->Prop->Solv);
+      Solv[NRes] = atof(Tmp);
+      NRes++;
+    }
+  }
+
+ cleanup:
+  if( pdb ) fclose(pdb);
+  FreeChains(Chain,NChain,ReadDone);
+  FreeHBonds(HBond,NHBond);
+  free(Chain);
+  free(HBond);
+  free(Cmd);
+
+  return(NRes);
+}
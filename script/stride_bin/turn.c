@@ -1,4 +1,19 @@
 #include "stride.h"
+
+/* A long chain can have more turns than MAX_TURN, the array of the chain is doubled instead of written past its end */
+static TURN *NewAssignedTurn(CHAIN *Chain)
+{
+  TURN **Grown;
+
+  if( Chain->NAssignedTurn == Chain->MaxAssignedTurn ) {
+    if( !(Grown = (TURN **)realloc(Chain->AssignedTurn,2*Chain->MaxAssignedTurn*sizeof(TURN *))) )
+      die("Out of  memory\n");
+    Chain->AssignedTurn = Grown;
+    Chain->MaxAssignedTurn *= 2;
+  }
+  Chain->AssignedTurn[Chain->NAssignedTurn] = (TURN *)ckalloc(sizeof(TURN));
+  return(Chain->AssignedTurn[Chain->NAssignedTurn++]);
+}
     
 void BetaTurn(CHAIN **Chain, int Cn)
 {
@@ -6,7 +21,7 @@ void BetaTurn(CHAIN **Chain, int Cn)
   register int i;
   RESIDUE **r;
   TURN *t;
-  int CA1, CA4, Tn;
+  int CA1, CA4;
   float Phi2, Phi3, Psi2, Psi3, Range1 = 30.0, Range2 = 45.0;
   char TurnType;
 
@@ -61,15 +76,12 @@ void BetaTurn(CHAIN **Chain, int Cn)
     if( r[3]->Prop->Asn == 'C' )
       r[3]->Prop->Asn = 'T';
     
-    Tn = Chain[Cn]->NAssignedTurn;
-    Chain[Cn]->AssignedTurn[Tn] = (TURN *)ckalloc(sizeof(TURN));
-    t = Chain[Cn]->AssignedTurn[Tn];
+    t = NewAssignedTurn(Chain[Cn]);
     strcpy(t->Res1,r[0]->ResType);
     strcpy(t->Res2,r[3]->ResType);
     strcpy(t->PDB_ResNumb1,r[0]->PDB_ResNumb);
     strcpy(t->PDB_ResNumb2,r[3]->PDB_ResNumb);
     t->TurnType = TurnType;
-    Chain[Cn]->NAssignedTurn++;
 
   }
 }
@@ -81,7 +93,6 @@ void GammaTurn(CHAIN **Chain, int Cn, HBOND **HBond)
   register int i;
   RESIDUE **r;
   TURN *t;
-  int Tn;
   float Phi2, Psi2;
   char TurnType, Asn;
 
@@ -117,15 +128,12 @@ void GammaTurn(CHAIN **Chain, int Cn, HBOND **HBond)
     if( r[3]->Prop->Asn == 'C' )
       r[3]->Prop->Asn = 'T';
     
-    Tn = Chain[Cn]->NAssignedTurn;
-    Chain[Cn]->AssignedTurn[Tn] = (TURN *)ckalloc(sizeof(TURN));
-    t = Chain[Cn]->AssignedTurn[Tn];
+    t = NewAssignedTurn(Chain[Cn]);
     strcpy(t->Res1,r[1]->ResType);
     strcpy(t->Res2,r[3]->ResType);
     strcpy(t->PDB_ResNumb1,r[1]->PDB_ResNumb);
     strcpy(t->PDB_ResNumb2,r[3]->PDB_ResNumb);
     t->TurnType = TurnType;
-    Chain[Cn]->NAssignedTurn++;
   }
 }
 
@@ -0,0 +1,205 @@
+'''
+This file is responsible for running stride inside the python process through ctypes.
+
+The library is built from the bundled sources in stride_bin (make libstride, see stride_lib.c). It reads the cleaned model from memory
+and returns the secondary structure and solvent accessibility of every residue as arrays, so no process is started, no file is written
+and no report is parsed. The library is optional, stride_runner falls back to the stride executable when it is not built.
+
+Run this file directly to check the library against the stride executable on a model, and on a long chain of copies of it (a memory
+error in the library takes the whole python process down, so long chains are checked as well):
+
+    python script/stride_extension.py ./script/stride_linux /path/to/model.pdb [copies]
+'''
+
+import os
+import sys
+import ctypes
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from os.path import join, dirname, abspath, isfile
+
+from stride_runner import SS_8_TO_3, RESIDUE_CODES, run_stride_models
+from pdb_cleanup import clean_pdb
+
+# the copies of a model in the long chain of the check, enough for more turns than the MAX_TURN of the stride sources
+CHECK_COPIES = 16
+
+STRIDE_SOURCE_PATH = join(dirname(abspath(__file__)), 'stride_bin')
+STRIDE_LIBRARY_PATH = join(STRIDE_SOURCE_PATH, 'libstride.so')
+
+# the stride sources keep state in static buffers, one model runs at a time
+stride_lock = threading.Lock()
+stride_library = None
+
+
+def build_stride_library():
+    '''
+    This method compiles libstride.so from the sources in stride_bin
+
+    Returns:
+    --------
+    bool:
+        True if the library was built
+    '''
+    try:
+        result = subprocess.run(['make', 'libstride'], cwd=STRIDE_SOURCE_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except OSError as e:
+        print(f"Could not build the stride library: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"Could not build the stride library: {result.stderr.decode(errors='replace')}")
+        return False
+    return isfile(STRIDE_LIBRARY_PATH)
+
+
+def load_stride_library():
+    '''
+    This method loads libstride.so once per process
+
+    Returns:
+    --------
+    ctypes.CDLL or None:
+        The library, None if it is not built or can not be loaded
+    '''
+    global stride_library
+    if stride_library is None and isfile(STRIDE_LIBRARY_PATH):
+        try:
+            library = ctypes.CDLL(STRIDE_LIBRARY_PATH)
+        except OSError as e:
+            print(f"Could not load {STRIDE_LIBRARY_PATH}: {e}")
+            return None
+        library.StrideAssignBuffer.restype = ctypes.c_int
+        library.StrideAssignBuffer.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_char_p,
+                                               np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS')]
+        stride_library = library
+    return stride_library
+
+
+def is_stride_library_available():
+    '''
+    This method checks if libstride.so is built and can be loaded
+    '''
+    return load_stride_library() is not None
+
+
+def run_stride_memory(cleaned_lines):
+    '''
+    This method runs stride on a cleaned model held in memory
+
+    Parameters:
+    ----------
+    cleaned_lines: list[string]
+        The lines of the model, see pdb_cleanup.clean_pdb
+
+    Returns:
+    --------
+    np.ndarray((L,)): <U1, np.ndarray((L,)): <U1, np.ndarray((L,)): float64
+        The same arrays as stride_runner.parse_stride_output, empty if stride failed on the model
+
+    '''
+    library = load_stride_library()
+    if library is None:
+        raise RuntimeError(f"{STRIDE_LIBRARY_PATH} is not built, see build_stride_library")
+
+    pdb_text = ''.join(cleaned_lines).encode()
+    max_residues = len(cleaned_lines) + 1
+    residue_types = ctypes.create_string_buffer(4 * max_residues)
+    assignments = ctypes.create_string_buffer(max_residues)
+    solvent_area = np.zeros(max_residues, dtype=np.float64)
+
+    num_residues = -1
+    if pdb_text:
+        with stride_lock:
+            num_residues = library.StrideAssignBuffer(pdb_text, len(pdb_text), max_residues, residue_types, assignments,
+                                                      solvent_area)
+
+    ss, aa, sol = [], [], []
+    for index in range(max(num_residues, 0)):
+        residue = residue_types.raw[4 * index:4 * index + 3].split(b'\0')[0].decode().strip().upper()
+        if residue not in RESIDUE_CODES:
+            print("Warning, the residue " + residue + " is not recognized, skip it")
+            continue
+        aa.append(RESIDUE_CODES[residue])
+        ss.append(SS_8_TO_3.get(assignments.raw[index:index + 1].decode().upper(), 'E'))
+        sol.append(solvent_area[index])
+    return np.asarray(ss, dtype='<U1'), np.asarray(aa, dtype='<U1'), np.asarray(sol, dtype=np.float64)
+
+
+def tile_model_lines(cleaned_lines, copies, shift=60.0):
+    '''
+    This method builds one long chain of copies of a model, each copy moved shift angstroms along x from the one before
+
+    Parameters:
+    ----------
+    cleaned_lines: list[string]
+        The lines of the model, see pdb_cleanup.clean_pdb
+
+    copies: int
+        The number of copies in the chain
+
+    shift: float
+        The distance between the copies
+
+    Returns:
+    --------
+    list[string]:
+        The lines of the chain, the residue numbers continue from one copy to the next
+    '''
+    num_residues = max([int(line[22:26]) for line in cleaned_lines], default=0)
+    tiled_lines = []
+    for copy in range(copies):
+        for line in cleaned_lines:
+            # the residue number field has 4 columns, the number only has to change from one residue to the next
+            residue = (int(line[22:26]) + num_residues * copy) % 10000
+            tiled_lines.append(f'{line[:22]}{residue:4d}{line[26:30]}{float(line[30:38]) + shift * copy:8.3f}{line[38:]}')
+    return tiled_lines
+
+
+def check_stride_library(cleaned_lines, stride_path):
+    '''
+    This method compares the library to the stride executable on one model
+
+    Parameters:
+    ----------
+    cleaned_lines: list[string]
+        The lines of the model, see pdb_cleanup.clean_pdb
+
+    stride_path: string
+        The stride executable
+
+    Returns:
+    --------
+    bool, int, int:
+        If the secondary structure, amino acids and solvent accessibility of every residue are the same, and the number of residues
+        of the library and of the executable (0 when it failed)
+    '''
+    pdb_file, pdb_path = tempfile.mkstemp(suffix='.pdb')
+    try:
+        with os.fdopen(pdb_file, 'w') as f:
+            f.writelines(cleaned_lines)
+        executable_result = run_stride_models([pdb_path], stride_path)[0]
+    finally:
+        os.remove(pdb_path)
+    library_result = run_stride_memory(cleaned_lines)
+    passed = all(np.array_equal(library_values, executable_values)
+                 for library_values, executable_values in zip(library_result, executable_result))
+    return passed and len(library_result[0]) > 0, len(library_result[0]), len(executable_result[0])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("This script checks the stride library against the stride executable on a model and on a long chain of copies of it")
+        print(f"python {sys.argv[0]} ./script/stride_linux /path/to/model.pdb [copies]")
+        sys.exit(0)
+
+    if not is_stride_library_available() and not build_stride_library():
+        sys.exit(1)
+
+    stride_path, pathToPDB = sys.argv[1], sys.argv[2]
+    copies = int(sys.argv[3]) if len(sys.argv) > 3 else CHECK_COPIES
+    cleaned_lines = clean_pdb(pathToPDB)
+    for num_copies in sorted({1, copies}):
+        passed, library_residues, executable_residues = check_stride_library(tile_model_lines(cleaned_lines, num_copies), stride_path)
+        print(f"{num_copies} copies, {library_residues} residues (executable {executable_residues}): {'pass' if passed else 'FAIL'}")
@@ -0,0 +1,126 @@
+'''
+This file is responsible for running stride on many models at the same time.
+
+The models are run through a bounded pool of asyncio subprocesses so the cores are not left idle while one stride process runs at a time.
+The ASG lines of the report are parsed into arrays, and the results can be cached on disk (see disk_cache.py) by the coordinate hash of
+the cleaned model (see pdb_cleanup.get_coordinate_hash), so a model that was seen before does not run stride again.
+'''
+
+import os
+import asyncio
+import numpy as np
+
+# stride 8 state secondary structure -> 3 state, every other code is E (see step1_create_json_from_PDB.convert_8_to_3)
+SS_8_TO_3 = {'H': 'H', 'G': 'H', 'I': 'H', 'T': 'C', 'S': 'C', 'C': 'C'}
+
+RESIDUE_CODES = {'ALA': 'A', 'CYS': 'C', 'ASP': 'D', 'GLU': 'E', 'PHE': 'F', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LYS': 'K', 'LEU': 'L',
+                 'MET': 'M', 'ASN': 'N', 'PRO': 'P', 'GLN': 'Q', 'ARG': 'R', 'SER': 'S', 'THR': 'T', 'VAL': 'V', 'TRP': 'W', 'TYR': 'Y'}
+
+
+def parse_stride_output(stride_output):
+    '''
+    This method parses the ASG lines of a stride report
+
+    Parameters:
+    ----------
+    stride_output: string
+        The text stride writes to stdout
+
+    Returns:
+    --------
+    np.ndarray((L,)): <U1, np.ndarray((L,)): <U1, np.ndarray((L,)): float64
+        The 3 state secondary structure, the one letter amino acid and the solvent accessible area of every recognized residue
+    '''
+    ss, aa, sol = [], [], []
+    for line in stride_output.split('\n'):
+        tem = line.strip().split()
+        if len(tem) < 10 or tem[0] != 'ASG':
+            continue
+        residue = tem[1].upper()
+        if residue not in RESIDUE_CODES:
+            print("Warning, the residue " + residue + " is not recognized, skip it")
+            continue
+        aa.append(RESIDUE_CODES[residue])
+        ss.append(SS_8_TO_3.get(tem[5].upper(), 'E'))
+        sol.append(float(tem[9]))
+    return np.asarray(ss, dtype='<U1'), np.asarray(aa, dtype='<U1'), np.asarray(sol, dtype=np.float64)
+
+
+async def _run_stride(pdb_path, stride_path, semaphore):
+    async with semaphore:
+        try:
+            process = await asyncio.create_subprocess_exec(stride_path, pdb_path, stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.DEVNULL)
+            stdout, _ = await process.communicate()
+        except OSError:
+            print("Error running " + stride_path + " on " + pdb_path)
+            stdout = b''
+    return parse_stride_output(stdout.decode(errors='replace'))
+
+
+async def _run_stride_models(pdb_paths, stride_path, max_workers):
+    semaphore = asyncio.Semaphore(max_workers)
+    return await asyncio.gather(*[_run_stride(pdb_path, stride_path, semaphore) for pdb_path in pdb_paths])
+
+
+def run_stride_models(pdb_paths, stride_path, model_hashes=None, cache=None, max_workers=None, pdb_lines=None):
+    '''
+    This method runs stride on every model, at most max_workers processes at a time
+
+    Parameters:
+    ----------
+    pdb_paths: list[string]
+        The cleaned models
+
+    stride_path: string
+        The stride executable
+
+    model_hashes: list[string] or None
+        The coordinate hash of every model, needed to use the cache
+
+    cache: disk_cache.DiskCache or None
+        The cache of earlier stride results, None always runs stride
+
+    max_workers: int or None
+        The number of stride processes that run at the same time, None uses the number of cores
+
+    pdb_lines: list[list[string]] or None
+        The cleaned lines of every model. When given and the stride library is built (see stride_extension.py) stride runs
+        inside this process on the lines instead of starting the executable
+
+    Returns:
+    --------
+    list: [(np.ndarray, np.ndarray, np.ndarray)]
+        The parse_stride_output result of every model, in the order of pdb_paths
+    '''
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    results = [None] * len(pdb_paths)
+    use_cache = cache is not None and model_hashes is not None
+    if use_cache:
+        for index, model_hash in enumerate(model_hashes):
+            results[index] = cache.get(model_hash)
+
+    # duplicate models in one call only run stride once
+    to_run = {}
+    for index, pdb_path in enumerate(pdb_paths):
+        if results[index] is None:
+            to_run.setdefault(model_hashes[index] if use_cache else index, []).append(index)
+
+    # imported here, stride_extension uses the tables of this file
+    from stride_extension import is_stride_library_available, run_stride_memory
+    if pdb_lines is not None and is_stride_library_available():
+        stride_results = [run_stride_memory(pdb_lines[indexes[0]]) for indexes in to_run.values()]
+    else:
+        run_paths = [pdb_paths[indexes[0]] for indexes in to_run.values()]
+        stride_results = asyncio.run(_run_stride_models(run_paths, stride_path, max_workers)) if run_paths else []
+
+    for (key, indexes), stride_result in zip(to_run.items(), stride_results):
+        for index in indexes:
+            results[index] = stride_result
+        # an empty report is a failed run (e.g. stride was not found), it is not cached
+        if use_cache and len(stride_result[0]) > 0:
+            cache.put(key, stride_result)
+
+    return results
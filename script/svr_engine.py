@@ -0,0 +1,317 @@
+'''
+This file is responsible for predicting with the trained SVR without sklearn.
+
+The pickled sklearn.svm.SVR is only used for predict, which is the kernel between every input row and every support vector times the dual
+coefficients plus the intercept. export_svr_model saves those arrays and the kernel parameters to a small .npz artifact, and SVREngine
+evaluates the kernel for a block of rows at a time with matrix products, so the memory stays bounded and numpy's BLAS runs the products on
+every core. float64 matches sklearn to rounding, float32 is about twice as fast and agrees to about 1e-5.
+
+    python svr_engine.py /path/to/model.pkl /path/to/artifact.npz [inputs.npy]
+
+exports the model and checks the engine against sklearn on the inputs (the support vectors when no inputs are given).
+
+The approximations of fit_svr_approximation.py are saved in the same format: a Nystroem approximation is an artifact with fewer
+"support vectors" and refit coefficients that SVREngine runs as it is, a random Fourier feature approximation is run by
+RandomFeatureSVR. load_svr_artifact opens either one.
+'''
+
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+
+ARTIFACT_VERSION = 1
+SUPPORTED_KERNELS = ['linear', 'poly', 'rbf', 'sigmoid']
+# the memory of one block of kernel values
+BLOCK_BYTES = 64 * 1024 ** 2
+# (path, size, modification time) -> fingerprint of the model files hashed by this process, see get_model_fingerprint
+model_fingerprints = {}
+
+
+def get_model_fingerprint(pathToModel):
+    '''
+    This method identifies a pickled model file by its size and the sha256 of its contents, an artifact exported from another file is
+    stale. A file is hashed once per process until its size or modification time changes
+    '''
+    model_stat = os.stat(pathToModel)
+    key = (os.path.abspath(pathToModel), model_stat.st_size, model_stat.st_mtime_ns)
+    if key not in model_fingerprints:
+        checksum = hashlib.sha256()
+        with open(pathToModel, 'rb') as f:
+            for block in iter(lambda: f.read(16 * 1024 ** 2), b''):
+                checksum.update(block)
+        model_fingerprints[key] = f'{model_stat.st_size}:{checksum.hexdigest()}'
+    return model_fingerprints[key]
+
+
+def get_svr_arrays(model, pathToModel=None):
+    '''
+    This method gets the arrays and kernel parameters SVREngine needs from a fitted sklearn.svm.SVR
+
+    Parameters:
+    ----------
+    model: sklearn.svm.SVR
+        The fitted model
+
+    pathToModel: string or None
+        The pickle the model was loaded from, its fingerprint is stored so get_svr_engine can tell when the artifact is stale
+
+    Returns:
+    --------
+    dictionary:
+        'support_vectors', 'dual_coef', 'intercept', 'kernel', 'gamma', 'coef0', 'degree' and 'fingerprint'
+    '''
+    if model.kernel not in SUPPORTED_KERNELS:
+        raise ValueError(f"The {model.kernel} kernel is not supported, only {SUPPORTED_KERNELS}")
+    return {'support_vectors': np.asarray(model.support_vectors_, dtype=np.float64),
+            'dual_coef': np.asarray(model.dual_coef_, dtype=np.float64).ravel(), 'intercept': float(np.ravel(model.intercept_)[0]),
+            'kernel': model.kernel, 'gamma': float(model._gamma), 'coef0': float(model.coef0), 'degree': int(model.degree),
+            'fingerprint': get_model_fingerprint(pathToModel) if pathToModel is not None else ''}
+
+
+def export_svr_model(model, pathToArtifact, pathToModel=None):
+    '''
+    This method saves the arrays SVREngine needs from a fitted sklearn.svm.SVR to an artifact (see get_svr_arrays for the parameters)
+
+    Parameters:
+    ----------
+    pathToArtifact: string
+        The .npz file to write
+    '''
+    save_svr_artifact(pathToArtifact, **get_svr_arrays(model, pathToModel))
+
+
+def save_svr_artifact(pathToArtifact, **arrays):
+    '''
+    This method writes the arrays of an artifact (see export_svr_model for the keys), the file is written to a temporary file of its own
+    next to the artifact and renamed, so a reader never sees a partial file and processes exporting at the same time do not write into
+    each other's file
+    '''
+    artifact_folder = os.path.dirname(os.path.abspath(pathToArtifact))
+    os.makedirs(artifact_folder, exist_ok=True)
+    tmp_file, tmp_path = tempfile.mkstemp(dir=artifact_folder, suffix='.npz')
+    os.close(tmp_file)
+    try:
+        np.savez(tmp_path, version=ARTIFACT_VERSION, **arrays)
+        os.replace(tmp_path, pathToArtifact)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class SVREngine:
+    def __init__(self, pathToArtifact, dtype=np.float64, block_bytes=BLOCK_BYTES):
+        '''
+        Parameters:
+        ----------
+        pathToArtifact: string or dictionary
+            The .npz file from export_svr_model, or its arrays (e.g. model_bundle.ModelBundle.get_svr_artifact), arrays of the
+            engine dtype are used without a copy
+
+        dtype: np.float32 or np.float64
+            The precision of the kernel products
+
+        block_bytes: int
+            The memory of the kernel values of one block of input rows
+        '''
+        artifact = pathToArtifact
+        if isinstance(pathToArtifact, str):
+            with np.load(pathToArtifact) as artifact_file:
+                artifact = dict(artifact_file)
+        if int(artifact['version']) != ARTIFACT_VERSION:
+            raise ValueError(f"The SVR artifact is version {int(artifact['version'])}, expected {ARTIFACT_VERSION}")
+        self.kernel = str(artifact['kernel'])
+        self.gamma = float(artifact['gamma'])
+        self.coef0 = float(artifact['coef0'])
+        self.degree = int(artifact['degree'])
+        self.intercept = float(artifact['intercept'])
+        self.fingerprint = str(artifact['fingerprint'])
+
+        self.dtype = np.dtype(dtype)
+        self.block_bytes = block_bytes
+        self.support_vectors = np.asarray(artifact['support_vectors']).astype(self.dtype, copy=False)
+        self.dual_coef = np.asarray(artifact['dual_coef']).astype(self.dtype, copy=False)
+        self.support_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+
+    def __repr__(self):
+        return f'SVREngine(kernel={self.kernel}, gamma={self.gamma}, support_vectors={len(self.support_vectors)}, dtype={self.dtype})'
+
+    def kernel_block(self, X):
+        '''
+        This method computes the kernel values between the rows of X and every support vector, np.ndarray((N, S))
+        '''
+        products = X @ self.support_vectors.T
+        if self.kernel == 'linear':
+            return products
+        if self.kernel == 'poly':
+            return (self.gamma * products + self.coef0) ** self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * products + self.coef0)
+        # rbf: |x - sv|^2 = |x|^2 + |sv|^2 - 2 x.sv, rounding can make it slightly negative
+        square_distances = np.einsum('ij,ij->i', X, X)[:, np.newaxis] + self.support_norms[np.newaxis, :] - 2 * products
+        np.maximum(square_distances, 0, out=square_distances)
+        return np.exp(-self.gamma * square_distances, out=square_distances)
+
+    def predict(self, X):
+        '''
+        This method predicts the rows of X, the same as sklearn.svm.SVR.predict
+
+        Parameters:
+        ----------
+        X: np.ndarray((N, F))
+            The input rows
+
+        Returns:
+        --------
+        np.ndarray((N,)): float64
+            The prediction of every row
+        '''
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        predictions = np.empty(len(X), dtype=np.float64)
+        block_rows = max(1, self.block_bytes // (self.dtype.itemsize * max(len(self.support_vectors), 1)))
+        for start in range(0, len(X), block_rows):
+            predictions[start:start + block_rows] = self.kernel_block(X[start:start + block_rows]) @ self.dual_coef + self.intercept
+        return predictions
+
+
+class RandomFeatureSVR:
+    def __init__(self, pathToArtifact, dtype=np.float64, block_bytes=BLOCK_BYTES):
+        '''
+        This class predicts with a random Fourier feature approximation of an rbf SVR from fit_svr_approximation.py, the prediction of
+        a row is sqrt(2 / D) cos(x W + b) . w + intercept for the D random features
+
+        Parameters:
+        ----------
+        pathToArtifact: string
+            The .npz file with kernel 'rff'
+
+        dtype: np.float32 or np.float64
+            The precision of the products
+
+        block_bytes: int
+            The memory of the features of one block of input rows
+        '''
+        with np.load(pathToArtifact) as artifact:
+            if int(artifact['version']) != ARTIFACT_VERSION or str(artifact['kernel']) != 'rff':
+                raise ValueError(f"{pathToArtifact} is not a version {ARTIFACT_VERSION} random feature artifact")
+            self.intercept = float(artifact['intercept'])
+            self.fingerprint = str(artifact['fingerprint'])
+            projection = artifact['projection']
+            offsets = artifact['offsets']
+            weights = artifact['weights']
+
+        self.dtype = np.dtype(dtype)
+        self.block_bytes = block_bytes
+        self.projection = projection.astype(self.dtype)
+        self.offsets = offsets.astype(self.dtype)
+        # the sqrt(2 / D) scale of the features is folded into the weights
+        self.weights = (weights * np.sqrt(2 / len(weights))).astype(self.dtype)
+
+    def __repr__(self):
+        return f'RandomFeatureSVR(features={len(self.weights)}, dtype={self.dtype})'
+
+    def predict(self, X):
+        '''
+        This method predicts the rows of X, see SVREngine.predict
+        '''
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        predictions = np.empty(len(X), dtype=np.float64)
+        block_rows = max(1, self.block_bytes // (self.dtype.itemsize * max(len(self.weights), 1)))
+        for start in range(0, len(X), block_rows):
+            features = X[start:start + block_rows] @ self.projection
+            features += self.offsets
+            predictions[start:start + block_rows] = np.cos(features, out=features) @ self.weights + self.intercept
+        return predictions
+
+
+def load_svr_artifact(pathToArtifact, dtype=np.float64):
+    '''
+    This method opens an exported or approximated SVR artifact
+
+    Returns:
+    --------
+    SVREngine or RandomFeatureSVR:
+        The engine that runs the artifact
+    '''
+    with np.load(pathToArtifact) as artifact:
+        kernel = str(artifact['kernel'])
+    if kernel == 'rff':
+        return RandomFeatureSVR(pathToArtifact, dtype)
+    return SVREngine(pathToArtifact, dtype)
+
+
+def load_pickled_model(pathToModel):
+    with open(pathToModel, 'rb') as f:
+        return pickle.load(f)
+
+
+def get_svr_engine(pathToModel, pathToArtifact, dtype=np.float64):
+    '''
+    This method loads the engine of a pickled model, the artifact is exported first when it is missing or was exported from
+    another file, so sklearn is only needed the first time
+
+    Returns:
+    --------
+    SVREngine:
+        The engine of the model
+    '''
+    engine = None
+    if os.path.isfile(pathToArtifact):
+        try:
+            engine = SVREngine(pathToArtifact, dtype)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load {pathToArtifact}, exporting it again: {e}")
+    if engine is None or engine.fingerprint != get_model_fingerprint(pathToModel):
+        export_svr_model(load_pickled_model(pathToModel), pathToArtifact, pathToModel)
+        engine = SVREngine(pathToArtifact, dtype)
+    return engine
+
+
+def verify_svr_engine(model, engine, X, tolerance=1e-6):
+    '''
+    This method compares the engine to the sklearn model
+
+    Parameters:
+    ----------
+    model: sklearn.svm.SVR
+        The fitted model
+
+    engine: SVREngine
+        The engine exported from the model
+
+    X: np.ndarray((N, F))
+        The rows to compare on
+
+    tolerance: float
+        The largest absolute difference that passes
+
+    Returns:
+    --------
+    bool, float:
+        If every prediction is within tolerance, and the largest absolute difference
+    '''
+    max_difference = float(np.max(np.abs(model.predict(X) - engine.predict(X)))) if len(X) else 0.0
+    return max_difference <= tolerance, max_difference
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("This script exports a pickled sklearn SVR for svr_engine.SVREngine and checks the engine against sklearn")
+        print(f"python {sys.argv[0]} /path/to/model.pkl /path/to/artifact.npz [inputs.npy]")
+        sys.exit(0)
+
+    pathToModel, pathToArtifact = sys.argv[1], sys.argv[2]
+    model = load_pickled_model(pathToModel)
+    export_svr_model(model, pathToArtifact, pathToModel)
+    print(f"Exported {pathToModel} to {pathToArtifact}")
+
+    X = np.load(sys.argv[3]) if len(sys.argv) > 3 else np.asarray(model.support_vectors_)
+    for dtype, tolerance in [(np.float64, 1e-6), (np.float32, 1e-3)]:
+        passed, max_difference = verify_svr_engine(model, SVREngine(pathToArtifact, dtype), X, tolerance)
+        print(f"{np.dtype(dtype).name}: max difference {max_difference:.3g} on {len(X)} rows, {'pass' if passed else 'FAIL'}")